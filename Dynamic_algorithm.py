@@ -1,89 +1,63 @@
+from sumo_backend import sumo_command  # First, so that SUMO_BACKEND=libsumo can stand in for traci
 import os
 import sys
 import traci
-import sumolib
-import networkx as nx
-import numpy as np
-import pandas as pd
-import ast  # Used to convert string tuples into actual numerical tuples
+from customizable_hierarchy import load_customizable_hierarchy
+from edge_state import EdgeStateCollector
+from spatial_index import SpatialIndex
+from report_export import find_table
+from route_requests import RouteRequestCache
 
 # Load SUMO Network
-sumoBinary = sumolib.checkBinary('sumo-gui')  # Use 'sumo' for GUI mode, 'sumo' for CLI mode
 sumoConfig = "osm_adjusted.sumocfg"  # Replace with your SUMO configuration file
 
-# Start SUMO Simulation
-traci.start([sumoBinary, "-c", sumoConfig, "--tripinfo-output", "tripinfo.xml"])
+# Start SUMO Simulation (SUMO_BACKEND=sumo or libsumo for headless runs)
+traci.start(sumo_command(sumoConfig, "--tripinfo-output", "tripinfo.xml"))
 
-# Load Road Network as Graph
-net = sumolib.net.readNet("osm.net.xml")
-G = nx.DiGraph()
+# Customizable hierarchy over the cached routing graph of the SUMO network
+hierarchy = load_customizable_hierarchy("osm.net.xml")
+routing_graph = hierarchy.graph
+spatial_index = SpatialIndex(routing_graph)  # Grid over junctions and lane shapes
 
-# Populate Graph from SUMO network
-for edge in net.getEdges():
-    G.add_edge(edge.getFromNode().getID(), edge.getToNode().getID(), weight=edge.getLength())
+# Subscribe to per-edge traffic states, collected once per step
+edge_state = EdgeStateCollector(routing_graph.edge_ids.tolist())
+edge_state.subscribe()
 
-# Load Vehicle Start & Destination Data from Excel
-df = pd.read_excel("REPORT/passenger_car_report.xlsx")
+# Load Vehicle Start & Destination Data from the report (columnar, else Excel), snapped to the network once
+vehicle_routes = RouteRequestCache(spatial_index)
+vehicle_routes.load(find_table("REPORTS/passenger_car_report"), selection="longest")
 
-# Create a dictionary {Vehicle_ID: (Start_Coordinate, End_Coordinate)}
-vehicle_routes = {}
-for _, row in df.iterrows():
-    start_coord = ast.literal_eval(row["start Cordinates"])  # Convert string to tuple
-    end_coord = ast.literal_eval(row["end Cordinates"])  # Convert string to tuple
-    vehicle_routes[row["Vehicle ID"]] = (start_coord, end_coord)
+# Function to Compute Routes for all tracked vehicles in one batch
+def compute_routes(vehicle_ids):
+    # Re-weight with the current travel times, congested edges get slower instead of being checked per path
+    hierarchy.customize(edge_state.edge_costs(routing_graph))
 
-# Function to Find Nearest SUMO Network Node
-def get_nearest_node(coord):
-    min_distance = float("inf")
-    nearest_node = None
-    for node in net.getNodes():
-        x, y = node.getCoord()
-        distance = np.sqrt((coord[0] - x) ** 2 + (coord[1] - y) ** 2)
-        if distance < min_distance:
-            min_distance = distance
-            nearest_node = node.getID()
-    return nearest_node
+    requests = []
+    for veh_id in vehicle_ids:
+        current_edge = traci.vehicle.getRoadID(veh_id)
+        if current_edge and not current_edge.startswith(":"):  # Not inside a junction
+            requests.append((veh_id, current_edge, vehicle_routes.get(veh_id).end_edge))
 
-# Define Heuristic Function for A*
-def heuristic(node, goal):
-    x1, y1 = net.getNode(node).getCoord()
-    x2, y2 = net.getNode(goal).getCoord()
-    return np.sqrt((x2 - x1)**2 + (y2 - y1)**2)  # Euclidean distance heuristic
-
-# Function to Compute Routes (Switching Logic)
-def compute_route(vehicle_id, start_node, end_node):
-    edge_traffic = {edge: traci.edge.getLastStepVehicleNumber(edge) for edge in G.edges}
-
-    # Check congestion level for current edges
-    congestion_threshold = 5  # Adjust this value based on scenario
-    congested_edges = [edge for edge, count in edge_traffic.items() if count > congestion_threshold]
-
-    # Decide algorithm dynamically
-    if any(edge in congested_edges for edge in nx.shortest_path(G, start_node, end_node, weight="weight")):
-        print(f"Vehicle {vehicle_id} switching to A* due to congestion.")
-        path = nx.astar_path(G, start_node, end_node, weight="weight", heuristic=lambda u, v: heuristic(u, v))
-    else:
-        print(f"Vehicle {vehicle_id} using Dijkstra (No Congestion).")
-        path = nx.shortest_path(G, start_node, end_node, weight="weight", method="dijkstra")
-
-    return path
+    routes = hierarchy.find_routes([(current_edge, end_edge) for _, current_edge, end_edge in requests])
+    return {veh_id: route for (veh_id, _, _), route in zip(requests, routes) if route}
 
 # Main Simulation Loop
+reroute_interval = 10  # Steps between batched reroutes
 step = 0
 while traci.simulation.getMinExpectedNumber() > 0:
     traci.simulationStep()
-
-    for veh_id in traci.vehicle.getIDList():
-        if veh_id in vehicle_routes:
-            start_coord, end_coord = vehicle_routes[veh_id]
-
-            # Convert coordinates to nearest SUMO node
-            start_edge = get_nearest_node(start_coord)
-            end_edge = get_nearest_node(end_coord)
-
-            new_route = compute_route(veh_id, start_edge, end_edge)
+    edge_state.collect()
+    vehicle_routes.invalidate(traci.simulation.getArrivedIDList())
+
+    if step % reroute_interval == 0:
+        # Destinations were resolved when the report was loaded
+        tracked = [veh_id for veh_id in traci.vehicle.getIDList() if veh_id in vehicle_routes]
+        new_routes = compute_routes(tracked)
+        for veh_id, new_route in new_routes.items():
             traci.vehicle.setRoute(veh_id, new_route)
+        print(f"Step {step}: rerouted {len(new_routes)} of {len(tracked)} tracked vehicles.")
 
     step += 1
 
 traci.close()
+edge_state.report()
@@ -0,0 +1,84 @@
+import os
+import subprocess
+import sys
+import time
+
+from sumo_backend import BACKENDS, BACKEND_VARIABLE, GUI_BATCH_OPTIONS, sumo_command, use_backend
+
+# Parameters
+sumo_config = sys.argv[1] if len(sys.argv) > 1 else "osm_adjusted.sumocfg"
+num_steps = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+backends = sys.argv[3].split(",") if len(sys.argv) > 3 else list(BACKENDS)
+modes = ["step", "telemetry"]  # Bare simulationStep(), then with the fleet subscriptions read every step
+
+
+def measure(backend, mode):
+    """
+    Run num_steps steps with one backend in this process.
+    Returns:
+        tuple: (seconds to start SUMO, steps run, seconds spent stepping).
+    """
+    use_backend(backend)
+    import traci
+    from fleet_telemetry import FleetTelemetry
+
+    options = ["--no-step-log"] + (GUI_BATCH_OPTIONS if backend == "sumo-gui" else [])
+    start = time.perf_counter()
+    traci.start(sumo_command(sumo_config, *options, backend=backend))
+    started = time.perf_counter()
+    telemetry = FleetTelemetry() if mode == "telemetry" else None
+    if telemetry is not None:
+        telemetry.subscribe()
+    steps = 0
+    try:
+        for _ in range(num_steps):
+            traci.simulationStep()
+            if telemetry is not None:
+                telemetry.update()
+            steps += 1
+            if traci.simulation.getMinExpectedNumber() == 0:
+                break
+    finally:
+        stepped = time.perf_counter()
+        traci.close()
+    return started - start, steps, stepped - started
+
+
+def run_child(backend, mode):
+    """
+    Measure one backend in a fresh interpreter, since traci can only become libsumo at import.
+    Returns:
+        tuple: measure()'s result, or None with the error when the backend could not run.
+    """
+    env = dict(os.environ)
+    env.pop(BACKEND_VARIABLE, None)
+    env.pop("LIBSUMO_AS_TRACI", None)
+    result = subprocess.run([sys.executable, __file__, sumo_config, str(num_steps), backend, mode],
+                            capture_output=True, text=True, env=env)
+    lines = result.stdout.strip().splitlines()
+    if result.returncode != 0 or not lines:
+        error = (result.stderr.strip().splitlines() or [f"exit code {result.returncode}"])[-1]
+        return None, error
+    start_time, steps, elapsed = lines[-1].split()
+    return (float(start_time), int(steps), float(elapsed)), None
+
+
+# Main Execution
+if __name__ == "__main__":
+    if len(sys.argv) > 4:
+        # Child process: one backend and mode, result on the last line of stdout
+        print(*measure(sys.argv[3], sys.argv[4]))
+        sys.exit(0)
+
+    print(f"Stepping {sumo_config} for up to {num_steps} steps per backend")
+    print(f"{'Backend':<12}{'Mode':<12}{'Start (s)':<12}{'Steps':<10}{'Steps/s':<12}{'ms/step':<10}")
+    for backend in backends:
+        for mode in modes:
+            result, error = run_child(backend, mode)
+            if result is None:
+                print(f"{backend:<12}{mode:<12}unavailable: {error}")
+                continue
+            start_time, steps, elapsed = result
+            rate = steps / elapsed if elapsed > 0 else float("inf")
+            print(f"{backend:<12}{mode:<12}{start_time:<12.2f}{steps:<10}{rate:<12.1f}"
+                  f"{elapsed / max(steps, 1) * 1000:<10.2f}")
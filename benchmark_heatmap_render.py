@@ -0,0 +1,89 @@
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from heatmap_grid import DEFAULT_BINS, HeatmapGrid
+from heatmap_render import HeatmapFigure, colormap_lut, grid_to_rgba, render_frames, write_png
+
+# Parameters
+frames = int(sys.argv[1]) if len(sys.argv) > 1 else 60  # Heatmaps drawn by every method
+workers = int(sys.argv[2]) if len(sys.argv) > 2 else None  # Processes of the parallel frames
+extent = (0.0, 5000.0, 0.0, 4000.0)
+cmap = "YlOrRd"
+
+
+def synthetic_frames(count, bins=DEFAULT_BINS, seed=0):
+    """
+    Heatmap grids of a traffic peak moving across the extent, one per frame.
+    """
+    rng = np.random.default_rng(seed)
+    grids = []
+    for k in range(count):
+        centre = (1000 + 3000 * k / max(count - 1, 1), 2000)
+        grid = HeatmapGrid(extent, bins)
+        grid.add(rng.normal(centre, (800, 600), size=(20_000, 2)))
+        grids.append(grid)
+    return grids
+
+
+def pyplot_per_figure(grids, out_dir):
+    # What the reports did: a new pyplot figure, axes and colour bar per heatmap
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    for k, grid in enumerate(grids):
+        plt.figure(figsize=(10, 8))
+        image = grid.draw(plt.gca(), cmap=cmap)
+        plt.colorbar(image, label="Vehicle samples")
+        plt.title(f"Frame {k}")
+        plt.xlabel("X-coordinate")
+        plt.ylabel("Y-coordinate")
+        plt.grid(True)
+        plt.savefig(os.path.join(out_dir, f"pyplot_{k:04d}.png"))
+        plt.close()
+
+
+def reused_figure(grids, out_dir):
+    figure = HeatmapFigure(cmap=cmap)
+    for k, grid in enumerate(grids):
+        figure.render(grid, f"Frame {k}", os.path.join(out_dir, f"figure_{k:04d}.png"))
+
+
+def arrays_to_png(grids, out_dir):
+    lut = colormap_lut(cmap)
+    for k, grid in enumerate(grids):
+        write_png(os.path.join(out_dir, f"array_{k:04d}.png"), grid_to_rgba(grid.values(), lut, scale=8))
+
+
+def parallel_frames(grids, out_dir):
+    stack = np.stack([grid.values() for grid in grids])
+    render_frames(stack, [os.path.join(out_dir, f"parallel_{k:04d}.png") for k in range(len(grids))], workers,
+                  cmap=cmap)
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+
+# Main Execution
+if __name__ == "__main__":
+    grids = synthetic_frames(frames)
+    methods = [("pyplot figure per heatmap", pyplot_per_figure), ("reused HeatmapFigure", reused_figure),
+               ("array + PNG writer", arrays_to_png), (f"array + PNG, {workers or os.cpu_count()} processes",
+                                                       parallel_frames)]
+    print(f"Rendering {frames} heatmaps of {DEFAULT_BINS[0]}x{DEFAULT_BINS[1]} bins")
+    print(f"{'Method':<36}{'Time (s)':<12}{'Frames/s':<12}")
+    with tempfile.TemporaryDirectory() as out_dir:
+        for name, method in methods:
+            try:
+                seconds = timed(method, grids, out_dir)
+            except ImportError:
+                print(f"{name:<36}{'skipped, needs matplotlib':<24}")
+                continue
+            print(f"{name:<36}{seconds:<12.3f}{frames / seconds:<12.1f}")
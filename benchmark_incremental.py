@@ -0,0 +1,89 @@
+import random
+import sys
+import time
+
+from dynamic_routes import DynamicRouter
+from routing_graph import load_routing_graph
+
+# Parameters
+net_file = sys.argv[1] if len(sys.argv) > 1 else "osm.net.xml"
+num_vehicles = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+num_intervals = int(sys.argv[3]) if len(sys.argv) > 3 else 30
+edges_per_interval = 2  # How far each vehicle moves along its route between reroutes
+congestion_share = 0.01  # Share of edges congested at any time
+congestion_churn = 0.2  # Share of the congested set replaced every interval
+seed = 42
+
+
+def make_vehicles(router, rng):
+    """
+    Random (source, target) edge pairs that are connected on the free-flow graph.
+    """
+    edge_ids = router.graph.edge_ids.tolist()
+    vehicles = []
+    while len(vehicles) < num_vehicles:
+        source, target = rng.choice(edge_ids), rng.choice(edge_ids)
+        if source != target and router.engine.find_route(source, target):
+            vehicles.append((source, target))
+    return vehicles
+
+
+def congestion_sequence(edge_ids, rng):
+    """
+    One congested edge set per interval, changing gradually like monitor_congestion().
+    """
+    size = max(1, int(len(edge_ids) * congestion_share))
+    congested = set(rng.sample(edge_ids, size))
+    sequence = []
+    for _ in range(num_intervals):
+        sequence.append(frozenset(congested))
+        for edge in rng.sample(sorted(congested), max(1, int(size * congestion_churn))):
+            congested.discard(edge)
+            congested.add(rng.choice(edge_ids))
+    return sequence
+
+
+def run(router, vehicles, sequence, incremental):
+    """
+    Reroute every vehicle once per interval while it drives along its route.
+    Returns:
+        tuple: (seconds spent routing, number of reroutes, total route cost).
+    """
+    engine = router.engine
+    positions = [source for source, _ in vehicles]
+    elapsed, reroutes, total_cost = 0.0, 0, 0.0
+    for congested in sequence:
+        for n, (_, target) in enumerate(vehicles):
+            current = positions[n]
+            if current == target:
+                continue
+            start = time.perf_counter()
+            if incremental:
+                route = router.route(n, current, target, congested)
+            else:
+                source, target_index = engine.edge_index(current), engine.edge_index(target)
+                overlay = router._overlay(congested, source, target_index)
+                _, path = engine.shortest_path(source, target_index, "astar", edge_costs=overlay)
+                route = [engine._edge_ids[i] for i in path]
+            elapsed += time.perf_counter() - start
+            reroutes += 1
+            if route:
+                total_cost += engine.route_cost([engine.edge_index(edge) for edge in route])
+                positions[n] = route[min(edges_per_interval, len(route) - 1)]
+    return elapsed, reroutes, total_cost
+
+
+# Main Execution
+if __name__ == "__main__":
+    graph = load_routing_graph(net_file)
+    rng = random.Random(seed)
+    router = DynamicRouter(graph)
+    vehicles = make_vehicles(router, rng)
+    sequence = congestion_sequence(graph.edge_ids.tolist(), rng)
+
+    print(f"{num_vehicles} vehicles x {num_intervals} reroute intervals on {net_file} ({graph.num_edges} edges)")
+    print(f"{'Method':<22}{'ms/reroute':<15}{'Reroutes/s':<15}{'Total cost (s)':<15}")
+    for name, incremental in (("full A* recompute", False), ("D* Lite repair", True)):
+        elapsed, reroutes, total_cost = run(router, vehicles, sequence, incremental)
+        print(f"{name:<22}{elapsed / reroutes * 1000:<15.3f}{reroutes / elapsed:<15.1f}{total_cost:<15.1f}")
+    print(f"D* Lite expansions: {router.expansions} over {router.searches} searches")
@@ -0,0 +1,75 @@
+import os
+import random
+import sys
+import time
+
+from customizable_hierarchy import load_customizable_hierarchy
+from reroute_pool import ReroutePool
+
+# Parameters
+net_file = sys.argv[1] if len(sys.argv) > 1 else "osm.net.xml"
+workers = int(sys.argv[2]) if len(sys.argv) > 2 else None
+fleet_sizes = [5, 50, 500, 5000]
+num_destinations = 50  # Distinct destinations in the rerouted fleet
+step_length = 0.01  # Seconds one simulation step takes in this benchmark
+seed = 42
+
+
+def make_requests(edge_ids, size, rng):
+    """
+    (vehicle ID, current edge, target edge) triples for a fleet heading to a few destinations.
+    """
+    destinations = rng.sample(edge_ids, min(num_destinations, len(edge_ids)))
+    return [(f"veh{i}", rng.choice(edge_ids), rng.choice(destinations)) for i in range(size)]
+
+
+def run_serial(hierarchy, requests):
+    """
+    Route every vehicle inside the step loop, as the scripts did before.
+    Returns:
+        float: Seconds the step loop is stalled.
+    """
+    start = time.perf_counter()
+    for _, source, target in requests:
+        hierarchy.find_route(source, target)
+    return time.perf_counter() - start
+
+
+def run_pool(pool, requests):
+    """
+    Submit the fleet and keep stepping until all routes are back.
+    Returns:
+        tuple: (seconds the step loop is stalled, steps until the last route arrived).
+    """
+    stalled = 0.0
+    start = time.perf_counter()
+    pool.submit(requests)
+    stalled += time.perf_counter() - start
+    routes, steps = {}, 0
+    while len(routes) < len(requests):
+        time.sleep(step_length)  # The simulation step running in SUMO
+        steps += 1
+        start = time.perf_counter()
+        routes.update(pool.collect())
+        stalled += time.perf_counter() - start
+    return stalled, steps
+
+
+# Main Execution
+if __name__ == "__main__":
+    hierarchy = load_customizable_hierarchy(net_file)
+    edge_ids = hierarchy.graph.edge_ids.tolist()
+    rng = random.Random(seed)
+
+    with ReroutePool(hierarchy, workers=workers) as pool:
+        print(f"Rerouting on {net_file} ({len(edge_ids)} edges) with {pool.workers} worker processes "
+              f"on {os.cpu_count()} CPU cores")
+        if (os.cpu_count() or 1) <= pool.workers:
+            print("Workers share the cores with the step loop: the stall shows what the loop waits for, "
+                  "the steps until applied do not show parallel speed-up")
+        print(f"{'Vehicles':<10}{'Serial stall (ms)':<20}{'Pool stall (ms)':<18}{'Steps until applied':<20}")
+        for size in fleet_sizes:
+            requests = make_requests(edge_ids, size, rng)
+            serial = run_serial(hierarchy, requests)
+            stalled, steps = run_pool(pool, requests)
+            print(f"{size:<10}{serial * 1000:<20.2f}{stalled * 1000:<18.2f}{steps:<20}")
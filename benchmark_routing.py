@@ -0,0 +1,95 @@
+import random
+import sys
+import time
+
+import networkx as nx
+
+from contraction_hierarchy import ContractionHierarchy
+from customizable_hierarchy import CustomizableHierarchy
+from routing_graph import load_routing_graph
+from route_engine import RouteEngine
+
+# Parameters
+net_file = sys.argv[1] if len(sys.argv) > 1 else "osm.net.xml"
+num_queries = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+seed = 42
+greedy_step_limit = 10000  # Safety cap, the greedy walk can loop forever
+
+
+def greedy_route(adjacency, source, target):
+    """
+    The neighbour walk previously used by 5_cars_dynamic_v1.reroute_vehicle.
+    """
+    path = [source]
+    while path[-1] != target and len(path) < greedy_step_limit:
+        neighbors = adjacency[path[-1]]
+        if not neighbors:
+            break
+        path.append(min(neighbors, key=neighbors.get))
+    return path if path[-1] == target else []
+
+
+def run_benchmark(name, route, queries, engine, batch=False):
+    """
+    Time one routing method over all queries.
+    Args:
+        name (str): Label printed in the results table.
+        route (callable): Function (source_id, target_id) -> list of edge IDs, or
+            with batch set, function (list of queries) -> list of routes.
+        queries (list): (source_id, target_id) pairs.
+        engine (RouteEngine): Used to evaluate the cost of the returned paths.
+        batch (bool): Submit all queries in one call.
+    """
+    found = 0
+    total_cost = 0.0
+    start = time.perf_counter()
+    paths = route(queries) if batch else [route(source, target) for source, target in queries]
+    elapsed = time.perf_counter() - start
+    for path in paths:
+        if path:
+            found += 1
+            total_cost += engine.route_cost([engine.edge_index(edge) for edge in path])
+    avg_cost = total_cost / found if found else 0
+    print(f"{name:<20}{elapsed / len(queries) * 1000:<15.3f}{found:<10}{avg_cost:<15.1f}")
+
+
+# Main Execution
+if __name__ == "__main__":
+    graph = load_routing_graph(net_file)
+    engine = RouteEngine(graph)
+    adjacency = graph.to_adjacency()
+    G = graph.to_networkx()
+    start = time.perf_counter()
+    hierarchy = ContractionHierarchy.from_routing_graph(graph)
+    print(f"Contraction hierarchy: {hierarchy.num_shortcuts} shortcuts in {time.perf_counter() - start:.1f} s")
+    start = time.perf_counter()
+    customizable = CustomizableHierarchy.build(graph)
+    print(f"Customizable hierarchy: {customizable.num_arcs} arcs in {time.perf_counter() - start:.1f} s")
+
+    rng = random.Random(seed)
+    edge_ids = graph.edge_ids.tolist()
+    queries = [(rng.choice(edge_ids), rng.choice(edge_ids)) for _ in range(num_queries)]
+    # Fleet-like batch: many vehicles heading to a few destinations
+    destinations = rng.sample(edge_ids, min(10, len(edge_ids)))
+    fleet_queries = [(source, rng.choice(destinations)) for source, _ in queries]
+
+    def nx_route(source, target):
+        try:
+            return nx.shortest_path(G, source=source, target=target, weight="weight")
+        except nx.NetworkXNoPath:
+            return []
+
+    print(f"{num_queries} random queries on {net_file} ({graph.num_edges} edges, {graph.num_arcs} connections)")
+    print(f"{'Method':<20}{'ms/query':<15}{'Found':<10}{'Avg cost (s)':<15}")
+    run_benchmark("greedy walk", lambda s, t: greedy_route(adjacency, s, t), queries, engine)
+    run_benchmark("nx.shortest_path", nx_route, queries, engine)
+    run_benchmark("dijkstra", lambda s, t: engine.find_route(s, t, "dijkstra"), queries, engine)
+    run_benchmark("astar", lambda s, t: engine.find_route(s, t, "astar"), queries, engine)
+    run_benchmark("contraction hier.", hierarchy.find_route, queries, engine)
+    run_benchmark("customizable hier.", customizable.find_route, queries, engine)
+    run_benchmark("cch batch", customizable.find_routes, queries, engine, batch=True)
+
+    print(f"{num_queries} vehicles to {len(destinations)} destinations")
+    print(f"{'Method':<20}{'ms/query':<15}{'Found':<10}{'Avg cost (s)':<15}")
+    run_benchmark("customizable hier.", customizable.find_route, fleet_queries, engine)
+    run_benchmark("cch batch", customizable.find_routes, fleet_queries, engine, batch=True)
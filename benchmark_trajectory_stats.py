@@ -0,0 +1,75 @@
+import sys
+import time
+import xml.etree.ElementTree as ET
+
+import numpy as np
+
+from fcd_reader import aggregate_fcd
+from trajectory_store import TrajectoryStore, store_path_for
+from trajectory_stats import aggregate_store
+
+# Parameters
+fcd_file = sys.argv[1] if len(sys.argv) > 1 else "baseline_trajectory.xml"
+vehicle_prefix = "veh"
+repeats = 5  # Timed repetitions of the vectorized aggregation
+
+
+def legacy_process_trajectory(file):
+    """
+    The per-record loop choosing_5_vehicles_for_simulation.py used: whole tree in memory,
+    a dict per vehicle and distance as the sum of speeds.
+    """
+    root = ET.parse(file).getroot()
+    vehicle_positions = {}
+    for timestep in root.findall("timestep"):
+        time_ = float(timestep.attrib["time"])
+        for vehicle in timestep.findall("vehicle"):
+            veh_id = vehicle.attrib["id"]
+            if veh_id.startswith(vehicle_prefix):
+                x, y = float(vehicle.attrib["x"]), float(vehicle.attrib["y"])
+                speed = float(vehicle.attrib["speed"])
+                if veh_id not in vehicle_positions:
+                    vehicle_positions[veh_id] = {"start_coord": (x, y), "end_coord": (x, y), "start_time": time_,
+                                                 "end_time": time_, "distance_traveled": 0.0}
+                else:
+                    veh = vehicle_positions[veh_id]
+                    veh["end_coord"] = (x, y)
+                    veh["end_time"] = time_
+                    veh["distance_traveled"] += speed
+    return vehicle_positions
+
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+# Main Execution
+if __name__ == "__main__":
+    legacy, legacy_time = timed(legacy_process_trajectory, fcd_file)
+    streamed, stream_time = timed(aggregate_fcd, fcd_file, vehicle_prefix)
+    store, convert_time = timed(TrajectoryStore.convert, fcd_file, store_path_for(fcd_file))
+    _, open_time = timed(TrajectoryStore.open, store.store_dir)
+    # Sum of speeds, as the loop, to compare the results
+    frame = aggregate_store(store, vehicle_prefix, step_length=1.0)
+    vectorized_time = min(timed(aggregate_store, store, vehicle_prefix)[1] for _ in range(repeats))
+    coords_time = min(timed(aggregate_store, store, vehicle_prefix, distance="coords")[1] for _ in range(repeats))
+
+    print(f"Per-vehicle aggregation of {fcd_file}: {len(store)} records, {len(frame)} '{vehicle_prefix}' vehicles")
+    print(f"{'Method':<36}{'Time (s)':<12}")
+    print(f"{'process_trajectory loop (ET.parse)':<36}{legacy_time:<12.3f}")
+    print(f"{'streaming aggregate_fcd':<36}{stream_time:<12.3f}")
+    print(f"{'store conversion (once)':<36}{convert_time:<12.3f}")
+    print(f"{'store open (memory-map)':<36}{open_time:<12.3f}")
+    print(f"{'vectorized, distance from speed':<36}{vectorized_time:<12.3f}")
+    print(f"{'vectorized, distance from coords':<36}{coords_time:<12.3f}")
+    print(f"Vectorized speed-up over the loop: {legacy_time / vectorized_time:.0f}x "
+          f"(streaming pass only: {stream_time / vectorized_time:.0f}x)")
+
+    ids = sorted(legacy)
+    distance_error = np.abs(frame.loc[ids, "distance_traveled"].to_numpy()
+                            - np.array([legacy[veh_id]["distance_traveled"] for veh_id in ids]))
+    same_vehicles = set(legacy) == set(frame.index) == set(streamed)
+    print(f"Same vehicles: {same_vehicles}, max distance difference: {distance_error.max(initial=0):.4f} m "
+          f"(float32 speeds in the store)")
@@ -1,4 +1,5 @@
-import xml.etree.ElementTree as ET
+from trajectory_store import load_trajectory_store
+from trajectory_stats import aggregate_store
 
 # File path
 trajectory_file = "baseline_trajectory.xml"
@@ -12,49 +13,19 @@ vehicle_data = []
 
 def process_trajectory(file):
     """
-    Process the trajectory file to extract data for passenger cars.
+    Process the trajectory file (plain or gzip-compressed) to extract data for passenger cars.
+    The XML is converted once into a columnar store next to it; the statistics of all
+    vehicles are then computed at once from the memory-mapped columns.
     """
-    tree = ET.parse(file)
-    root = tree.getroot()
-    
-    vehicle_positions = {}
-
-    # Parse each timestep
-    for timestep in root.findall("timestep"):
-        time = float(timestep.attrib["time"])
-        for vehicle in timestep.findall("vehicle"):
-            veh_id = vehicle.attrib["id"]
-            if veh_id.startswith(vehicle_prefix):
-                x, y = float(vehicle.attrib["x"]), float(vehicle.attrib["y"])
-                speed = float(vehicle.attrib["speed"])
-                if veh_id not in vehicle_positions:
-                    vehicle_positions[veh_id] = {
-                        "start_coord": (x, y),
-                        "end_coord": (x, y),
-                        "start_time": time,
-                        "end_time": time,
-                        "distance_traveled": 0.0
-                    }
-                else:
-                    # Update vehicle data
-                    veh = vehicle_positions[veh_id]
-                    veh["end_coord"] = (x, y)
-                    veh["end_time"] = time
-                    veh["distance_traveled"] += speed
-
-    # Finalize vehicle data
-    for veh_id, data in vehicle_positions.items():
-        travel_time = data["end_time"] - data["start_time"]
-        avg_speed = data["distance_traveled"] / travel_time if travel_time > 0 else 0
-        data["travel_time"] = travel_time
-        data["average_speed"] = avg_speed
+    stats = aggregate_store(load_trajectory_store(file), vehicle_prefix)
+    for veh in stats.itertuples():
         vehicle_data.append({
-            "id": veh_id,
-            "distance_traveled": data["distance_traveled"],
-            "travel_time": travel_time,
-            "average_speed": avg_speed,
-            "start_coord": data["start_coord"],
-            "end_coord": data["end_coord"]
+            "id": veh.Index,
+            "distance_traveled": veh.distance_traveled,
+            "travel_time": veh.travel_time,
+            "average_speed": veh.average_speed,
+            "start_coord": (round(veh.start_x, 2), round(veh.start_y, 2)),  # FCD precision, stored as float32
+            "end_coord": (round(veh.end_x, 2), round(veh.end_y, 2))
         })
 
 # Process trajectory file
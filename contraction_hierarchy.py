@@ -0,0 +1,314 @@
+import heapq
+import math
+import os
+import time
+
+import numpy as np
+
+from routing_graph import file_digest, load_routing_graph
+
+# Bump when the layout of the saved arrays changes
+CH_CACHE_VERSION = 1
+CH_ARRAYS = ("edge_ids", "rank", "up_offsets", "up_targets", "up_weights", "up_middle",
+             "down_offsets", "down_sources", "down_weights", "down_middle")
+
+# Vertices settled per witness search before giving up and keeping the shortcut
+WITNESS_SETTLE_LIMIT = 60
+
+
+def ch_cache_path_for(net_file, digest):
+    """
+    Returns the contraction hierarchy cache file for a network with the given digest.
+    """
+    return f"{net_file}.{digest[:16]}.ch.npz"
+
+
+class ContractionHierarchy:
+    """
+    Contraction hierarchy over the edge-based RoutingGraph with free-flow weights.
+
+    Vertices (SUMO edges) are contracted one by one in order of importance,
+    adding shortcut arcs where a vertex was the only shortest path between
+    two neighbours. Every arc then points either up or down the order, and a
+    point-to-point query only searches upwards from both ends, which settles
+    a few hundred vertices instead of a large part of the network.
+
+    Arcs are kept in two CSR blocks: up arcs v -> w with rank[w] > rank[v],
+    indexed by v, and down arcs u -> v with rank[u] > rank[v], indexed by v
+    for the backward search. A shortcut records the vertex it bypasses in
+    its middle entry (-1 for original connections), used to unpack paths.
+    """
+
+    def __init__(self, edge_ids, rank, up_offsets, up_targets, up_weights, up_middle,
+                 down_offsets, down_sources, down_weights, down_middle):
+        self.edge_ids = edge_ids
+        self.rank = rank
+        self.up_offsets = up_offsets
+        self.up_targets = up_targets
+        self.up_weights = up_weights
+        self.up_middle = up_middle
+        self.down_offsets = down_offsets
+        self.down_sources = down_sources
+        self.down_weights = down_weights
+        self.down_middle = down_middle
+        self._edge_index = {edge_id: i for i, edge_id in enumerate(edge_ids.tolist())}
+        self._edge_ids = edge_ids.tolist()
+        self._rank = rank.tolist()
+        self._up = (up_offsets.tolist(), up_targets.tolist(), up_weights.tolist(), up_middle.tolist())
+        self._down = (down_offsets.tolist(), down_sources.tolist(), down_weights.tolist(), down_middle.tolist())
+
+    @property
+    def num_shortcuts(self):
+        return int((self.up_middle >= 0).sum() + (self.down_middle >= 0).sum())
+
+    def edge_index(self, edge_id):
+        return self._edge_index.get(edge_id)
+
+    @classmethod
+    def from_routing_graph(cls, graph, costs=None, verbose=False):
+        """
+        Contract the graph.
+        Args:
+            graph (RoutingGraph): Graph from routing_graph.load_routing_graph().
+            costs (array-like): Per-edge costs, by default the free-flow travel times.
+            verbose (bool): Print progress while contracting.
+        """
+        costs = (graph.free_flow_cost if costs is None else np.asarray(costs)).tolist()
+        n = graph.num_edges
+        out_adj = [dict() for _ in range(n)]
+        in_adj = [dict() for _ in range(n)]
+        for u, v in zip(graph.arc_source.tolist(), graph.targets.tolist()):
+            if u != v and costs[u] < math.inf:
+                out_adj[u][v] = (costs[u], -1)
+                in_adj[v][u] = (costs[u], -1)
+
+        def witness_distances(source, excluded, max_cost):
+            dist = {source: 0.0}
+            heap = [(0.0, source)]
+            settled = 0
+            while heap and settled < WITNESS_SETTLE_LIMIT:
+                d, u = heapq.heappop(heap)
+                if d > dist[u]:
+                    continue
+                if d > max_cost:
+                    break
+                settled += 1
+                for v, (w, _) in out_adj[u].items():
+                    nd = d + w
+                    if v != excluded and nd < dist.get(v, math.inf):
+                        dist[v] = nd
+                        heapq.heappush(heap, (nd, v))
+            return dist
+
+        def shortcuts(v):
+            result = []
+            outs = out_adj[v]
+            if not outs:
+                return result
+            max_out = max(w for w, _ in outs.values())
+            for u, (w1, _) in in_adj[v].items():
+                dist = witness_distances(u, v, w1 + max_out)
+                for x, (w2, _) in outs.items():
+                    if x != u and dist.get(x, math.inf) > w1 + w2:
+                        result.append((u, x, w1 + w2))
+            return result
+
+        deleted_neighbors = [0] * n
+
+        def priority(v):
+            added = shortcuts(v)
+            return len(added) - len(in_adj[v]) - len(out_adj[v]) + deleted_neighbors[v], added
+
+        heap = [(priority(v)[0], v) for v in range(n)]
+        heapq.heapify(heap)
+        rank = [0] * n
+        up = [None] * n
+        down = [None] * n
+        started = time.perf_counter()
+        order = 0
+        while heap:
+            _, v = heapq.heappop(heap)
+            value, added = priority(v)
+            if heap and value > heap[0][0]:
+                heapq.heappush(heap, (value, v))
+                continue
+
+            rank[v] = order
+            order += 1
+            up[v] = [(x, w, m) for x, (w, m) in out_adj[v].items()]
+            down[v] = [(u, w, m) for u, (w, m) in in_adj[v].items()]
+            for x in out_adj[v]:
+                del in_adj[x][v]
+                deleted_neighbors[x] += 1
+            for u in in_adj[v]:
+                del out_adj[u][v]
+                deleted_neighbors[u] += 1
+            out_adj[v] = {}
+            in_adj[v] = {}
+            for u, x, w in added:
+                if w < out_adj[u].get(x, (math.inf,))[0]:
+                    out_adj[u][x] = (w, v)
+                    in_adj[x][u] = (w, v)
+            if verbose and order % 5000 == 0:
+                print(f"Contracted {order}/{n} edges in {time.perf_counter() - started:.1f} s")
+
+        def to_csr(lists):
+            offsets = np.zeros(n + 1, dtype=np.int64)
+            np.cumsum([len(arcs) for arcs in lists], out=offsets[1:])
+            flat = [arc for arcs in lists for arc in arcs]
+            return (offsets,
+                    np.array([a[0] for a in flat], dtype=np.int32),
+                    np.array([a[1] for a in flat], dtype=np.float64),
+                    np.array([a[2] for a in flat], dtype=np.int32))
+
+        return cls(graph.edge_ids, np.array(rank, dtype=np.int32), *to_csr(up), *to_csr(down))
+
+    def save(self, cache_file):
+        """
+        Write the hierarchy to a binary .npz cache.
+        """
+        arrays = {name: getattr(self, name) for name in CH_ARRAYS}
+        np.savez(cache_file, version=np.array(CH_CACHE_VERSION), **arrays)
+
+    @classmethod
+    def load(cls, cache_file):
+        """
+        Read a hierarchy written by save().
+        """
+        with np.load(cache_file, allow_pickle=False) as data:
+            if int(data["version"]) != CH_CACHE_VERSION:
+                raise ValueError(f"Unsupported contraction hierarchy cache version in {cache_file}")
+            return cls(**{name: data[name] for name in CH_ARRAYS})
+
+    def _search(self, source, target):
+        up_offsets, up_targets, up_weights, _ = self._up
+        down_offsets, down_sources, down_weights, _ = self._down
+        dist_f, dist_b = {source: 0.0}, {target: 0.0}
+        parent_f, parent_b = {source: -1}, {target: -1}
+        heap_f, heap_b = [(0.0, source)], [(0.0, target)]
+        best, meet = math.inf, -1
+        while (heap_f and heap_f[0][0] < best) or (heap_b and heap_b[0][0] < best):
+            if heap_f and heap_f[0][0] < best:
+                d, u = heapq.heappop(heap_f)
+                if d <= dist_f[u]:
+                    if d + dist_b.get(u, math.inf) < best:
+                        best, meet = d + dist_b[u], u
+                    # Stall-on-demand: skip u if a higher vertex reaches it more cheaply
+                    stalled = any(dist_f.get(down_sources[k], math.inf) + down_weights[k] < d
+                                  for k in range(down_offsets[u], down_offsets[u + 1]))
+                    if not stalled:
+                        for k in range(up_offsets[u], up_offsets[u + 1]):
+                            v, nd = up_targets[k], d + up_weights[k]
+                            if nd < dist_f.get(v, math.inf):
+                                dist_f[v] = nd
+                                parent_f[v] = u
+                                heapq.heappush(heap_f, (nd, v))
+            if heap_b and heap_b[0][0] < best:
+                d, u = heapq.heappop(heap_b)
+                if d <= dist_b[u]:
+                    if d + dist_f.get(u, math.inf) < best:
+                        best, meet = d + dist_f[u], u
+                    stalled = any(dist_b.get(up_targets[k], math.inf) + up_weights[k] < d
+                                  for k in range(up_offsets[u], up_offsets[u + 1]))
+                    if not stalled:
+                        for k in range(down_offsets[u], down_offsets[u + 1]):
+                            v, nd = down_sources[k], d + down_weights[k]
+                            if nd < dist_b.get(v, math.inf):
+                                dist_b[v] = nd
+                                parent_b[v] = u
+                                heapq.heappush(heap_b, (nd, v))
+        return best, meet, parent_f, parent_b
+
+    def _middle(self, a, b):
+        if self._rank[a] < self._rank[b]:
+            offsets, others, _, middles = self._up
+            vertex, other = a, b
+        else:
+            offsets, others, _, middles = self._down
+            vertex, other = b, a
+        for k in range(offsets[vertex], offsets[vertex + 1]):
+            if others[k] == other:
+                return middles[k]
+        raise KeyError(f"No arc between edges {a} and {b} in the hierarchy")
+
+    def _unpack(self, vertices):
+        path = [vertices[0]]
+        stack = [(a, b) for a, b in zip(vertices[-2::-1], vertices[:0:-1])]
+        while stack:
+            a, b = stack.pop()
+            m = self._middle(a, b)
+            if m < 0:
+                path.append(b)
+            else:
+                stack.append((m, b))
+                stack.append((a, m))
+        return path
+
+    def shortest_path(self, source, target):
+        """
+        Shortest path between two edge indices with a bidirectional upward search.
+        Returns:
+            tuple: (cost, list of edge indices from source to target); (inf, []) when unreachable.
+        """
+        cost, meet, parent_f, parent_b = self._search(source, target)
+        if meet < 0:
+            return math.inf, []
+        vertices = [meet]
+        while parent_f[vertices[-1]] != -1:
+            vertices.append(parent_f[vertices[-1]])
+        vertices.reverse()
+        while parent_b[vertices[-1]] != -1:
+            vertices.append(parent_b[vertices[-1]])
+        return cost, self._unpack(vertices)
+
+    def find_route(self, source_edge, target_edge):
+        """
+        Route between two SUMO edge IDs as a list of edge IDs for traci.vehicle.setRoute.
+        Returns an empty list when either edge is unknown or the target is unreachable.
+        """
+        source = self.edge_index(source_edge)
+        target = self.edge_index(target_edge)
+        if source is None or target is None:
+            return []
+        _, path = self.shortest_path(source, target)
+        return [self._edge_ids[i] for i in path]
+
+
+def load_contraction_hierarchy(net_file="osm.net.xml", use_cache=True):
+    """
+    Load the contraction hierarchy of a network, contracting it only when no
+    cache matching the current file contents exists.
+    Args:
+        net_file (str): Path to the .net.xml file.
+        use_cache (bool): Read and write the binary cache next to the network.
+    Returns:
+        ContractionHierarchy: Hierarchy over free-flow travel times.
+    """
+    if not use_cache:
+        return ContractionHierarchy.from_routing_graph(load_routing_graph(net_file, use_cache=False))
+
+    cache_file = ch_cache_path_for(net_file, file_digest(net_file))
+    if os.path.exists(cache_file):
+        try:
+            return ContractionHierarchy.load(cache_file)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Ignoring unreadable contraction hierarchy cache {cache_file}: {e}")
+
+    hierarchy = ContractionHierarchy.from_routing_graph(load_routing_graph(net_file), verbose=True)
+    try:
+        hierarchy.save(cache_file)
+    except OSError as e:
+        print(f"Could not write contraction hierarchy cache {cache_file}: {e}")
+    return hierarchy
+
+
+# Main Execution
+if __name__ == "__main__":
+    import sys
+
+    net_file = sys.argv[1] if len(sys.argv) > 1 else "osm.net.xml"
+    start = time.perf_counter()
+    hierarchy = load_contraction_hierarchy(net_file)
+    print(f"Contraction hierarchy for {net_file}: {len(hierarchy.edge_ids)} edges, "
+          f"{hierarchy.num_shortcuts} shortcuts ({time.perf_counter() - start:.1f} s).")
+    print(f"Cache: {ch_cache_path_for(net_file, file_digest(net_file))}")
@@ -1,10 +1,12 @@
+from sumo_backend import sumo_command  # First, so that SUMO_BACKEND=libsumo can stand in for traci
 import traci
 import random
-import networkx as nx
 import matplotlib.pyplot as plt
+from contraction_hierarchy import load_contraction_hierarchy
 
 # Parameters
-sumo_cmd = ["sumo-gui", "-c", "osm_adjusted.sumocfg"]
+sumo_cmd = sumo_command("osm_adjusted.sumocfg")
+net_file = "osm.net.xml"
 max_steps = 2000
 custom_vehicles = [
     {"id": "veh_10001", "start": "7620.24", "end": "1254.76"},
@@ -13,7 +15,6 @@ custom_vehicles = [
     {"id": "veh_10004", "start": "8332.86", "end": "1730.73"},
     {"id": "veh_10005", "start": "1730.73", "end": "(8332.86"},
 ]
-graph_update_interval = 10  # Steps between graph updates
 reroute_interval = 10  # Steps between reroutes
 
 # Data Tracking
@@ -21,22 +22,10 @@ custom_vehicle_data = {}
 
 def create_graph():
     """
-    Create a graph from the SUMO network using edges and their connections.
+    Load the contraction hierarchy of the network (free-flow travel times),
+    built offline once and cached next to the network file.
     """
-    G = nx.DiGraph()
-    for edge_id in traci.edge.getIDList():
-        # Get all lanes associated with the edge
-        lane_ids = traci.edge.getLanes(edge_id)  # Fetch lane objects from the edge
-        for lane in lane_ids:
-            connections = traci.lane.getLinks(lane.getID())  # Get outgoing connections for each lane
-            for conn in connections:
-                target_lane = conn[0]
-                target_edge = traci.lane.getEdgeID(target_lane)
-                length = lane.getLength()
-                speed = lane.getMaxSpeed()
-                weight = length / speed if speed > 0 else float("inf")
-                G.add_edge(edge_id, target_edge, weight=weight, length=length)
-    return G
+    return load_contraction_hierarchy(net_file)
 
 def reroute_vehicle(veh_id, G):
     """
@@ -46,11 +35,12 @@ def reroute_vehicle(veh_id, G):
         current_edge = traci.vehicle.getRoadID(veh_id)
         destination = next(veh["end"] for veh in custom_vehicles if veh["id"] == veh_id)
         if current_edge and destination:
-            shortest_path = nx.shortest_path(G, source=current_edge, target=destination, weight="weight")
+            shortest_path = G.find_route(current_edge, destination)
+            if not shortest_path:
+                print(f"No path found for vehicle {veh_id} from {current_edge} to {destination}.")
+                return
             traci.vehicle.setRoute(veh_id, shortest_path)
             print(f"Vehicle {veh_id} dynamically rerouted.")
-    except nx.NetworkXNoPath:
-        print(f"No path found for vehicle {veh_id} from {current_edge} to {destination}.")
     except Exception as e:
         print(f"Error rerouting vehicle {veh_id}: {e}")
 
@@ -98,10 +88,7 @@ def run_simulation():
         traci.simulationStep()
         track_vehicle_data(step)
 
-        # Update graph and reroute vehicles periodically
-        if step % graph_update_interval == 0:
-            graph = create_graph()
-
+        # Reroute vehicles periodically
         if step % reroute_interval == 0:
             for veh in custom_vehicles:
                 if veh["id"] in traci.vehicle.getIDList():
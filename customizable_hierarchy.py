@@ -0,0 +1,551 @@
+import bisect
+import math
+import os
+import time
+
+import numpy as np
+
+from routing_graph import file_digest, load_routing_graph
+
+# Bump when the layout of the saved arrays changes
+CCH_CACHE_VERSION = 1
+CCH_ARRAYS = ("rank", "up_offsets", "up_heads", "has_up", "has_down",
+              "triangle_arc", "triangle_low", "triangle_high", "level_offsets")
+
+# Arrays derived from the topology that queries read, see CustomizableHierarchy.query_arrays()
+QUERY_ARRAYS = ("arc_tail", "head_rank", "parent", "arc_triangle_offsets", "arc_triangles")
+
+# Nested dissection stops splitting cells of at most this many edges
+LEAF_SIZE = 8
+
+
+def cch_cache_path_for(net_file, digest):
+    """
+    Returns the customizable hierarchy cache file for a network with the given digest.
+    """
+    return f"{net_file}.{digest[:16]}.cch.npz"
+
+
+def undirected_csr(graph):
+    """
+    Returns (offsets, neighbors) of the graph with arc directions dropped,
+    without self-loops and duplicate neighbours.
+    """
+    sources = np.r_[graph.arc_source, graph.targets].astype(np.int64)
+    targets = np.r_[graph.targets, graph.arc_source].astype(np.int64)
+    keep = sources != targets
+    pairs = np.unique(sources[keep] * graph.num_edges + targets[keep])
+    sources, targets = pairs // graph.num_edges, pairs % graph.num_edges
+    offsets = np.zeros(graph.num_edges + 1, dtype=np.int64)
+    np.cumsum(np.bincount(sources, minlength=graph.num_edges), out=offsets[1:])
+    return offsets, targets
+
+
+def dissection_order(graph, leaf_size=LEAF_SIZE):
+    """
+    Contraction order by geometric nested dissection.
+
+    Each cell of edges is split at the median of its longer side, the edges
+    on the smaller side of the cut that touch the other half form the
+    separator, and separators are ordered after both halves so that they end
+    up at the top of the hierarchy.
+    Returns:
+        list: Edge indices, lowest rank first.
+    """
+    coords = graph.node_coords
+    midpoints = (coords[graph.edge_from] + coords[graph.edge_to]) / 2
+    offsets, neighbors = undirected_csr(graph)
+    degree = np.diff(offsets)
+    side = np.zeros(graph.num_edges, dtype=np.int8)
+
+    def crossing_arcs(vertices):
+        counts = degree[vertices]
+        starts = np.repeat(offsets[vertices] - np.cumsum(counts) + counts, counts)
+        positions = starts + np.arange(counts.sum())
+        return np.repeat(vertices, counts), neighbors[positions]
+
+    def dissect(cell):
+        if len(cell) <= leaf_size:
+            return cell.tolist()
+        points = midpoints[cell]
+        axis = int(np.argmax(points.max(axis=0) - points.min(axis=0)))
+        ordered = cell[np.argsort(points[:, axis], kind="stable")]
+        left, right = ordered[:len(ordered) // 2], ordered[len(ordered) // 2:]
+        side[left], side[right] = 1, 2
+        sources, targets = crossing_arcs(left)
+        crossing = side[targets] == 2
+        left_boundary = np.unique(sources[crossing])
+        right_boundary = np.unique(targets[crossing])
+        side[cell] = 0
+        if len(left_boundary) <= len(right_boundary):
+            separator, left = left_boundary, np.setdiff1d(left, left_boundary, assume_unique=True)
+        else:
+            separator, right = right_boundary, np.setdiff1d(right, right_boundary, assume_unique=True)
+        return dissect(left) + dissect(right) + separator.tolist()
+
+    return dissect(np.arange(graph.num_edges))
+
+
+class CustomizableHierarchy:
+    """
+    Customizable contraction hierarchy (CCH) over the edge-based RoutingGraph.
+
+    The contraction order and the shortcut graph depend on the topology only,
+    so they are built once and cached. customize() then computes the weights
+    of all arcs for any per-edge cost vector (free-flow or live travel times)
+    by relaxing the lower triangles of every arc, level by level with NumPy,
+    which takes a fraction of a simulation step and never touches the topology.
+
+    Every arc joins a lower-ranked vertex to a higher one and carries two
+    weights: up (lower -> higher) and down (higher -> lower). The upper
+    neighbours of a vertex are its ancestors in the elimination tree, so a
+    query walks the two ancestor chains of source and target without a queue.
+
+    Queries read the arrays one element at a time, which is several times
+    faster on Python lists than on NumPy arrays, so by default the hierarchy
+    keeps list copies of them. Given query_arrays, e.g. views of shared
+    memory in reroute_pool workers, it indexes the arrays in place instead
+    and copies nothing: slower per query, but the topology is held only once.
+    """
+
+    def __init__(self, graph, rank, up_offsets, up_heads, has_up, has_down,
+                 triangle_arc, triangle_low, triangle_high, level_offsets, query_arrays=None):
+        """
+        Args:
+            graph (RoutingGraph): Graph the hierarchy was built from.
+            Remaining arrays as written by save(), see build().
+            query_arrays (dict): The QUERY_ARRAYS of query_arrays(); when given, queries index
+                these and the topology arrays in place instead of Python list copies.
+        """
+        self.graph = graph
+        self.rank = rank
+        self.up_offsets = up_offsets
+        self.up_heads = up_heads
+        self.has_up = has_up
+        self.has_down = has_down
+        self.triangle_arc = triangle_arc
+        self.triangle_low = triangle_low
+        self.triangle_high = triangle_high
+        self.level_offsets = level_offsets
+        self._in_place = query_arrays is not None
+        if query_arrays is None:
+            query_arrays = self.query_arrays()
+        self.arc_tail = query_arrays["arc_tail"]
+        self.customize_time = 0.0
+
+        # Per level: where each run of triangles for the same arc starts
+        self._levels = []
+        for start, end in zip(level_offsets[:-1].tolist(), level_offsets[1:].tolist()):
+            if end > start:
+                arcs = triangle_arc[start:end]
+                runs = np.flatnonzero(np.r_[True, arcs[1:] != arcs[:-1]])
+                self._levels.append((slice(start, end), runs, arcs[runs]))
+
+        query = self._query_view
+        self._arc_triangle_offsets = query(query_arrays["arc_triangle_offsets"])
+        self._arc_triangles = query(query_arrays["arc_triangles"])
+        self._rank = query(rank)
+        self._up_offsets = query(up_offsets)
+        self._up_heads = query(up_heads)
+        self._arc_tail = query(self.arc_tail)
+        self._triangle_low = query(triangle_low)
+        self._triangle_high = query(triangle_high)
+        self._head_rank = query(query_arrays["head_rank"])
+        self._parent = query(query_arrays["parent"])
+        self._edge_ids = query(graph.edge_ids)
+        self.customize()
+
+    def _query_view(self, array):
+        # What queries index: a list copy, or the array itself when working in place
+        return array if self._in_place else array.tolist()
+
+    def query_arrays(self):
+        """
+        Arrays derived from the topology that queries read, e.g. to share them with
+        the topology so that other processes need not derive or copy them.
+        Returns:
+            dict: {name: array} for the QUERY_ARRAYS.
+        """
+        degree = np.diff(self.up_offsets)
+        # Upper neighbours are sorted by rank, so a vertex's parent is its first one
+        parent = np.full(len(self.rank), -1, dtype=np.int64)
+        parent[degree > 0] = self.up_heads[self.up_offsets[:-1][degree > 0]]
+        # Triangles grouped by the arc they relax, for unpacking shortcuts
+        counts = np.bincount(self.triangle_arc, minlength=len(self.up_heads))
+        return {
+            "arc_tail": np.repeat(np.arange(len(self.rank), dtype=np.int32), degree),
+            "head_rank": self.rank[self.up_heads],
+            "parent": parent,
+            "arc_triangle_offsets": np.r_[0, np.cumsum(counts)],
+            "arc_triangles": np.argsort(self.triangle_arc, kind="stable"),
+        }
+
+    @property
+    def num_arcs(self):
+        return len(self.up_heads)
+
+    @classmethod
+    def build(cls, graph, leaf_size=LEAF_SIZE, verbose=False):
+        """
+        Order the vertices by nested dissection, add the fill-in shortcuts and
+        enumerate the lower triangle of every arc.
+        Args:
+            graph (RoutingGraph): Graph from routing_graph.load_routing_graph().
+            leaf_size (int): Cells with at most this many edges are not split further.
+            verbose (bool): Print progress while contracting.
+        """
+        n = graph.num_edges
+        offsets, adjacent = undirected_csr(graph)
+        offsets, adjacent = offsets.tolist(), adjacent.tolist()
+        neighbors = [set(adjacent[offsets[v]:offsets[v + 1]]) for v in range(n)]
+
+        started = time.perf_counter()
+        order = dissection_order(graph, leaf_size)
+        rank = [0] * n
+        for i, v in enumerate(order):
+            rank[v] = i
+        upper = [None] * n
+        for i, v in enumerate(order):
+            clique = neighbors[v]
+            upper[v] = list(clique)
+            for u in clique:
+                neighbors[u].discard(v)
+                neighbors[u].update(clique)
+                neighbors[u].discard(u)
+            neighbors[v] = set()
+            if verbose and (i + 1) % 10000 == 0:
+                print(f"Contracted {i + 1}/{n} edges in {time.perf_counter() - started:.1f} s")
+
+        # Arcs grouped by their lower endpoint, heads in rank order
+        for v in range(n):
+            upper[v].sort(key=rank.__getitem__)
+        up_offsets = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum([len(heads) for heads in upper], out=up_offsets[1:])
+        up_heads = np.array([u for heads in upper for u in heads], dtype=np.int32)
+        arc_tail = np.repeat(np.arange(n, dtype=np.int64), np.diff(up_offsets))
+        rank = np.array(rank, dtype=np.int32)
+        head_rank = rank[up_heads].astype(np.int64)
+
+        # Level of a vertex: longest chain of lower neighbours below it
+        level = [0] * n
+        for v in order:
+            for u in upper[v]:
+                level[u] = max(level[u], level[v] + 1)
+
+        # Lower triangle (v; u, w) with rank v < rank u < rank w relaxes arc (u, w).
+        # Arc (u, w) is found by its head rank in u's sorted segment.
+        key = arc_tail * n + head_rank
+        chunks = []
+        for v in range(n):
+            start, end = up_offsets[v], up_offsets[v + 1]
+            if end - start < 2:
+                continue
+            i, j = np.triu_indices(end - start, 1)
+            low, high = start + i, start + j
+            arcs = np.searchsorted(key, up_heads[low].astype(np.int64) * n + head_rank[high])
+            chunks.append((np.full(len(arcs), level[v], dtype=np.int64), arcs, low, high))
+        if chunks:
+            levels, arcs, lows, highs = (np.concatenate(parts) for parts in zip(*chunks))
+        else:
+            levels = arcs = lows = highs = np.zeros(0, dtype=np.int64)
+        by_level = np.lexsort((arcs, levels))
+        num_levels = max(level) + 1 if n else 0
+        level_offsets = np.searchsorted(levels[by_level], np.arange(num_levels + 1), side="left")
+
+        arc_source, arc_target = graph.arc_source.astype(np.int64), graph.targets.astype(np.int64)
+        original = np.unique(arc_source * n + arc_target)
+        forward = arc_tail * n + up_heads
+        backward = up_heads.astype(np.int64) * n + arc_tail
+        return cls(
+            graph,
+            rank=rank,
+            up_offsets=up_offsets,
+            up_heads=up_heads,
+            has_up=np.isin(forward, original),
+            has_down=np.isin(backward, original),
+            triangle_arc=arcs[by_level],
+            triangle_low=lows[by_level],
+            triangle_high=highs[by_level],
+            level_offsets=level_offsets.astype(np.int64),
+        )
+
+    def save(self, cache_file):
+        """
+        Write the metric-independent part of the hierarchy to a binary .npz cache.
+        """
+        arrays = {name: getattr(self, name) for name in CCH_ARRAYS}
+        np.savez(cache_file, version=np.array(CCH_CACHE_VERSION), **arrays)
+
+    @classmethod
+    def load(cls, graph, cache_file):
+        """
+        Read a hierarchy written by save() for the given routing graph.
+        """
+        with np.load(cache_file, allow_pickle=False) as data:
+            if int(data["version"]) != CCH_CACHE_VERSION:
+                raise ValueError(f"Unsupported customizable hierarchy cache version in {cache_file}")
+            if len(data["rank"]) != graph.num_edges:
+                raise ValueError(f"Customizable hierarchy cache {cache_file} does not match the routing graph")
+            return cls(graph, **{name: data[name] for name in CCH_ARRAYS})
+
+    def edge_index(self, edge_id):
+        return self.graph.edge_index.get(edge_id)
+
+    def customize(self, costs=None):
+        """
+        Compute the arc weights for new per-edge costs.
+        Args:
+            costs (array-like): One cost per edge in graph order (e.g. live travel
+                times), by default the graph's current edge costs.
+        """
+        start = time.perf_counter()
+        costs = np.asarray(self.graph.edge_cost if costs is None else costs, dtype=np.float64)
+        up = np.where(self.has_up, costs[self.arc_tail], np.inf)
+        down = np.where(self.has_down, costs[self.up_heads], np.inf)
+        low, high = self.triangle_low, self.triangle_high
+        for span, runs, arcs in self._levels:
+            via_up = np.minimum.reduceat(down[low[span]] + up[high[span]], runs)
+            via_down = np.minimum.reduceat(down[high[span]] + up[low[span]], runs)
+            up[arcs] = np.minimum(up[arcs], via_up)
+            down[arcs] = np.minimum(down[arcs], via_down)
+        self._costs = self._query_view(costs)
+        self._up_weights = self._query_view(up)
+        self._down_weights = self._query_view(down)
+        self.customize_time = time.perf_counter() - start
+
+    def _arc(self, tail, head):
+        return bisect.bisect_left(self._head_rank, self._rank[head],
+                                  self._up_offsets[tail], self._up_offsets[tail + 1])
+
+    def _search(self, source, target):
+        offsets, heads, parent, rank = self._up_offsets, self._up_heads, self._parent, self._rank
+        up_weights, down_weights = self._up_weights, self._down_weights
+        dist_f, dist_b = {source: 0.0}, {target: 0.0}
+        pred_f, pred_b = {source: -1}, {target: -1}
+        best, meet = math.inf, -1
+
+        def relax(v, dist, pred, weights):
+            d = dist.get(v, math.inf)
+            if d < best:
+                for k in range(offsets[v], offsets[v + 1]):
+                    u, nd = heads[k], d + weights[k]
+                    if nd < dist.get(u, math.inf):
+                        dist[u] = nd
+                        pred[u] = v
+
+        # Walk both ancestor chains in rank order; they merge at the lowest common ancestor
+        x, y = source, target
+        while x != -1 or y != -1:
+            if y == -1 or (x != -1 and rank[x] < rank[y]):
+                relax(x, dist_f, pred_f, up_weights)
+                x = parent[x]
+            elif x == -1 or rank[y] < rank[x]:
+                relax(y, dist_b, pred_b, down_weights)
+                y = parent[y]
+            else:
+                total = dist_f.get(x, math.inf) + dist_b.get(x, math.inf)
+                if total < best:
+                    best, meet = total, x
+                relax(x, dist_f, pred_f, up_weights)
+                relax(x, dist_b, pred_b, down_weights)
+                x = y = parent[x]
+        return best, meet, pred_f, pred_b
+
+    def _unpack(self, vertices):
+        path = [vertices[0]]
+        stack = [(a, b) for a, b in zip(vertices[-2::-1], vertices[:0:-1])]
+        while stack:
+            a, b = stack.pop()
+            if self._rank[a] < self._rank[b]:
+                k, weight, tail_cost = self._arc(a, b), self._up_weights, self._costs[a]
+                original = self.has_up
+            else:
+                k, weight, tail_cost = self._arc(b, a), self._down_weights, self._costs[a]
+                original = self.has_down
+            if original[k] and tail_cost == weight[k]:
+                path.append(b)
+                continue
+            for i in range(self._arc_triangle_offsets[k], self._arc_triangle_offsets[k + 1]):
+                t = self._arc_triangles[i]
+                low, high = self._triangle_low[t], self._triangle_high[t]
+                if weight is self._up_weights:
+                    via = self._down_weights[low] + self._up_weights[high]
+                else:
+                    via = self._down_weights[high] + self._up_weights[low]
+                if via == weight[k]:
+                    m = self._arc_tail[low]
+                    stack.append((m, b))
+                    stack.append((a, m))
+                    break
+            else:
+                raise KeyError(f"Cannot unpack the arc between edges {a} and {b}")
+        return path
+
+    def _path(self, meet, pred_f, pred_b):
+        vertices = [meet]
+        while pred_f[vertices[-1]] != -1:
+            vertices.append(pred_f[vertices[-1]])
+        vertices.reverse()
+        while pred_b[vertices[-1]] != -1:
+            vertices.append(pred_b[vertices[-1]])
+        return self._unpack(vertices)
+
+    def shortest_path(self, source, target):
+        """
+        Shortest path between two edge indices with the current customization.
+        Returns:
+            tuple: (cost, list of edge indices from source to target); (inf, []) when unreachable.
+        """
+        cost, meet, pred_f, pred_b = self._search(source, target)
+        if meet < 0:
+            return math.inf, []
+        return cost, self._path(meet, pred_f, pred_b)
+
+    def _ancestor_search(self, vertex, weights):
+        offsets, heads, parent = self._up_offsets, self._up_heads, self._parent
+        dist, pred = {vertex: 0.0}, {vertex: -1}
+        chain = []
+        while vertex != -1:
+            d = dist.get(vertex, math.inf)
+            if d < math.inf:
+                chain.append((vertex, d))
+                for k in range(offsets[vertex], offsets[vertex + 1]):
+                    u, nd = heads[k], d + weights[k]
+                    if nd < dist.get(u, math.inf):
+                        dist[u] = nd
+                        pred[u] = vertex
+            vertex = parent[vertex]
+        return chain, pred
+
+    def _many_to_many(self, sources, targets):
+        # One backward search per target fills the buckets of its ancestors,
+        # then one forward search per source scans the buckets it passes.
+        buckets = {}
+        pred_b = []
+        for j, target in enumerate(targets):
+            chain, pred = self._ancestor_search(target, self._down_weights)
+            pred_b.append(pred)
+            for v, d in chain:
+                buckets.setdefault(v, []).append((j, d))
+
+        costs = np.full((len(sources), len(targets)), np.inf)
+        meet = np.full((len(sources), len(targets)), -1, dtype=np.int64)
+        pred_f = []
+        for i, source in enumerate(sources):
+            chain, pred = self._ancestor_search(source, self._up_weights)
+            pred_f.append(pred)
+            row, meet_row = [math.inf] * len(targets), [-1] * len(targets)
+            for v, d in chain:
+                for j, db in buckets.get(v, ()):
+                    if d + db < row[j]:
+                        row[j], meet_row[j] = d + db, v
+            costs[i], meet[i] = row, meet_row
+        return costs, meet, pred_f, pred_b
+
+    def many_to_many(self, sources, targets, with_paths=False):
+        """
+        Travel times between every source and every target in one batch.
+
+        Each source and target is searched only once, instead of one
+        bidirectional search per pair, by storing the backward search of
+        every target in buckets at the vertices it reaches.
+        Args:
+            sources (list): Edge indices of the origins.
+            targets (list): Edge indices of the destinations.
+            with_paths (bool): Also unpack the path of every pair.
+        Returns:
+            tuple: (costs, paths) where costs is an (N, M) array (inf when
+                unreachable) and paths[i][j] the list of edge indices from
+                sources[i] to targets[j] ([] when unreachable), or None
+                unless with_paths is set.
+        """
+        costs, meet, pred_f, pred_b = self._many_to_many(sources, targets)
+        if not with_paths:
+            return costs, None
+        paths = [[self._path(m, pred_f[i], pred_b[j]) if m >= 0 else []
+                  for j, m in enumerate(meet[i].tolist())]
+                 for i in range(len(sources))]
+        return costs, paths
+
+    def find_routes(self, requests):
+        """
+        Routes for a batch of (source edge ID, target edge ID) pairs, e.g. all
+        vehicles to reroute in one interval. Shared origins and destinations
+        are searched once and only the requested pairs are unpacked.
+        Returns:
+            list: One list of edge IDs per request, empty when either edge is
+                unknown or the target is unreachable.
+        """
+        edge_index = self.graph.edge_index
+        pairs = [(edge_index.get(source), edge_index.get(target)) for source, target in requests]
+        sources = sorted({s for s, t in pairs if s is not None and t is not None})
+        targets = sorted({t for s, t in pairs if s is not None and t is not None})
+        _, meet, pred_f, pred_b = self._many_to_many(sources, targets)
+        source_row = {s: i for i, s in enumerate(sources)}
+        target_column = {t: j for j, t in enumerate(targets)}
+
+        routes = []
+        for source, target in pairs:
+            if source is None or target is None:
+                routes.append([])
+                continue
+            i, j = source_row[source], target_column[target]
+            m = int(meet[i, j])
+            path = self._path(m, pred_f[i], pred_b[j]) if m >= 0 else []
+            routes.append([self._edge_ids[v] for v in path])
+        return routes
+
+    def find_route(self, source_edge, target_edge):
+        """
+        Route between two SUMO edge IDs as a list of edge IDs for traci.vehicle.setRoute.
+        Returns an empty list when either edge is unknown or the target is unreachable.
+        """
+        source = self.edge_index(source_edge)
+        target = self.edge_index(target_edge)
+        if source is None or target is None:
+            return []
+        _, path = self.shortest_path(source, target)
+        return [self._edge_ids[i] for i in path]
+
+
+def load_customizable_hierarchy(net_file="osm.net.xml", use_cache=True):
+    """
+    Load the customizable hierarchy of a network, building its topology only
+    when no cache matching the current file contents exists. The hierarchy is
+    customized with free-flow travel times.
+    Args:
+        net_file (str): Path to the .net.xml file.
+        use_cache (bool): Read and write the binary cache next to the network.
+    Returns:
+        CustomizableHierarchy: Hierarchy with its RoutingGraph in .graph.
+    """
+    graph = load_routing_graph(net_file, use_cache=use_cache)
+    if not use_cache:
+        return CustomizableHierarchy.build(graph)
+
+    cache_file = cch_cache_path_for(net_file, file_digest(net_file))
+    if os.path.exists(cache_file):
+        try:
+            return CustomizableHierarchy.load(graph, cache_file)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Ignoring unreadable customizable hierarchy cache {cache_file}: {e}")
+
+    hierarchy = CustomizableHierarchy.build(graph, verbose=True)
+    try:
+        hierarchy.save(cache_file)
+    except OSError as e:
+        print(f"Could not write customizable hierarchy cache {cache_file}: {e}")
+    return hierarchy
+
+
+# Main Execution
+if __name__ == "__main__":
+    import sys
+
+    net_file = sys.argv[1] if len(sys.argv) > 1 else "osm.net.xml"
+    start = time.perf_counter()
+    hierarchy = load_customizable_hierarchy(net_file)
+    print(f"Customizable hierarchy for {net_file}: {hierarchy.graph.num_edges} edges, "
+          f"{hierarchy.num_arcs} arcs, {len(hierarchy.triangle_arc)} triangles "
+          f"({time.perf_counter() - start:.1f} s).")
+    print(f"Customization: {hierarchy.customize_time * 1000:.1f} ms")
@@ -1,5 +1,7 @@
+from sumo_backend import sumo_command  # First, so that SUMO_BACKEND=libsumo can stand in for traci
 import traci
-import sumolib
+from routing_graph import load_routing_graph
+from spatial_index import SpatialIndex
 
 # Define custom vehicles with start and end coordinates
 custom_vehicles = [
@@ -9,21 +11,20 @@ custom_vehicles = [
 ]
 
 # Function to find the nearest edge
-def get_nearest_edge(net, coord):
+def get_nearest_edge(index, coord, radius=0.1):
     x, y = map(float, coord.split(","))
-    edges = net.getNeighboringEdges(x, y)
-    if not edges:
+    edge_id = index.nearest_edge_id((x, y), max_distance=radius)  # Closest edge within the search radius
+    if edge_id is None:
         raise ValueError(f"No nearby edge found for coordinate: {coord}")
-    closest_edge = min(edges, key=lambda edge: edge[1])  # Find the closest edge by distance
-    return closest_edge[0].getID()
+    return edge_id
 
 # Function to inject custom vehicles dynamically
-def inject_custom_vehicles(net, vehicles):
+def inject_custom_vehicles(index, vehicles):
     for vehicle in vehicles:
         try:
             # Get the start and end edges
-            start_edge = get_nearest_edge(net, vehicle["start"])
-            end_edge = get_nearest_edge(net, vehicle["end"])
+            start_edge = get_nearest_edge(index, vehicle["start"])
+            end_edge = get_nearest_edge(index, vehicle["end"])
             
             # Add the vehicle to the simulation
             traci.vehicle.add(
@@ -42,11 +43,11 @@ def main():
     sumo_config = "osm_adjusted.sumocfg"  # Replace with your SUMO config file
     net_file = "your_network.net.xml"  # Replace with your SUMO network file
 
-    # Load the network
-    net = sumolib.net.readNet(net_file)
+    # Load the network and index its junctions and lane shapes
+    index = SpatialIndex(load_routing_graph(net_file))
 
     # Start SUMO simulation
-    traci.start(["sumo-gui", "-c", sumo_config])  # Use "sumo" instead of "sumo-gui" for command-line execution
+    traci.start(sumo_command(sumo_config))  # SUMO_BACKEND=sumo or libsumo for command-line execution
 
     step = 0
     max_steps = 1000  # Simulation length
@@ -56,7 +57,7 @@ def main():
 
         # Inject custom vehicles at step 10
         if step == 10:
-            inject_custom_vehicles(net, custom_vehicles)
+            inject_custom_vehicles(index, custom_vehicles)
 
         step += 1
 
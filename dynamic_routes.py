@@ -0,0 +1,247 @@
+import heapq
+import math
+
+from route_engine import RouteEngine
+
+
+class IncrementalPlanner:
+    """
+    D* Lite search towards one target over the edge-based RoutingGraph.
+
+    The search runs backwards from the target and keeps its g/rhs values
+    between calls. When the vehicle moves or edge costs change, only the
+    vertices whose shortest-path distance is affected are expanded again
+    instead of searching the whole graph from scratch.
+
+    Entering edge u costs cost(u), the same arc weights RouteEngine uses, so
+    a change to one edge only touches that edge's rhs value.
+    """
+
+    def __init__(self, engine, target, base_costs, overlay=None):
+        """
+        Args:
+            engine (RouteEngine): Supplies the topology and the heuristic.
+            target (int): Index of the destination edge.
+            base_costs (list): Shared per-edge costs, never modified by the planner.
+            overlay (dict): {edge index: cost} overrides for this vehicle only.
+        """
+        self.engine = engine
+        self.target = target
+        self.base_costs = base_costs
+        self.overlay = dict(overlay) if overlay else {}
+        self.start = None
+        self.km = 0.0
+        self.g = {}
+        self.rhs = {target: 0.0}
+        self.open = {}
+        self.heap = []
+        self.expansions = 0
+        self._offsets = engine._offsets
+        self._targets = engine._targets
+        reverse_offsets, reverse_sources = engine.graph.reverse_csr()
+        self._reverse_offsets = reverse_offsets.tolist()
+        self._reverse_sources = reverse_sources.tolist()
+        self._start_x, self._start_y = engine._start_x, engine._start_y
+        self._scale = engine._heuristic_scale
+
+    def cost(self, u):
+        value = self.overlay.get(u)
+        return self.base_costs[u] if value is None else value
+
+    def _key(self, u):
+        best = min(self.g.get(u, math.inf), self.rhs.get(u, math.inf))
+        h = math.hypot(self._start_x[u] - self._sx, self._start_y[u] - self._sy) * self._scale
+        return best + h + self.km, best
+
+    def _move_to(self, start):
+        self.start = start
+        self._sx, self._sy = self._start_x[start], self._start_y[start]
+
+    def _push(self, u):
+        key = self._key(u)
+        self.open[u] = key
+        heapq.heappush(self.heap, (key, u))
+
+    def _requeue(self, u):
+        self.open.pop(u, None)
+        if self.g.get(u, math.inf) != self.rhs.get(u, math.inf):
+            self._push(u)
+
+    def _update_vertex(self, u):
+        if u != self.target:
+            g, targets = self.g, self._targets
+            best = math.inf
+            for k in range(self._offsets[u], self._offsets[u + 1]):
+                value = g.get(targets[k], math.inf)
+                if value < best:
+                    best = value
+            self.rhs[u] = self.cost(u) + best if best < math.inf else math.inf
+        self._requeue(u)
+
+    def _top_key(self):
+        heap, open_keys = self.heap, self.open
+        while heap and open_keys.get(heap[0][1]) != heap[0][0]:
+            heapq.heappop(heap)
+        return heap[0][0] if heap else (math.inf, math.inf)
+
+    def _compute_shortest_path(self):
+        g, rhs, start, target = self.g, self.rhs, self.start, self.target
+        predecessors, reverse_offsets = self._reverse_sources, self._reverse_offsets
+        while self._top_key() < self._key(start) or rhs.get(start, math.inf) != g.get(start, math.inf):
+            key, u = heapq.heappop(self.heap)
+            del self.open[u]
+            self.expansions += 1
+            new_key = self._key(u)
+            if key < new_key:
+                self._push(u)
+                continue
+            g_old = g.get(u, math.inf)
+            if g_old > rhs.get(u, math.inf):
+                # Overconsistent: u got cheaper, predecessors can only improve through it
+                g[u] = g_u = rhs[u]
+                for k in range(reverse_offsets[u], reverse_offsets[u + 1]):
+                    s = predecessors[k]
+                    if s != target:
+                        value = self.cost(s) + g_u
+                        if value < rhs.get(s, math.inf):
+                            rhs[s] = value
+                            self._requeue(s)
+            else:
+                # Underconsistent: rescan only the predecessors whose best successor was u
+                g[u] = math.inf
+                self._update_vertex(u)
+                for k in range(reverse_offsets[u], reverse_offsets[u + 1]):
+                    s = predecessors[k]
+                    if s != target and rhs.get(s, math.inf) == self.cost(s) + g_old:
+                        self._update_vertex(s)
+
+    def set_costs(self, edges, overlay=None):
+        """
+        Register cost changes of the given edges.
+        Args:
+            edges (iterable): Edge indices whose base cost or override changed.
+            overlay (dict): New {edge index: cost} overrides, replacing the old ones.
+        """
+        if overlay is not None:
+            self.overlay = overlay
+        if self.start is None:
+            return
+        for u in edges:
+            self._update_vertex(u)
+
+    def plan(self, start):
+        """
+        Shortest path from `start` to the target, repairing the previous search.
+        Returns:
+            tuple: (cost, list of edge indices); (inf, []) when unreachable.
+        """
+        if self.start is None:
+            self._move_to(start)
+            self._push(self.target)
+        elif start != self.start:
+            self.km += self.engine.heuristic(self.start, start)
+            self._move_to(start)
+        self._compute_shortest_path()
+
+        g = self.g
+        cost = g.get(start, math.inf)
+        if cost == math.inf:
+            return math.inf, []
+        path = [start]
+        while path[-1] != self.target and len(path) <= len(g):
+            u = path[-1]
+            path.append(min((self._targets[k] for k in range(self._offsets[u], self._offsets[u + 1])),
+                            key=lambda v: g.get(v, math.inf)))
+        if path[-1] != self.target:
+            return math.inf, []
+        return cost, path
+
+
+class DynamicRouter:
+    """
+    Per-vehicle incremental rerouting with private weight overlays.
+
+    Congested edges are blocked only in the overlay of the vehicle being
+    rerouted, so the shared graph costs stay untouched. Each vehicle keeps its
+    IncrementalPlanner as long as its target stays the same.
+    """
+
+    def __init__(self, graph, blocked_cost=math.inf):
+        """
+        Args:
+            graph (RoutingGraph): Graph from routing_graph.load_routing_graph().
+            blocked_cost (float): Cost given to congested edges in a vehicle's overlay.
+        """
+        self.graph = graph
+        self.engine = RouteEngine(graph)
+        self.blocked_cost = blocked_cost
+        self.base_costs = graph.edge_cost.tolist()
+        self.planners = {}
+        self.searches = 0
+        self._retired_expansions = 0
+
+    @property
+    def expansions(self):
+        """
+        Vertices expanded by all searches so far.
+        """
+        return self._retired_expansions + sum(planner.expansions for planner in self.planners.values())
+
+    def refresh_costs(self):
+        """
+        Take the graph's current edge costs (after RoutingGraph.update_edge_costs())
+        and repair every planner for the edges that changed.
+        """
+        costs = self.graph.edge_cost.tolist()
+        changed = [i for i, (old, new) in enumerate(zip(self.base_costs, costs)) if old != new]
+        self.base_costs[:] = costs
+        for planner in self.planners.values():
+            planner.set_costs(changed)
+
+    def _overlay(self, congested_edges, source, target):
+        edge_index = self.graph.edge_index
+        overlay = {}
+        for edge in congested_edges:
+            i = edge_index.get(edge)
+            if i is not None and i != source and i != target:
+                overlay[i] = self.blocked_cost
+        return overlay
+
+    def route(self, veh_id, current_edge, target_edge, congested_edges=()):
+        """
+        Route for a vehicle avoiding the given congested edges.
+        Args:
+            veh_id (str): Vehicle ID, keys the planner kept between calls.
+            current_edge (str): Edge the vehicle is on.
+            target_edge (str): Destination edge.
+            congested_edges (iterable): Edge IDs blocked for this vehicle.
+        Returns:
+            list: Edge IDs for traci.vehicle.setRoute, empty when no route exists.
+        """
+        source = self.engine.edge_index(current_edge)
+        target = self.engine.edge_index(target_edge)
+        if source is None or target is None:
+            return []
+        overlay = self._overlay(congested_edges, source, target)
+
+        planner = self.planners.get(veh_id)
+        if planner is None or planner.target != target:
+            if planner is not None:
+                self._retired_expansions += planner.expansions
+            planner = self.planners[veh_id] = IncrementalPlanner(self.engine, target, self.base_costs, overlay)
+        else:
+            changed = overlay.keys() ^ planner.overlay.keys()
+            changed.update(i for i in overlay if overlay[i] != planner.overlay.get(i))
+            planner.set_costs(changed, overlay)
+        self.searches += 1
+        _, path = planner.plan(source)
+        return [self.engine._edge_ids[i] for i in path]
+
+    def forget(self, vehicle_ids):
+        """
+        Drop the planners of vehicles that left the network.
+        """
+        for veh_id in vehicle_ids:
+            planner = self.planners.pop(veh_id, None)
+            if planner is not None:
+                self._retired_expansions += planner.expansions
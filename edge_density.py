@@ -0,0 +1,143 @@
+import xml.etree.ElementTree as ET
+
+import numpy as np
+
+from edge_state import EDGE_VARIABLES
+
+# Columns of EdgeStateCollector.state read by EdgeDensity.add()
+_COUNT = list(EDGE_VARIABLES).index("vehicle_count")
+_SPEED = list(EDGE_VARIABLES).index("mean_speed")
+_OCCUPANCY = list(EDGE_VARIABLES).index("occupancy")
+
+# Values that can be drawn with draw_edge_map(), with their colour bar labels
+EDGE_METRICS = {
+    "vehicle_seconds": "Vehicle-seconds",
+    "mean_speed": "Mean speed (m/s)",
+    "occupancy": "Mean occupancy (%)",
+}
+
+
+class EdgeDensity:
+    """
+    Vehicle-seconds, mean speed and occupancy of every edge over one stage.
+
+    Only three running sums per edge are kept, the same aggregates as SUMO's
+    edgeData output: mean speed is weighted by the vehicle-seconds (so empty
+    edges do not count) and occupancy is averaged over the stage's seconds.
+    """
+
+    def __init__(self, edge_ids):
+        """
+        Args:
+            edge_ids (list): Edge ID of every row, e.g. EdgeStateCollector.edge_ids.
+        """
+        self.edge_ids = edge_ids
+        self.vehicle_seconds = np.zeros(len(edge_ids))
+        self._speed_seconds = np.zeros(len(edge_ids))
+        self._occupancy_seconds = np.zeros(len(edge_ids))
+        self.seconds = 0.0
+
+    def add(self, state, step_length=1.0):
+        """
+        Add one step of edge subscription results.
+        Args:
+            state (np.ndarray): Shape (edges, variables), as EdgeStateCollector.collect() returns it.
+            step_length (float): Seconds per simulation step.
+        """
+        vehicle_seconds = state[:, _COUNT] * step_length
+        self.vehicle_seconds += vehicle_seconds
+        self._speed_seconds += state[:, _SPEED] * vehicle_seconds
+        self._occupancy_seconds += state[:, _OCCUPANCY] * step_length
+        self.seconds += step_length
+
+    def mean_speed(self):
+        """
+        Mean speed of the vehicles on every edge, NaN where there were none.
+        """
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(self.vehicle_seconds > 0, self._speed_seconds / self.vehicle_seconds, np.nan)
+
+    def occupancy(self):
+        """
+        Mean occupancy (%) of every edge over the stage.
+        """
+        return self._occupancy_seconds / self.seconds if self.seconds else np.zeros(len(self.edge_ids))
+
+    def metric(self, name):
+        """
+        One of the EDGE_METRICS for every edge.
+        """
+        if name == "vehicle_seconds":
+            return self.vehicle_seconds
+        if name == "mean_speed":
+            return self.mean_speed()
+        if name == "occupancy":
+            return self.occupancy()
+        raise ValueError(f"Unknown edge metric '{name}', expected one of {', '.join(EDGE_METRICS)}")
+
+    @classmethod
+    def from_edge_data(cls, edge_data_file):
+        """
+        Read SUMO edgeData output (an <edgeData> element in an additional file) instead
+        of collecting during the run, one EdgeDensity per interval.
+        Returns:
+            dict: {interval ID (or "begin-end"): EdgeDensity}
+        """
+        densities = {}
+        for _, element in ET.iterparse(edge_data_file):
+            if element.tag != "interval":
+                continue
+            edges = element.findall("edge")
+            density = cls([edge.get("id") for edge in edges])
+            density.seconds = float(element.get("end")) - float(element.get("begin"))
+            density.vehicle_seconds = np.array([float(edge.get("sampledSeconds", 0)) for edge in edges])
+            speeds = np.array([float(edge.get("speed", 0)) for edge in edges])
+            density._speed_seconds = speeds * density.vehicle_seconds
+            density._occupancy_seconds = np.array([float(edge.get("occupancy", 0)) for edge in edges]) * density.seconds
+            densities[element.get("id") or f"{element.get('begin')}-{element.get('end')}"] = density
+            element.clear()
+        return densities
+
+
+def lane_segments(graph, edge_ids):
+    """
+    Lane shapes of a RoutingGraph for drawing values given per edge ID.
+    Args:
+        graph (RoutingGraph): Network with lane geometry, e.g. load_routing_graph("osm.net.xml").
+        edge_ids (list): Edge ID of every value.
+    Returns:
+        tuple: (list of (points, 2) lane shapes, value row of every lane, -1 for edges without a value)
+    """
+    rows = {edge_id: i for i, edge_id in enumerate(edge_ids)}
+    graph_rows = np.array([rows.get(edge_id, -1) for edge_id in graph.edge_ids.tolist()], dtype=np.int64)
+    shapes = np.split(graph.lane_shape_points, graph.lane_shape_offsets[1:-1])
+    return shapes, graph_rows[graph.lane_edge]
+
+
+def draw_edge_map(ax, graph, density, metric="vehicle_seconds", cmap="YlOrRd", linewidth=1.0):
+    """
+    Draw a network-shaped map: every lane coloured by its edge's value, lanes
+    without data in light grey.
+    Args:
+        ax: Matplotlib axes.
+        graph (RoutingGraph): Network with lane geometry.
+        density (EdgeDensity): Values of one stage.
+        metric (str): One of EDGE_METRICS.
+    Returns:
+        The LineCollection of the coloured lanes, e.g. for a colour bar.
+    """
+    from matplotlib.collections import LineCollection
+
+    shapes, rows = lane_segments(graph, density.edge_ids)
+    values = density.metric(metric)
+    lane_values = np.where(rows >= 0, values[np.maximum(rows, 0)], np.nan)
+    has_value = np.isfinite(lane_values)
+    ax.add_collection(LineCollection([shape for shape, keep in zip(shapes, has_value) if not keep],
+                                     colors="lightgrey", linewidths=linewidth * 0.5))
+    lanes = LineCollection([shape for shape, keep in zip(shapes, has_value) if keep],
+                           cmap=cmap, linewidths=linewidth)
+    lanes.set_array(lane_values[has_value])
+    ax.add_collection(lanes)
+    ax.autoscale_view()
+    ax.set_aspect("equal")
+    return lanes
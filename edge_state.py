@@ -0,0 +1,136 @@
+import numpy as np
+import traci
+import traci.constants as tc
+
+# Edge variables collected every step, in column order
+EDGE_VARIABLES = {
+    "vehicle_count": tc.LAST_STEP_VEHICLE_NUMBER,
+    "mean_speed": tc.LAST_STEP_MEAN_SPEED,
+    "occupancy": tc.LAST_STEP_OCCUPANCY,
+    "travel_time": tc.VAR_CURRENT_TRAVELTIME,
+}
+
+
+class EdgeStateCollector:
+    """
+    Collects vehicle count, mean speed, occupancy and travel time for every edge
+    through TraCI subscriptions.
+
+    Subscribing costs one round-trip per edge, once. After that SUMO pushes the
+    values with every simulationStep() response, so collect() reads them without
+    any extra round-trip. The loops this replaces made one
+    getLastStepVehicleNumber call per edge on every congestion or rerouting
+    check, so round_trips_saved counts those calls: one per monitored edge each
+    time edge_costs() or congested_edges() reads a collected step.
+    """
+
+    def __init__(self, edge_ids=None, include_internal=False):
+        """
+        Args:
+            edge_ids (list): Edges to monitor, or None for every edge in the simulation.
+            include_internal (bool): Keep internal junction edges (':' prefix) when
+                edge_ids is None.
+        """
+        self.edge_ids = list(edge_ids) if edge_ids is not None else None
+        self.include_internal = include_internal
+        self.columns = list(EDGE_VARIABLES)
+        self.state = None
+        self.steps_collected = 0
+        self.checks = 0
+        self.round_trips_saved = 0
+        self._checked_step = None
+        self._graph = None
+
+    def column_index(self, name):
+        return self.columns.index(name)
+
+    def subscribe(self):
+        """
+        Subscribe to the edge variables. Call once after traci.start().
+        """
+        if self.edge_ids is None:
+            self.edge_ids = [edge for edge in traci.edge.getIDList()
+                             if self.include_internal or not edge.startswith(":")]
+        self.edge_index = {edge: i for i, edge in enumerate(self.edge_ids)}
+        variables = list(EDGE_VARIABLES.values())
+        for edge in self.edge_ids:
+            traci.edge.subscribe(edge, variables)
+        self.state = np.zeros((len(self.edge_ids), len(self.columns)), dtype=np.float64)
+        print(f"Subscribed to {len(variables)} variables on {len(self.edge_ids)} edges.")
+
+    def collect(self):
+        """
+        Read this step's subscription results into one array.
+        Returns:
+            np.ndarray: Shape (edges, variables) in the order of self.columns.
+        """
+        if self.state is None:
+            self.subscribe()
+        results = traci.edge.getAllSubscriptionResults()
+        variables = list(EDGE_VARIABLES.values())
+        state = self.state
+        for edge, values in results.items():
+            i = self.edge_index.get(edge)
+            if i is not None:
+                state[i] = [values.get(var, 0.0) for var in variables]
+        self.steps_collected += 1
+        return state
+
+    def _count_check(self):
+        # One getter call per edge replaced, once per collected step however often it is read
+        if self._checked_step != self.steps_collected:
+            self._checked_step = self.steps_collected
+            self.checks += 1
+            self.round_trips_saved += len(self.edge_ids)
+
+    def column(self, name):
+        """
+        Returns one variable for all edges from the last collect().
+        """
+        return self.state[:, self.column_index(name)]
+
+    def as_dict(self, name):
+        """
+        Returns {edge_id: value} for one variable from the last collect().
+        """
+        return dict(zip(self.edge_ids, self.column(name).tolist()))
+
+    def edge_costs(self, graph, name="travel_time", max_factor=10.0):
+        """
+        Routing costs for every edge of a RoutingGraph from the last collect().
+        Args:
+            graph (RoutingGraph): Graph whose edge order the costs follow.
+            name (str): 'travel_time' for SUMO's current travel times, or 'occupancy'
+                to scale the free-flow time linearly up to max_factor at 100% occupancy.
+            max_factor (float): Cap on the cost of a jammed edge relative to free flow.
+        Returns:
+            np.ndarray: Costs between the free-flow time and max_factor times it;
+                edges that are not monitored keep their free-flow time.
+        """
+        if self._graph is not graph:
+            positions = np.array([graph.edge_index.get(edge, -1) for edge in self.edge_ids], dtype=np.int64)
+            self._graph, self._rows = graph, np.flatnonzero(positions >= 0)
+            self._positions = positions[self._rows]
+        self._count_check()
+        free_flow = graph.free_flow_cost[self._positions]
+        values = self.column(name)[self._rows]
+        if name == "occupancy":
+            values = free_flow * (1.0 + (max_factor - 1.0) * values / 100.0)
+        values = np.where(np.isfinite(values), values, free_flow * max_factor)
+        costs = graph.free_flow_cost.copy()
+        costs[self._positions] = np.clip(values, free_flow, free_flow * max_factor)
+        return costs
+
+    def congested_edges(self, threshold, name="vehicle_count"):
+        """
+        Returns the IDs of the edges whose value is above the threshold.
+        """
+        self._count_check()
+        return [self.edge_ids[i] for i in np.flatnonzero(self.column(name) > threshold)]
+
+    def report(self):
+        """
+        Print how many TraCI round-trips the subscriptions saved.
+        """
+        print(f"Edge state: {self.steps_collected} steps collected, {self.checks} checks read them, "
+              f"{self.round_trips_saved} getter calls saved.")
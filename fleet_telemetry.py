@@ -0,0 +1,139 @@
+import numpy as np
+import traci
+import traci.constants as tc
+
+# Vehicle variables pushed by SUMO every step for each subscribed vehicle
+VEHICLE_VARIABLES = [tc.VAR_SPEED, tc.VAR_POSITION, tc.VAR_ROAD_ID, tc.VAR_DISTANCE]
+
+# Simulation variables pushed every step (one subscription per domain, so all of them at once)
+SIMULATION_VARIABLES = [tc.VAR_DEPARTED_VEHICLES_IDS, tc.VAR_ARRIVED_VEHICLES_NUMBER]
+
+
+class FleetTelemetry:
+    """
+    Per-step fleet statistics filled from TraCI vehicle subscriptions.
+
+    Every vehicle is subscribed once when it departs, so reading the whole fleet
+    costs no round-trips per step. The values are copied into preallocated NumPy
+    buffers, and mean speed, vehicle count and stage aggregates are array reductions.
+    """
+
+    def __init__(self, capacity=4000, edge_index=None):
+        """
+        Args:
+            capacity (int): Initial buffer size, grown automatically when exceeded.
+            edge_index (dict): Optional {edge_id: index} mapping (e.g. RoutingGraph.edge_index);
+                edges not in it get new indices as they are seen.
+        """
+        self.edge_index = dict(edge_index) if edge_index else {}
+        self.edge_ids = sorted(self.edge_index, key=self.edge_index.get)
+        self.ids = []
+        self.count = 0
+        self.departed = 0
+        self.arrived = 0
+        self.subscriptions = 0
+        self.stage_speed_sum = {}
+        self.stage_steps = {}
+        self._allocate(capacity)
+
+    def _allocate(self, capacity):
+        self.capacity = capacity
+        self._speed = np.zeros(capacity, dtype=np.float64)
+        self._position = np.zeros((capacity, 2), dtype=np.float64)
+        self._edge = np.full(capacity, -1, dtype=np.int32)
+        self._distance = np.zeros(capacity, dtype=np.float64)
+
+    def subscribe(self):
+        """
+        Subscribe to departures and to every vehicle already in the network.
+        Call once after traci.start().
+        """
+        traci.simulation.subscribe(SIMULATION_VARIABLES)
+        for veh_id in traci.vehicle.getIDList():
+            self._subscribe_vehicle(veh_id)
+
+    def _subscribe_vehicle(self, veh_id):
+        traci.vehicle.subscribe(veh_id, VEHICLE_VARIABLES)
+        self.subscriptions += 1
+
+    def update(self):
+        """
+        Fill the buffers with this step's values. Call once after every simulationStep().
+        Returns:
+            int: Number of vehicles in the network.
+        """
+        simulation = traci.simulation.getSubscriptionResults()
+        departed = simulation.get(tc.VAR_DEPARTED_VEHICLES_IDS, ())
+        for veh_id in departed:
+            self._subscribe_vehicle(veh_id)
+        self.departed = len(departed)
+        self.arrived = simulation.get(tc.VAR_ARRIVED_VEHICLES_NUMBER, 0)
+
+        results = traci.vehicle.getAllSubscriptionResults()
+        n = len(results)
+        if n > self.capacity:
+            self._allocate(max(n, 2 * self.capacity))
+
+        self.ids = list(results)
+        edge_index = self.edge_index
+        for i, values in enumerate(results.values()):
+            self._speed[i] = values[tc.VAR_SPEED]
+            self._position[i] = values[tc.VAR_POSITION]
+            self._distance[i] = values[tc.VAR_DISTANCE]
+            road = values[tc.VAR_ROAD_ID]
+            index = edge_index.get(road)
+            if index is None:
+                index = edge_index[road] = len(edge_index)
+                self.edge_ids.append(road)
+            self._edge[i] = index
+        self.count = n
+        return n
+
+    @property
+    def speeds(self):
+        return self._speed[:self.count]
+
+    @property
+    def positions(self):
+        return self._position[:self.count]
+
+    @property
+    def edge_indices(self):
+        return self._edge[:self.count]
+
+    @property
+    def distances(self):
+        return self._distance[:self.count]
+
+    def current_edges(self):
+        """
+        Returns {vehicle ID: edge ID} of the vehicles in the network this step.
+        """
+        edge_ids = self.edge_ids
+        return {veh_id: edge_ids[i] for veh_id, i in zip(self.ids, self.edge_indices.tolist())}
+
+    def mean_speed(self):
+        """
+        Average speed of all vehicles in the network (0 when it is empty).
+        """
+        return float(self.speeds.mean()) if self.count > 0 else 0
+
+    def record_stage(self, stage, mean_speed=None):
+        """
+        Add this step's mean speed to the running aggregate of a stage.
+        Args:
+            stage (str): The stage of simulation ('start', 'peak', 'offpeak').
+            mean_speed (float): The step's mean speed if already computed (e.g. from a
+                StepSnapshot in an analytics thread), by default mean_speed().
+        """
+        if mean_speed is None:
+            mean_speed = self.mean_speed()
+        self.stage_speed_sum[stage] = self.stage_speed_sum.get(stage, 0.0) + mean_speed
+        self.stage_steps[stage] = self.stage_steps.get(stage, 0) + 1
+
+    def stage_mean_speed(self, stage):
+        """
+        Mean of the per-step average speeds recorded for a stage.
+        """
+        steps = self.stage_steps.get(stage, 0)
+        return self.stage_speed_sum[stage] / steps if steps > 0 else 0
@@ -0,0 +1,121 @@
+import xml.etree.ElementTree as ET
+
+import numpy as np
+
+# Bins along x and y of the heatmaps
+DEFAULT_BINS = (50, 50)
+
+
+def network_boundary(net_file="osm.net.xml"):
+    """
+    Extent of a SUMO network from its <location convBoundary="..."> element, which
+    sits at the top of the file, so only the first lines are read.
+    Returns:
+        tuple: (x_min, x_max, y_min, y_max) in network coordinates.
+    """
+    with open(net_file, "rb") as f:
+        for _, element in ET.iterparse(f):
+            if element.tag == "location":
+                x_min, y_min, x_max, y_max = (float(v) for v in element.get("convBoundary").split(","))
+                return x_min, x_max, y_min, y_max
+    raise ValueError(f"No <location> element in {net_file}")
+
+
+class HeatmapGrid:
+    """
+    Online 2-D histogram of vehicle positions over a fixed extent.
+
+    Positions are binned into a preallocated count grid as they arrive, so
+    memory does not grow with the length of the run and drawing the heatmap
+    only needs the grid. counts[i, j] is bin i along x and j along y, as
+    np.histogram2d returns it.
+    """
+
+    def __init__(self, extent, bins=DEFAULT_BINS):
+        """
+        Args:
+            extent (tuple): (x_min, x_max, y_min, y_max), e.g. network_boundary().
+            bins (tuple): Number of bins along x and y.
+        """
+        self.extent = tuple(float(v) for v in extent)
+        self.bins = (int(bins[0]), int(bins[1]))
+        x_min, x_max, y_min, y_max = self.extent
+        self._scale = np.array([self.bins[0] / (x_max - x_min), self.bins[1] / (y_max - y_min)])
+        self._origin = np.array([x_min, y_min])
+        self.counts = np.zeros(self.bins, dtype=np.int64)
+        self.samples = 0
+        self.outside = 0
+
+    def add(self, positions):
+        """
+        Bin an array of positions.
+        Args:
+            positions (np.ndarray): Shape (n, 2) of (x, y).
+        """
+        positions = np.asarray(positions, dtype=np.float64).reshape(-1, 2)
+        if not len(positions):
+            return
+        counts, inside = self._bin(positions)
+        self.counts += counts
+        self.samples += len(positions)
+        self.outside += len(positions) - inside
+
+    def cells(self, positions):
+        """
+        Flat bin index (i * bins_y + j) of the positions inside the extent.
+        Args:
+            positions (np.ndarray): Shape (n, 2) float array of (x, y).
+        Returns:
+            tuple: (bin index of every position inside, boolean mask of those positions)
+        """
+        cells = np.floor((positions - self._origin) * self._scale).astype(np.int64)
+        # Points on the upper boundary belong to the last bin, as in np.histogram2d
+        for axis, (high, bins) in enumerate(((self.extent[1], self.bins[0]), (self.extent[3], self.bins[1]))):
+            cells[positions[:, axis] == high, axis] = bins - 1
+        inside = ((cells[:, 0] >= 0) & (cells[:, 0] < self.bins[0])
+                  & (cells[:, 1] >= 0) & (cells[:, 1] < self.bins[1]))
+        return cells[inside, 0] * self.bins[1] + cells[inside, 1], inside
+
+    def _bin(self, positions):
+        # Per-bin counts of an (n, 2) float array and how many positions fell inside the extent
+        flat, _ = self.cells(positions)
+        return np.bincount(flat, minlength=self.counts.size).reshape(self.bins), len(flat)
+
+    def __bool__(self):
+        return self.samples > 0
+
+    def values(self):
+        """
+        Counts to draw: every position was binned, so the grid itself.
+        """
+        return self.counts
+
+    def relative_error(self):
+        """
+        Share of the heatmap misplaced against the full collection; 0 since nothing was sampled.
+        """
+        return 0.0
+
+    def edges(self):
+        """
+        Bin edges along x and y, as returned by np.histogram2d.
+        """
+        x_min, x_max, y_min, y_max = self.extent
+        return np.linspace(x_min, x_max, self.bins[0] + 1), np.linspace(y_min, y_max, self.bins[1] + 1)
+
+    def draw(self, ax, min_count=None, **imshow_options):
+        """
+        Draw the grid as an image on matplotlib axes, in network coordinates.
+        Args:
+            ax: Matplotlib axes.
+            min_count (int): Leave bins with fewer samples blank, like hist2d's cmin.
+            imshow_options: Passed to ax.imshow, e.g. cmap.
+        Returns:
+            The AxesImage, e.g. for a colorbar.
+        """
+        counts = self.values().T
+        if min_count is not None:
+            counts = np.ma.masked_less(counts, min_count)
+        imshow_options.setdefault("interpolation", "nearest")
+        imshow_options.setdefault("aspect", "auto")
+        return ax.imshow(counts, origin="lower", extent=self.extent, **imshow_options)
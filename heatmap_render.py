@@ -0,0 +1,254 @@
+import os
+import struct
+import sys
+import zlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import get_context
+
+import numpy as np
+
+from heatmap_grid import DEFAULT_BINS, HeatmapGrid, network_boundary
+
+# Colour stops of the colormaps the reports use, for drawing without matplotlib
+# (ColorBrewer YlOrRd and Reds, matplotlib's hot as (position, colour) pairs)
+COLORMAP_ANCHORS = {
+    "YlOrRd": ["#ffffcc", "#ffeda0", "#fed976", "#feb24c", "#fd8d3c", "#fc4e2a", "#e31a1c", "#bd0026", "#800026"],
+    "Reds": ["#fff5f0", "#fee0d2", "#fcbba1", "#fc9272", "#fb6a4a", "#ef3b2c", "#cb181d", "#a50f15", "#67000d"],
+    "hot": [(0.0, "#0a0000"), (0.365, "#ff0000"), (0.746, "#ffff00"), (1.0, "#ffffff")],
+}
+
+# Colour of bins left blank (below min_count), RGBA
+BACKGROUND = (255, 255, 255, 255)
+
+# Records binned per pass when building time-lapse frames from a trajectory store
+FRAME_CHUNK_RECORDS = 2_000_000
+
+
+def colormap_lut(name, size=256):
+    """
+    Lookup table of a colormap, so values are coloured by indexing instead of
+    calling the colormap per image.
+    Args:
+        name (str): Matplotlib colormap name; without matplotlib one of COLORMAP_ANCHORS.
+        size (int): Number of colours.
+    Returns:
+        np.ndarray: Shape (size, 4) uint8 RGBA.
+    """
+    try:
+        from matplotlib import colormaps
+        return colormaps[name].resampled(size)(np.arange(size), bytes=True)
+    except ImportError:
+        pass
+    if name not in COLORMAP_ANCHORS:
+        raise ValueError(f"Colormap '{name}' needs matplotlib, without it use one of {', '.join(COLORMAP_ANCHORS)}")
+    anchors = COLORMAP_ANCHORS[name]
+    if isinstance(anchors[0], str):
+        anchors = list(zip(np.linspace(0, 1, len(anchors)), anchors))
+    positions = np.array([position for position, _ in anchors])
+    colours = np.array([[int(colour[i:i + 2], 16) for i in (1, 3, 5)] for _, colour in anchors], dtype=np.float64)
+    x = np.linspace(0, 1, size)
+    lut = np.full((size, 4), 255, dtype=np.uint8)
+    for channel in range(3):
+        lut[:, channel] = np.round(np.interp(x, positions, colours[:, channel]))
+    return lut
+
+
+def grid_to_rgba(values, lut, vmax=None, min_count=None, scale=1, background=BACKGROUND):
+    """
+    Colour a heatmap grid into an image array, oriented as HeatmapGrid.draw() shows it
+    (x to the right, y up).
+    Args:
+        values (np.ndarray): Shape (bins_x, bins_y), e.g. HeatmapGrid.values().
+        lut (np.ndarray): Colours from colormap_lut().
+        vmax (float): Value of the last colour; the grid's maximum if None. Give the
+            same vmax to frames that are compared, e.g. a time-lapse.
+        min_count (float): Bins below it get the background, like hist2d's cmin.
+        scale (int): Pixels per bin along each axis.
+    Returns:
+        np.ndarray: Shape (bins_y * scale, bins_x * scale, 4) uint8.
+    """
+    values = np.asarray(values, dtype=np.float64).T[::-1]
+    low = 0.0 if min_count is None else float(min_count)
+    if vmax is None:
+        vmax = values.max(initial=0.0)
+    span = vmax - low if vmax > low else 1.0
+    index = np.clip((values - low) * ((len(lut) - 1) / span), 0, len(lut) - 1).astype(np.intp)
+    rgba = lut[index]
+    if min_count is not None:
+        rgba[values < min_count] = background
+    if scale > 1:
+        rgba = np.repeat(np.repeat(rgba, scale, axis=0), scale, axis=1)
+    return rgba
+
+
+def write_png(path, image, compression=1):
+    """
+    Write an RGB or RGBA uint8 image array as a PNG with zlib only, no imaging library.
+    Args:
+        path (str): Output file path.
+        image (np.ndarray): Shape (height, width, 3 or 4) uint8.
+        compression (int): zlib level; heatmaps are mostly flat colour, so 1 is small and fast.
+    """
+    image = np.ascontiguousarray(image, dtype=np.uint8)
+    height, width, channels = image.shape
+    colour_type = {3: 2, 4: 6}[channels]
+    # Every row starts with filter type 0 (none)
+    raw = np.zeros((height, width * channels + 1), dtype=np.uint8)
+    raw[:, 1:] = image.reshape(height, -1)
+
+    def chunk(tag, data):
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data) & 0xFFFFFFFF)
+
+    with open(path, "wb") as f:
+        f.write(b"\x89PNG\r\n\x1a\n")
+        f.write(chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, colour_type, 0, 0, 0)))
+        f.write(chunk(b"IDAT", zlib.compress(raw.tobytes(), compression)))
+        f.write(chunk(b"IEND", b""))
+
+
+class HeatmapFigure:
+    """
+    One matplotlib figure reused for many heatmaps with the same look.
+
+    Building a pyplot figure, axes and colour bar per heatmap costs more than
+    drawing it; here they are built once on an Agg canvas (no GUI backend)
+    and every render() only swaps the image data, extent, colour limits and
+    title before saving or rasterizing.
+    """
+
+    def __init__(self, cmap="YlOrRd", label="Vehicle samples", figsize=(10, 8), grid=True):
+        """
+        Args:
+            cmap (str): Colormap of the heatmaps.
+            label (str): Colour bar label.
+            grid (bool): Draw grid lines over the heatmap.
+        """
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.figure import Figure
+
+        self.figure = Figure(figsize=figsize)
+        self.canvas = FigureCanvasAgg(self.figure)
+        self.axes = self.figure.add_subplot()
+        self.image = self.axes.imshow(np.zeros((1, 1)), origin="lower", cmap=cmap, interpolation="nearest",
+                                      aspect="auto")
+        self.colorbar = self.figure.colorbar(self.image, ax=self.axes, label=label)
+        self.axes.set_xlabel("X-coordinate")
+        self.axes.set_ylabel("Y-coordinate")
+        self.axes.grid(grid)
+
+    def render(self, grid, title, filename=None, min_count=None, vmax=None):
+        """
+        Draw a grid into the figure.
+        Args:
+            grid (HeatmapGrid): Heatmap to draw.
+            title (str): Axes title.
+            filename (str): Save the figure there; if None, return the rasterized figure.
+            min_count (int): Leave bins with fewer samples blank.
+            vmax (float): Fixed top of the colour scale; the grid's maximum if None.
+        Returns:
+            np.ndarray: Shape (height, width, 4) uint8 if no filename was given.
+        """
+        values = grid.values().T
+        if min_count is not None:
+            values = np.ma.masked_less(values, min_count)
+        self.image.set_data(values)
+        self.image.set_extent(grid.extent)
+        self.axes.set_xlim(grid.extent[0], grid.extent[1])
+        self.axes.set_ylim(grid.extent[2], grid.extent[3])
+        self.image.autoscale()
+        if vmax is not None:
+            self.image.set_clim(vmax=vmax)
+        self.axes.set_title(title)
+        if filename is not None:
+            self.figure.savefig(filename)
+            return None
+        self.canvas.draw()
+        return np.asarray(self.canvas.buffer_rgba()).copy()
+
+
+def time_lapse_grids(store, every, extent, bins=DEFAULT_BINS, chunk_records=FRAME_CHUNK_RECORDS):
+    """
+    Heatmap of every window of N timesteps of a trajectory store, in one
+    bincount over (frame, bin) per chunk of records instead of a histogram per frame.
+    Args:
+        store (TrajectoryStore): Converted FCD output.
+        every (int): Timesteps per frame.
+        extent (tuple): (x_min, x_max, y_min, y_max), e.g. network_boundary().
+    Returns:
+        tuple: (counts of shape (frames, bins_x, bins_y), start time of every frame)
+    """
+    grid = HeatmapGrid(extent, bins)
+    times, offsets = store.columns["times"], store.columns["time_offsets"]
+    frames = (len(times) + every - 1) // every
+    cells = grid.counts.size
+    counts = np.zeros(frames * cells, dtype=np.int64)
+    # Frame of every record from the timestep offsets
+    frame_bounds = np.asarray(offsets[::every][1:]) if frames > 1 else np.zeros(0, dtype=np.int64)
+    x, y = store.columns["x"], store.columns["y"]
+    for start in range(0, len(store), chunk_records):
+        stop = min(start + chunk_records, len(store))
+        positions = np.column_stack((x[start:stop], y[start:stop])).astype(np.float64)
+        flat, inside = grid.cells(positions)
+        frame = np.searchsorted(frame_bounds, np.arange(start, stop)[inside], side="right")
+        counts += np.bincount(frame * cells + flat, minlength=counts.size)
+    return counts.reshape((frames,) + grid.bins), np.asarray(times[::every])
+
+
+def _render_chunk(frames, paths, cmap, vmax, min_count, scale, compression):
+    # Worker: colour and write a run of frames with one lookup table
+    lut = colormap_lut(cmap)
+    for values, path in zip(frames, paths):
+        write_png(path, grid_to_rgba(values, lut, vmax, min_count, scale), compression)
+    return len(paths)
+
+
+def render_frames(frames, paths, workers=None, cmap="YlOrRd", vmax=None, min_count=None, scale=8, compression=1):
+    """
+    Write heatmap frames as PNGs on one fixed colour scale, split across processes.
+    Args:
+        frames (np.ndarray): Shape (frames, bins_x, bins_y), e.g. from time_lapse_grids().
+        paths (list): Output file of every frame.
+        workers (int): Processes; 1 renders in this process. Default: CPU count.
+        vmax (float): Top of the colour scale; the largest bin of all frames if None.
+    Returns:
+        int: Frames written.
+    """
+    if vmax is None:
+        vmax = float(frames.max(initial=0))
+    workers = min(workers or os.cpu_count() or 1, len(paths)) or 1
+    if workers == 1:
+        return _render_chunk(frames, paths, cmap, vmax, min_count, scale, compression)
+    # Contiguous runs, a few per worker so a slow one does not hold up the rest
+    bounds = np.linspace(0, len(paths), workers * 4 + 1).astype(int)
+    written = 0
+    with ProcessPoolExecutor(workers, mp_context=get_context("spawn")) as executor:
+        futures = [executor.submit(_render_chunk, frames[first:last], paths[first:last], cmap, vmax, min_count,
+                                   scale, compression)
+                   for first, last in zip(bounds[:-1], bounds[1:]) if last > first]
+        for future in as_completed(futures):
+            written += future.result()
+    return written
+
+
+# Main Execution
+if __name__ == "__main__":
+    from trajectory_store import load_trajectory_store
+
+    fcd_file = sys.argv[1] if len(sys.argv) > 1 else "baseline_trajectory.xml"
+    steps_per_frame = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    workers = int(sys.argv[3]) if len(sys.argv) > 3 else None
+    net_file = "osm.net.xml"
+    output_dir = "REPORTS/timelapse"
+
+    store = load_trajectory_store(fcd_file)
+    if os.path.exists(net_file):
+        extent = network_boundary(net_file)
+    else:
+        x, y = store.columns["x"], store.columns["y"]
+        extent = (float(x.min()), float(x.max()), float(y.min()), float(y.max()))
+    frames, start_times = time_lapse_grids(store, steps_per_frame, extent)
+    os.makedirs(output_dir, exist_ok=True)
+    paths = [os.path.join(output_dir, f"frame_{i:04d}.png") for i in range(len(frames))]
+    written = render_frames(frames, paths, workers)
+    print(f"{written} frames of {steps_per_frame} steps ({start_times[0]:.0f}-{store.columns['times'][-1]:.0f} s) "
+          f"saved to {output_dir}")
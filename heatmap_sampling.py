@@ -0,0 +1,345 @@
+import random
+
+import numpy as np
+
+from heatmap_grid import DEFAULT_BINS, HeatmapGrid
+
+# z-score of the error bounds reported with sampled heatmaps (95 % two-sided)
+ERROR_Z = 1.96
+
+
+class SampledHeatmapGrid(HeatmapGrid):
+    """
+    HeatmapGrid filled from a sample of a stage's positions.
+
+    Every step of the stage is counted (the vehicle count is free from the
+    subscriptions), but only sampled positions are binned into counts.
+    values() estimates the histogram a full collection would have given.
+    Subclasses implement it together with variance(), the variance of
+    every bin of that estimate, for their sampling design; error_bounds()
+    and relative_error() are derived from it. Where the design's estimate
+    is known to run low, error_is_lower_bound is set and the error is
+    shown as "at least".
+    """
+
+    # Set where the variance estimate understates the error, so relative_error() is only a lower bound
+    error_is_lower_bound = False
+
+    def __init__(self, extent, bins=DEFAULT_BINS):
+        super().__init__(extent, bins)
+        self.steps = 0  # Steps of the stage, sampled or not
+        self.sampled_steps = 0
+        self.vehicle_steps = 0  # Positions a full collection would read
+
+    def count_step(self, vehicles):
+        """
+        Count a step of the stage and its vehicles, whether it is sampled or not.
+        """
+        self.steps += 1
+        self.vehicle_steps += vehicles
+
+    def error_bounds(self, z=ERROR_Z):
+        """
+        Half-width of the confidence interval of every bin against the full collection.
+        """
+        return z * np.sqrt(self.variance())
+
+    def relative_error(self):
+        """
+        Expected share of the heatmap's mass that is misplaced against the full
+        collection: the summed expected absolute bin errors over the estimated total.
+        A lower bound when error_is_lower_bound is set.
+        """
+        total = self.values().sum()
+        errors = np.sqrt(2 / np.pi) * np.sqrt(self.variance()).sum()
+        if total == 0:
+            return 0.0 if errors == 0 else float("inf")
+        return float(errors / total)
+
+    @property
+    def positions_skipped(self):
+        """
+        Positions of the stage that were not binned.
+        """
+        return self.vehicle_steps - self.samples
+
+    def error_label(self, precision=0):
+        """
+        Expected error for titles and summaries, e.g. "expected error 4%" or "expected error at least 4%".
+        """
+        bound = "at least " if self.error_is_lower_bound else ""
+        return f"expected error {bound}{self.relative_error():.{precision}%}"
+
+
+class StepSampleGrid(SampledHeatmapGrid):
+    """
+    All vehicle positions on a sample of the steps.
+
+    Each sampled step stands for the steps since the previous sample; the
+    stage histogram is the weighted mean of the sampled step histograms
+    times the number of steps. Its variance comes from the differences
+    between successive samples (the estimator for systematic samples of a
+    time series), so a slow trend in the traffic does not count as
+    sampling error. Only running sums are kept, so memory stays constant.
+    """
+
+    def __init__(self, extent, bins=DEFAULT_BINS):
+        super().__init__(extent, bins)
+        self.weights = 0
+        self.weights_squared = 0
+        self._last_sample = 0  # self.steps at the previous sample
+        self._weighted_counts = np.zeros(self.bins)
+        self._previous = None
+        self._differences = np.zeros(self.bins)  # Sum of squared differences of successive samples
+
+    def add_sample(self, positions):
+        """
+        Bin the positions of all vehicles of the step counted last.
+        Args:
+            positions (np.ndarray): Shape (n, 2) of (x, y).
+        """
+        positions = np.asarray(positions, dtype=np.float64).reshape(-1, 2)
+        counts, inside = self._bin(positions)
+        self.counts += counts
+        self.samples += len(positions)
+        self.outside += len(positions) - inside
+        self.sampled_steps += 1
+        weight = self.steps - self._last_sample
+        self._last_sample = self.steps
+        self.weights += weight
+        self.weights_squared += weight * weight
+        self._weighted_counts += weight * counts
+        if self._previous is not None:
+            self._differences += (counts - self._previous) ** 2
+        self._previous = counts
+
+    def values(self):
+        """
+        Estimated full-collection histogram of the stage.
+        """
+        if self.weights == 0:
+            return np.zeros(self.bins)
+        return self._weighted_counts * (self.steps / self.weights)
+
+    def variance(self):
+        """
+        Estimated variance of every bin of values(); infinite while fewer than two
+        steps are sampled and some were skipped.
+        """
+        n = self.sampled_steps
+        if n >= self.steps:
+            return np.zeros(self.bins)
+        if n < 2:
+            return np.full(self.bins, np.inf)
+        step_variance = self._differences / (2 * (n - 1))
+        return (self.steps / self.weights) ** 2 * self.weights_squared * (1 - n / self.steps) * step_variance
+
+
+class VehicleSampleGrid(SampledHeatmapGrid):
+    """
+    Positions of a reservoir of the vehicles seen in a stage (algorithm R),
+    binned on every step.
+
+    Every vehicle is offered to the reservoir the first time it is seen in
+    the stage, so a member's counts cover its whole time in the stage and
+    the members are a uniform sample of the vehicles seen so far. The
+    members are the sampling units, so each one's counts are kept in its
+    own row (size x bins, cleared when it is evicted): the histogram is the
+    members' counts scaled to all vehicle-steps and its variance that of a
+    ratio estimator over vehicles. Memory depends on the reservoir size and
+    the bins, not on the length of the run.
+
+    The variance is a lower bound: bins no member visited count as exact,
+    and neither the evictions during the stage nor the members that only
+    cover part of it are accounted for. On synthetic traffic a reservoir
+    of 300 reported 49% expected error against an actual 62%.
+    """
+
+    # See the class docstring
+    error_is_lower_bound = True
+
+    def __init__(self, extent, bins=DEFAULT_BINS, size=500):
+        super().__init__(extent, bins)
+        self.size = size
+        self.seen = set()
+        self.members = []
+        self.member_counts = np.zeros((size, self.bins[0] * self.bins[1]), dtype=np.int32)
+        self.member_steps = np.zeros(size, dtype=np.int64)
+
+    def add_step(self, data, rng):
+        """
+        Count a step, offer its new vehicles to the reservoir and bin the members' positions.
+        Args:
+            data (StepData): The step.
+            rng (random.Random): Generator deciding which vehicles enter the reservoir.
+        """
+        self.count_step(data.count)
+        self.sampled_steps += 1
+        for veh_id in data.ids:
+            if veh_id in self.seen:
+                continue
+            self.seen.add(veh_id)
+            if len(self.members) < self.size:
+                self.members.append(veh_id)
+                continue
+            slot = rng.randrange(len(self.seen))
+            if slot < self.size:
+                self.counts -= self.member_counts[slot].reshape(self.bins)
+                self.members[slot] = veh_id
+                self.member_counts[slot] = 0
+                self.member_steps[slot] = 0
+
+        slots, rows = [], []
+        for slot, veh_id in enumerate(self.members):
+            row = data.index(veh_id)
+            if row is not None:
+                slots.append(slot)
+                rows.append(row)
+        if not rows:
+            return
+        slots = np.array(slots)
+        flat, inside = self.cells(data.positions[rows])
+        np.add.at(self.member_counts, (slots[inside], flat), 1)
+        np.add.at(self.member_steps, slots, 1)
+        self.counts += np.bincount(flat, minlength=self.counts.size).reshape(self.bins)
+        self.samples += len(rows)
+        self.outside += len(rows) - len(flat)
+
+    def values(self):
+        """
+        Estimated full-collection histogram of the stage.
+        """
+        member_steps = self.member_steps.sum()
+        if member_steps == 0:
+            return np.zeros(self.bins)
+        return self.counts * (self.vehicle_steps / member_steps)
+
+    def variance(self):
+        """
+        Estimated variance of every bin of values(), a lower bound; zero while every
+        vehicle seen is a member.
+        """
+        m, seen = len(self.members), len(self.seen)
+        if m >= seen:
+            return np.zeros(self.bins)
+        steps = self.member_steps[:m].astype(np.float64)
+        if m < 2 or steps.sum() == 0:
+            return np.full(self.bins, np.inf)
+        counts = self.member_counts[:m]
+        ratio = counts.sum(axis=0) / steps.sum()
+        residuals = ((counts - steps[:, None] * ratio) ** 2).sum(axis=0)
+        scale = (self.vehicle_steps / steps.sum()) ** 2
+        return (scale * (1 - m / seen) * m / (m - 1) * residuals).reshape(self.bins)
+
+
+class SamplingPolicy:
+    """
+    Decides which positions StageHeatmaps bins into a stage's grid.
+
+    new_grid() makes the grid whose estimator fits the policy's design and
+    sample() is called for every step of the stage. Step policies only
+    override select(), True to bin the step, and optionally observe(),
+    called with the grid after a sample was added, e.g. to adapt the rate.
+    """
+
+    def new_grid(self, extent, bins):
+        return StepSampleGrid(extent, bins)
+
+    def sample(self, data, stage, grid):
+        grid.count_step(data.count)
+        if self.select(data, stage):
+            grid.add_sample(data.positions)
+            self.observe(stage, grid)
+
+    def select(self, data, stage):
+        return True
+
+    def observe(self, stage, grid):
+        pass
+
+    def describe(self):
+        return type(self).__name__
+
+
+class EveryKthStep(SamplingPolicy):
+    """
+    All vehicles on every k-th step.
+    """
+
+    def __init__(self, k):
+        self.k = k
+
+    def select(self, data, stage):
+        return data.step % self.k == 0
+
+    def describe(self):
+        return f"every {self.k}th step"
+
+
+class ReservoirSampling(SamplingPolicy):
+    """
+    A fixed-size uniform sample of the vehicles seen in each stage, followed
+    on every step (VehicleSampleGrid), which keeps their trajectories whole.
+    """
+
+    def __init__(self, size, seed=None):
+        """
+        Args:
+            size (int): Vehicles kept per stage.
+            seed (int): Seed of the policy's own random generator, so it does not
+                consume the random numbers of the simulation's policies.
+        """
+        self.size = size
+        self.random = random.Random(seed)
+
+    def new_grid(self, extent, bins):
+        return VehicleSampleGrid(extent, bins, self.size)
+
+    def sample(self, data, stage, grid):
+        grid.add_step(data, self.random)
+
+    def describe(self):
+        return f"reservoir of {self.size} vehicles per stage"
+
+
+class AdaptiveSampling(SamplingPolicy):
+    """
+    All vehicles on steps spaced by an interval that halves while the stage's
+    relative error is above target (the step histograms vary a lot) and
+    doubles again while it is below, between min_interval and max_interval.
+
+    Sampling stops densifying as soon as the estimate drops below target, so
+    the estimate of the stage is biased low and its grid reports the error as
+    a lower bound: at a 5% target the actual error was 6-8% on synthetic traffic.
+    """
+
+    def __init__(self, target_error=0.05, min_interval=1, max_interval=16):
+        self.target_error = target_error
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.intervals = {}
+        self.next_step = {}
+
+    def new_grid(self, extent, bins):
+        grid = super().new_grid(extent, bins)
+        grid.error_is_lower_bound = True
+        return grid
+
+    def select(self, data, stage):
+        interval = self.intervals.setdefault(stage, self.min_interval)
+        if data.step < self.next_step.get(stage, data.step):
+            return False
+        self.next_step[stage] = data.step + interval
+        return True
+
+    def observe(self, stage, grid):
+        interval = self.intervals[stage]
+        if grid.relative_error() > self.target_error:
+            interval = max(self.min_interval, interval // 2)
+        else:
+            interval = min(self.max_interval, interval * 2)
+        self.next_step[stage] += interval - self.intervals[stage]
+        self.intervals[stage] = interval
+
+    def describe(self):
+        return f"adaptive, {self.min_interval} to {self.max_interval} steps, target error {self.target_error:.0%}"
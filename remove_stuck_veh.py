@@ -1,3 +1,4 @@
+from sumo_backend import sumo_command  # First, so that SUMO_BACKEND=libsumo can stand in for traci
 import random
 import traci
 
@@ -24,7 +25,7 @@ def enforce_vehicle_limit(vehicle_limit):
         traci.simulation.setParameter("", "insertionsAllowed", "false")
 
 # SUMO Simulation Loop
-sumo_cmd = ["sumo-gui", "-c", "osm_adjusted.sumocfg"]  # Use sumo-gui for visualization
+sumo_cmd = sumo_command("osm_adjusted.sumocfg")  # sumo-gui for visualization unless SUMO_BACKEND says otherwise
 traci.start(sumo_cmd)
 step = 0
 
@@ -0,0 +1,90 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+# Columnar formats in the order they are tried when writing and looked for when loading
+TABLE_FORMATS = (".parquet", ".npz")
+
+
+def write_table(table, path_base):
+    """
+    Write a report table in a typed columnar format: Parquet, or NPZ (one
+    array per column) when no Parquet engine is installed.
+    Args:
+        table (pd.DataFrame): Columns of plain numbers and strings; the index is not kept.
+        path_base (str): Output path without extension, e.g. "REPORTS/passenger_car_report".
+    Returns:
+        str: Path written.
+    """
+    os.makedirs(os.path.dirname(path_base) or ".", exist_ok=True)
+    try:
+        path = path_base + ".parquet"
+        table.to_parquet(path, index=False)
+    except ImportError:
+        path = path_base + ".npz"
+        columns = {}
+        for name, column in table.items():
+            values = column.to_numpy()
+            # Strings as fixed-width unicode, so the file loads without pickle
+            columns[name] = values.astype(str) if values.dtype == object else values
+        np.savez(path, **columns)
+    return path
+
+
+def read_table(path):
+    """
+    Read a table written by write_table(), or a CSV/Excel file (first sheet).
+    Returns:
+        pd.DataFrame
+    """
+    if path.endswith(".parquet"):
+        return pd.read_parquet(path)
+    if path.endswith(".npz"):
+        with np.load(path, allow_pickle=False) as columns:
+            return pd.DataFrame({name: columns[name] for name in columns.files})
+    if path.endswith(".csv"):
+        return pd.read_csv(path)
+    return pd.read_excel(path)
+
+
+def find_table(path_base, fallbacks=(".xlsx", ".csv")):
+    """
+    Existing file of a report: the columnar formats first, then the fallbacks.
+    Args:
+        path_base (str): Path without extension.
+    Returns:
+        str: Path of the first format that exists.
+    """
+    for extension in TABLE_FORMATS + tuple(fallbacks):
+        if os.path.exists(path_base + extension):
+            return path_base + extension
+    raise FileNotFoundError(f"No {path_base} report in any of {', '.join(TABLE_FORMATS + tuple(fallbacks))}")
+
+
+def write_excel(table, path, sheets=None, column="selection"):
+    """
+    Write the rows of a table to an Excel workbook, one sheet per value of a column.
+    Only for reading by people: it is slow and loses the column types.
+    Args:
+        table (pd.DataFrame): Table as written by write_table().
+        path (str): .xlsx file.
+        sheets (dict): {column value: sheet name}, in sheet order; every value under its own name if None.
+        column (str): Column whose values pick the sheet; dropped from the sheets.
+    """
+    if sheets is None:
+        sheets = {value: str(value) for value in table[column].unique()}
+    with pd.ExcelWriter(path) as writer:
+        for value, sheet_name in sheets.items():
+            rows = table[table[column] == value].drop(columns=column)
+            rows.to_excel(writer, sheet_name=sheet_name, index=False)
+
+
+# Main Execution
+if __name__ == "__main__":
+    # Excel copy of a columnar report on demand, e.g. REPORTS/passenger_car_report
+    path_base = sys.argv[1] if len(sys.argv) > 1 else "REPORTS/passenger_car_report"
+    table = read_table(find_table(path_base, fallbacks=()))
+    write_excel(table, path_base + ".xlsx")
+    print(f"{len(table)} rows saved to {path_base}.xlsx")
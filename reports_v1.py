@@ -1,9 +1,10 @@
-import traci
-import random
+from sumo_backend import sumo_command  # First, so that SUMO_BACKEND=libsumo can stand in for traci
 import matplotlib.pyplot as plt
+from fleet_telemetry import FleetTelemetry
+from simulation_runner import RemovalPolicy, ReportSink, SimulationRunner, TrafficTrends
 
 # Parameters
-sumo_cmd = ["sumo-gui", "-c", "osm_adjusted.sumocfg"]
+sumo_cmd = sumo_command("osm_adjusted.sumocfg")
 vehicle_limit = 4000  # Maximum allowed vehicles in the simulation
 max_steps = 1800  # Total simulation steps
 high_removal_rate = 0.03  # Initial removal rate (3%)
@@ -12,23 +13,8 @@ removal_interval = 5  # Perform removal every 5 steps
 free_flow_range = (1500, 1600)  # Range of vehicles for minimal traffic
 
 # Data storage
-vehicle_count_history = []
-speed_history = []
-vehicles_inserted = 0
-vehicles_removed = 0
-
-def remove_random_vehicles(rate):
-    """
-    Randomly remove a percentage of vehicles from the simulation.
-    Args:
-        rate (float): Percentage of vehicles to remove.
-    """
-    vehicle_ids = traci.vehicle.getIDList()
-    num_to_remove = int(len(vehicle_ids) * rate)
-    vehicles_to_remove = random.sample(vehicle_ids, min(num_to_remove, len(vehicle_ids)))
-    for veh_id in vehicles_to_remove:
-        traci.vehicle.remove(veh_id)
-    print(f"Removed {len(vehicles_to_remove)} vehicles.")
+telemetry = FleetTelemetry(capacity=vehicle_limit)  # Per-step fleet speeds/positions via subscriptions
+trends = TrafficTrends(log_every=1)  # Vehicle count and speed per step, inserted/removed totals
 
 def plot_trends(vehicle_count_history, speed_history, steps):
     """
@@ -56,63 +42,36 @@ def plot_trends(vehicle_count_history, speed_history, steps):
     plt.tight_layout()
     plt.show()
 
-# Start the simulation
-traci.start(sumo_cmd)
-step = 0
-reduction_mechanism_activated = False
-
-while step < max_steps:
-    traci.simulationStep()  # Progress simulation by one step
-    
-    # Collect current vehicle statistics
-    current_vehicles = traci.vehicle.getIDCount()
-    vehicle_count_history.append(current_vehicles)
-    avg_speed = (
-        sum(traci.vehicle.getSpeed(veh_id) for veh_id in traci.vehicle.getIDList())
-        / current_vehicles if current_vehicles > 0 else 0
-    )
-    speed_history.append(avg_speed)
-    vehicles_inserted += traci.simulation.getDepartedNumber()
-    vehicles_removed += traci.simulation.getArrivedNumber()
-
-    print(f"Step {step}: {current_vehicles} vehicles, Avg Speed: {avg_speed:.2f} m/s")
-
-    if current_vehicles >= vehicle_limit and not reduction_mechanism_activated:
-        # Activate reduction mechanisms when the limit is reached
-        print(f"Vehicle limit reached: {vehicle_limit}. Initiating reduction mechanisms.")
-        reduction_mechanism_activated = True
-
-    if reduction_mechanism_activated and step % removal_interval == 0:
-        # Adjust removal rate dynamically based on the current number of vehicles
-        if current_vehicles > free_flow_range[1]:
-            print("Applying high removal rate to reduce congestion.")
-            remove_random_vehicles(high_removal_rate)
-        elif free_flow_range[0] <= current_vehicles <= free_flow_range[1]:
-            print("Applying reduced removal rate to maintain free flow.")
-            remove_random_vehicles(low_removal_rate)
-
-    step += 1
-
-traci.close()
-
-# Generate report
-print("Simulation complete. Generating report...")
-report_file = "traffic_simulation_report.txt"
-with open(report_file, "w") as f:
-    f.write("Traffic Simulation Report\n")
-    f.write("=" * 30 + "\n")
-    f.write(f"Total Steps: {max_steps}\n")
-    f.write(f"Maximum Vehicles in Network: {max(vehicle_count_history)}\n")
-    f.write(f"Average Speed Over Simulation: {sum(speed_history) / len(speed_history):.2f} m/s\n")
-    f.write(f"Vehicles Inserted: {vehicles_inserted}\n")
-    f.write(f"Vehicles Removed: {vehicles_removed}\n")
-    f.write("\nTraffic Flow Over Time:\n")
-    for idx, count in enumerate(vehicle_count_history):
-        if idx % 100 == 0:  # Print every 100 steps
-            f.write(f"Step {idx}: {count} vehicles\n")
-
-print(f"Report saved to {report_file}.")
-print("Displaying traffic trends...")
+def write_report(runner):
+    """
+    Write the text report and display the traffic trends.
+    """
+    # Generate report
+    print("Simulation complete. Generating report...")
+    report_file = "traffic_simulation_report.txt"
+    with open(report_file, "w") as f:
+        f.write("Traffic Simulation Report\n")
+        f.write("=" * 30 + "\n")
+        f.write(f"Total Steps: {max_steps}\n")
+        f.write(f"Maximum Vehicles in Network: {trends.max_vehicles}\n")
+        f.write(f"Average Speed Over Simulation: {trends.mean_speed:.2f} m/s\n")
+        f.write(f"Vehicles Inserted: {trends.vehicles_inserted}\n")
+        f.write(f"Vehicles Removed: {trends.vehicles_removed}\n")
+        f.write("\nTraffic Flow Over Time:\n")
+        for idx, count in enumerate(trends.vehicle_count_history):
+            if idx % 100 == 0:  # Print every 100 steps
+                f.write(f"Step {idx}: {count} vehicles\n")
+
+    print(f"Report saved to {report_file}.")
+    print("Displaying traffic trends...")
+
+    # Display trends
+    plot_trends(trends.vehicle_count_history, trends.speed_history, max_steps)
 
-# Display trends
-plot_trends(vehicle_count_history, speed_history, max_steps)
+# Start the simulation
+runner = SimulationRunner(sumo_cmd, max_steps, telemetry=telemetry, hooks=[
+    trends,
+    RemovalPolicy(vehicle_limit, high_removal_rate, low_removal_rate, free_flow_range, every=removal_interval),
+    ReportSink(write_report),
+])
+runner.run()
@@ -1,151 +1,125 @@
-import traci
-import random
+from sumo_backend import sumo_command  # First, so that SUMO_BACKEND=libsumo can stand in for traci
 import matplotlib.pyplot as plt
-import numpy as np
+from edge_density import EDGE_METRICS, draw_edge_map
+from fleet_telemetry import FleetTelemetry
+from routing_graph import load_routing_graph
+from simulation_runner import (RemovalPolicy, ReportSink, SimulationRunner, StageEdgeDensity, StageHeatmaps,
+                               TrafficTrends)
 
 # Parameters
-sumo_cmd = ["sumo-gui", "-c", "osm_adjusted.sumocfg"]
+sumo_cmd = sumo_command("osm_adjusted.sumocfg")
 vehicle_limit = 4200  # Maximum allowed vehicles in the simulation
 max_steps = 1800  # Total simulation steps
 high_removal_rate = 0.03  # Initial removal rate (3%)
 low_removal_rate = 0.005  # Reduced removal rate (0.5%)
 removal_interval = 5  # Perform removal every 5 steps
 free_flow_range = (2000, 2300)  # Range of vehicles for minimal traffic
+net_file = "osm.net.xml"  # Network of the heatmap extent and the edge maps
 
 # Data storage
-vehicle_count_history = []
-speed_history = []
-vehicles_inserted = 0
-vehicles_removed = 0
-heatmap_data_start = []
-heatmap_data_peak = []
-heatmap_data_offpeak = []
+telemetry = FleetTelemetry(capacity=vehicle_limit)  # Per-step fleet speeds/positions via subscriptions
+trends = TrafficTrends(log_every=1)  # Vehicle count and speed per step, inserted/removed totals
+captured_peak = False
 
 # Helper Functions
-def remove_random_vehicles(rate):
+def heatmap_stage(data):
     """
-    Randomly remove a percentage of vehicles from the simulation.
-    Args:
-        rate (float): Percentage of vehicles to remove.
+    Stage whose heatmap the step is captured for: the first step, the first
+    step at the vehicle limit (peak) and the last step (off-peak).
     """
-    vehicle_ids = traci.vehicle.getIDList()
-    num_to_remove = int(len(vehicle_ids) * rate)
-    vehicles_to_remove = random.sample(vehicle_ids, min(num_to_remove, len(vehicle_ids)))
-    for veh_id in vehicles_to_remove:
-        traci.vehicle.remove(veh_id)
-    print(f"Removed {len(vehicles_to_remove)} vehicles.")
+    global captured_peak
+    if data.step == 0:  # Start of simulation
+        return "start"
+    if data.count >= vehicle_limit and not captured_peak:  # Peak traffic
+        captured_peak = True
+        return "peak"
+    if data.step == max_steps - 1:  # Off-peak traffic
+        return "offpeak"
+    return None
 
-def collect_vehicle_positions(step, stage):
-    """
-    Collects vehicle positions for heatmap visualization.
-    Args:
-        step (int): Current simulation step.
-        stage (str): The stage of simulation ('start', 'peak', 'offpeak').
-    """
-    positions = [(traci.vehicle.getPosition(veh_id)) for veh_id in traci.vehicle.getIDList()]
-    if stage == "start":
-        heatmap_data_start.extend(positions)
-    elif stage == "peak":
-        heatmap_data_peak.extend(positions)
-    elif stage == "offpeak":
-        heatmap_data_offpeak.extend(positions)
+heatmaps = StageHeatmaps(net_file=net_file)  # Vehicle positions of the captured steps
+edge_maps = StageEdgeDensity()  # Vehicle-seconds, mean speed and occupancy per edge of the captured steps
 
-def generate_heatmap(data, title):
+def generate_heatmap(grid, title):
     """
-    Generates and displays a heatmap.
+    Displays a heatmap.
     Args:
-        data (list): List of vehicle positions as (x, y) coordinates.
+        grid (HeatmapGrid): Vehicle positions binned during the run.
         title (str): Title of the heatmap.
     """
-    if not data:
+    if not grid:
         print(f"No data to generate {title} heatmap.")
         return
-    
-    x, y = zip(*data)
-    heatmap, xedges, yedges = np.histogram2d(x, y, bins=(50, 50))
 
-    plt.imshow(
-        heatmap.T, 
-        origin='lower', 
-        cmap='hot', 
-        interpolation='nearest'
-    )
-    plt.colorbar()
+    image = grid.draw(plt.gca(), cmap='hot')
+    plt.colorbar(image)
     plt.title(title)
     plt.xlabel("X-coordinate")
     plt.ylabel("Y-coordinate")
     plt.show()
 
-# Main Simulation Loop
-traci.start(sumo_cmd)
-step = 0
-reduction_mechanism_activated = False
-captured_peak = False
-
-while step < max_steps:
-    traci.simulationStep()  # Progress simulation by one step
-    
-    # Collect current vehicle statistics
-    current_vehicles = traci.vehicle.getIDCount()
-    vehicle_count_history.append(current_vehicles)
-    avg_speed = (
-        sum(traci.vehicle.getSpeed(veh_id) for veh_id in traci.vehicle.getIDList())
-        / current_vehicles if current_vehicles > 0 else 0
-    )
-    speed_history.append(avg_speed)
-    vehicles_inserted += traci.simulation.getDepartedNumber()
-    vehicles_removed += traci.simulation.getArrivedNumber()
-
-    print(f"Step {step}: {current_vehicles} vehicles, Avg Speed: {avg_speed:.2f} m/s")
-
-    # Collect data for heatmaps
-    if step == 0:  # Start of simulation
-        collect_vehicle_positions(step, "start")
-    elif current_vehicles >= vehicle_limit and not captured_peak:  # Peak traffic
-        collect_vehicle_positions(step, "peak")
-        captured_peak = True
-    elif step == max_steps - 1:  # Off-peak traffic
-        collect_vehicle_positions(step, "offpeak")
-
-    if current_vehicles >= vehicle_limit and not reduction_mechanism_activated:
-        # Activate reduction mechanisms when the limit is reached
-        print(f"Vehicle limit reached: {vehicle_limit}. Initiating reduction mechanisms.")
-        reduction_mechanism_activated = True
-
-    if reduction_mechanism_activated and step % removal_interval == 0:
-        # Adjust removal rate dynamically based on the current number of vehicles
-        if current_vehicles > free_flow_range[1]:
-            print("Applying high removal rate to reduce congestion.")
-            remove_random_vehicles(high_removal_rate)
-        elif free_flow_range[0] <= current_vehicles <= free_flow_range[1]:
-            print("Applying reduced removal rate to maintain free flow.")
-            remove_random_vehicles(low_removal_rate)
-
-    step += 1
-
-traci.close()
+def generate_edge_maps(density, graph, title):
+    """
+    Displays network-shaped maps of vehicle-seconds, mean speed and occupancy per edge.
+    Args:
+        density (EdgeDensity): Edge values of one stage.
+        graph (RoutingGraph): Network whose lane shapes are coloured.
+        title (str): Title of the maps.
+    """
+    if density is None:
+        print(f"No data to generate {title} edge maps.")
+        return
 
-# Generate report
-print("Simulation complete. Generating report...")
-report_file = "traffic_simulation_report.txt"
-with open(report_file, "w") as f:
-    f.write("Traffic Simulation Report\n")
-    f.write("=" * 30 + "\n")
-    f.write(f"Total Steps: {max_steps}\n")
-    f.write(f"Maximum Vehicles in Network: {max(vehicle_count_history)}\n")
-    f.write(f"Average Speed Over Simulation: {sum(speed_history) / len(speed_history):.2f} m/s\n")
-    f.write(f"Vehicles Inserted: {vehicles_inserted}\n")
-    f.write(f"Vehicles Removed: {vehicles_removed}\n")
-    f.write("\nTraffic Flow Over Time:\n")
-    for idx, count in enumerate(vehicle_count_history):
-        if idx % 100 == 0:  # Print every 100 steps
-            f.write(f"Step {idx}: {count} vehicles\n")
+    fig, axes = plt.subplots(1, 3, figsize=(21, 7))
+    for ax, (metric, label), cmap in zip(axes, EDGE_METRICS.items(), ("YlOrRd", "RdYlGn", "YlOrRd")):
+        lanes = draw_edge_map(ax, graph, density, metric, cmap=cmap)
+        fig.colorbar(lanes, ax=ax, label=label)
+        ax.set_title(label)
+        ax.set_xlabel("X-coordinate")
+        ax.set_ylabel("Y-coordinate")
+    fig.suptitle(title)
+    plt.tight_layout()
+    plt.show()
 
-print(f"Report saved to {report_file}.")
-print("Displaying heatmaps and traffic trends...")
+def write_report(runner):
+    """
+    Write the text report and display the heatmaps and traffic trends.
+    """
+    # Generate report
+    print("Simulation complete. Generating report...")
+    report_file = "traffic_simulation_report.txt"
+    with open(report_file, "w") as f:
+        f.write("Traffic Simulation Report\n")
+        f.write("=" * 30 + "\n")
+        f.write(f"Total Steps: {max_steps}\n")
+        f.write(f"Maximum Vehicles in Network: {trends.max_vehicles}\n")
+        f.write(f"Average Speed Over Simulation: {trends.mean_speed:.2f} m/s\n")
+        f.write(f"Vehicles Inserted: {trends.vehicles_inserted}\n")
+        f.write(f"Vehicles Removed: {trends.vehicles_removed}\n")
+        f.write("\nTraffic Flow Over Time:\n")
+        for idx, count in enumerate(trends.vehicle_count_history):
+            if idx % 100 == 0:  # Print every 100 steps
+                f.write(f"Step {idx}: {count} vehicles\n")
+
+    print(f"Report saved to {report_file}.")
+    print("Displaying heatmaps and traffic trends...")
+
+    # Display heatmaps and trends
+    generate_heatmap(heatmaps.grid("start"), "Traffic at Start")
+    generate_heatmap(heatmaps.grid("peak"), "Traffic at Peak")
+    generate_heatmap(heatmaps.grid("offpeak"), "Traffic at Off-Peak")
+    graph = load_routing_graph(net_file)
+    generate_edge_maps(edge_maps.density("start"), graph, "Edge Traffic at Start")
+    generate_edge_maps(edge_maps.density("peak"), graph, "Edge Traffic at Peak")
+    generate_edge_maps(edge_maps.density("offpeak"), graph, "Edge Traffic at Off-Peak")
+    plot_trends(trends.vehicle_count_history, trends.speed_history, max_steps)
 
-# Display heatmaps and trends
-generate_heatmap(heatmap_data_start, "Traffic at Start")
-generate_heatmap(heatmap_data_peak, "Traffic at Peak")
-generate_heatmap(heatmap_data_offpeak, "Traffic at Off-Peak")
-plot_trends(vehicle_count_history, speed_history, max_steps)
+# Main Simulation Loop
+runner = SimulationRunner(sumo_cmd, max_steps, telemetry=telemetry, stages=heatmap_stage, hooks=[
+    trends,
+    heatmaps,
+    edge_maps,
+    RemovalPolicy(vehicle_limit, high_removal_rate, low_removal_rate, free_flow_range, every=removal_interval),
+    ReportSink(write_report),
+])
+runner.run()
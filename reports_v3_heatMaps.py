@@ -1,93 +1,91 @@
+from sumo_backend import sumo_command  # First, so that SUMO_BACKEND=libsumo can stand in for traci
 import os
-import traci
-import random
 import matplotlib.pyplot as plt
+from edge_density import EDGE_METRICS, draw_edge_map
+from fleet_telemetry import FleetTelemetry
+from heatmap_render import HeatmapFigure
+from routing_graph import load_routing_graph
+from simulation_runner import (FunctionHook, RemovalPolicy, ReportSink, SimulationRunner, StageEdgeDensity,
+                               StageHeatmaps, TrafficTrends, thirds)
 
 # Parameters
-sumo_cmd = ["sumo-gui", "-c", "osm_adjusted.sumocfg"]
+sumo_cmd = sumo_command("osm_adjusted.sumocfg")
 vehicle_limit = 4000  # Maximum allowed vehicles in the simulation
 max_steps = 1800  # Total simulation steps
 high_removal_rate = 0.03  # Initial removal rate (3%)
 low_removal_rate = 0.005  # Reduced removal rate (0.5%)
 removal_interval = 5  # Perform removal every 5 steps
 free_flow_range = (1500, 1600)  # Range of vehicles for minimal traffic
+max_lag = 1  # Steps the analytics may run behind SUMO (0 = lockstep)
+checkpoint_steps = []  # Steps after which to save SUMO and report state, e.g. [300] after the warm-up
+resume_from = None  # Checkpoint to fork from instead of step 0, e.g. "CHECKPOINTS/step_300"
+net_file = "osm.net.xml"  # Network of the heatmap extent and the edge maps
+heatmap_sampling = None  # All positions, or a heatmap_sampling policy, e.g. EveryKthStep(5) or ReservoirSampling(500)
 
 # Data storage
-vehicle_count_history = []
-speed_history = []
-vehicles_inserted = 0
-vehicles_removed = 0
-stage_speed_data = {"start": [], "peak": [], "offpeak": []}
-heatmap_data_start = []
-heatmap_data_peak = []
-heatmap_data_offpeak = []
+telemetry = FleetTelemetry(capacity=vehicle_limit)  # Per-step fleet speeds/positions via subscriptions
+trends = TrafficTrends()  # Vehicle count and speed per step, inserted/removed totals, stage speeds
+heatmaps = StageHeatmaps(net_file=net_file, sampling=heatmap_sampling)  # Vehicle positions binned per stage
+edge_maps = StageEdgeDensity()  # Vehicle-seconds, mean speed and occupancy per edge and stage
 vehicle_details = {}
 
 # Ensure REPORTS folder exists
 os.makedirs("REPORTS", exist_ok=True)
 
-def remove_random_vehicles(rate):
-    """
-    Randomly remove a percentage of vehicles from the simulation.
-    Args:
-        rate (float): Percentage of vehicles to remove.
-    """
-    vehicle_ids = traci.vehicle.getIDList()
-    num_to_remove = int(len(vehicle_ids) * rate)
-    vehicles_to_remove = random.sample(vehicle_ids, min(num_to_remove, len(vehicle_ids)))
-    for veh_id in vehicles_to_remove:
-        traci.vehicle.remove(veh_id)
-    print(f"Removed {len(vehicles_to_remove)} vehicles.")
-
-def collect_vehicle_positions(step, stage):
-    """
-    Collects vehicle positions for heatmap visualization.
-    Args:
-        step (int): Current simulation step.
-        stage (str): The stage of simulation ('start', 'peak', 'offpeak').
-    """
-    positions = [(traci.vehicle.getPosition(veh_id)) for veh_id in traci.vehicle.getIDList()]
-    if stage == "start":
-        heatmap_data_start.extend(positions)
-    elif stage == "peak":
-        heatmap_data_peak.extend(positions)
-    elif stage == "offpeak":
-        heatmap_data_offpeak.extend(positions)
-
-def collect_vehicle_details(step):
+def collect_vehicle_details(data, commands):
     """
     Collects details for up to 10 vehicles during the simulation.
     """
-    for veh_id in traci.vehicle.getIDList()[:10]:  # Limit to 10 vehicles
+    for i, veh_id in enumerate(data.ids[:10]):  # Limit to 10 vehicles
         if veh_id not in vehicle_details:
-            position = traci.vehicle.getPosition(veh_id)
+            position = tuple(data.positions[i])
             vehicle_details[veh_id] = {
                 "start": position,
                 "distance": 0,
                 "speed": [],
             }
-        vehicle_details[veh_id]["distance"] = traci.vehicle.getDistance(veh_id)
-        vehicle_details[veh_id]["speed"].append(traci.vehicle.getSpeed(veh_id))
+        vehicle_details[veh_id]["distance"] = float(data.distances[i])
+        vehicle_details[veh_id]["speed"].append(float(data.speeds[i]))
 
-def generate_heatmap(data, title, filename):
+def generate_heatmap(grid, title, filename, figure):
     """
     Generates and saves a heatmap.
     Args:
-        data (list): List of vehicle positions as (x, y) coordinates.
+        grid (HeatmapGrid): Vehicle positions binned during the run.
         title (str): Title of the heatmap.
         filename (str): Output file path.
+        figure (HeatmapFigure): Figure reused for all heatmaps of the report.
     """
-    if not data:
+    if not grid:
         print(f"No data to generate {title} heatmap.")
         return
+    if grid.relative_error() > 0:
+        title = f"{title} (sampled, {grid.error_label()})"
+
+    figure.render(grid, title, filename, min_count=1)  # Empty bins stay blank for clearer visibility
+
+def generate_edge_maps(density, graph, title, filename):
+    """
+    Generates and saves network-shaped maps of vehicle-seconds, mean speed and occupancy per edge.
+    Args:
+        density (EdgeDensity): Edge values of one stage.
+        graph (RoutingGraph): Network whose lane shapes are coloured.
+        title (str): Title of the maps.
+        filename (str): Output file path.
+    """
+    if density is None:
+        print(f"No data to generate {title} edge maps.")
+        return
 
-    x, y = zip(*data)
-    plt.figure(figsize=(10, 8))
-    plt.scatter(x, y, c='red', alpha=0.6, s=10)  # Scatter plot for clearer visibility
-    plt.title(title)
-    plt.xlabel("X-coordinate")
-    plt.ylabel("Y-coordinate")
-    plt.grid(True)
+    fig, axes = plt.subplots(1, 3, figsize=(21, 7))
+    for ax, (metric, label), cmap in zip(axes, EDGE_METRICS.items(), ("YlOrRd", "RdYlGn", "YlOrRd")):
+        lanes = draw_edge_map(ax, graph, density, metric, cmap=cmap)
+        fig.colorbar(lanes, ax=ax, label=label)
+        ax.set_title(label)
+        ax.set_xlabel("X-coordinate")
+        ax.set_ylabel("Y-coordinate")
+    fig.suptitle(title)
+    plt.tight_layout()
     plt.savefig(filename)
     plt.close()
 
@@ -118,69 +116,45 @@ def plot_trends(vehicle_count_history, speed_history, steps):
     plt.savefig("REPORTS/traffic_trends.png")
     plt.close()
 
-# Main Simulation Loop
-traci.start(sumo_cmd)
-step = 0
-reduction_mechanism_activated = False
-captured_peak = False
-
-while step < max_steps:
-    traci.simulationStep()
-    current_vehicles = traci.vehicle.getIDCount()
-    vehicle_count_history.append(current_vehicles)
-
-    avg_speed = (
-        sum(traci.vehicle.getSpeed(veh_id) for veh_id in traci.vehicle.getIDList())
-        / current_vehicles if current_vehicles > 0 else 0
-    )
-    speed_history.append(avg_speed)
-    vehicles_inserted += traci.simulation.getDepartedNumber()
-    vehicles_removed += traci.simulation.getArrivedNumber()
-
-    # Stage-based speed tracking
-    if step < max_steps // 3:
-        stage_speed_data["start"].append(avg_speed)
-        collect_vehicle_positions(step, "start")
-    elif max_steps // 3 <= step < 2 * max_steps // 3:
-        stage_speed_data["peak"].append(avg_speed)
-        collect_vehicle_positions(step, "peak")
-        captured_peak = True
-    else:
-        stage_speed_data["offpeak"].append(avg_speed)
-        collect_vehicle_positions(step, "offpeak")
-
-    # Vehicle removal logic
-    if current_vehicles >= vehicle_limit and not reduction_mechanism_activated:
-        reduction_mechanism_activated = True
-
-    if reduction_mechanism_activated and step % removal_interval == 0:
-        if current_vehicles > free_flow_range[1]:
-            remove_random_vehicles(high_removal_rate)
-        elif free_flow_range[0] <= current_vehicles <= free_flow_range[1]:
-            remove_random_vehicles(low_removal_rate)
-
-    # Collect vehicle details
-    collect_vehicle_details(step)
-    step += 1
-
-traci.close()
-
-# Save reports and plots
-with open("REPORTS/simulation_summary.txt", "w") as f:
-    f.write(f"Total Steps: {max_steps}\n")
-    f.write(f"Maximum Vehicles in Network: {max(vehicle_count_history)}\n")
-    f.write(f"Vehicles Inserted: {vehicles_inserted}\n")
-    f.write(f"Vehicles Removed: {vehicles_removed}\n")
-    f.write(f"Average Speed (Start): {sum(stage_speed_data['start']) / len(stage_speed_data['start']):.2f} m/s\n")
-    f.write(f"Average Speed (Peak): {sum(stage_speed_data['peak']) / len(stage_speed_data['peak']):.2f} m/s\n")
-    f.write(f"Average Speed (Off-Peak): {sum(stage_speed_data['offpeak']) / len(stage_speed_data['offpeak']):.2f} m/s\n")
-
-with open("REPORTS/vehicle_details.txt", "w") as f:
-    for veh_id, data in vehicle_details.items():
-        start = data["start"]
-        f.write(f"Vehicle {veh_id}: Start={start}, Distance={data['distance']:.2f} m, Avg Speed={sum(data['speed']) / len(data['speed']):.2f} m/s\n")
-
-generate_heatmap(heatmap_data_start, "Traffic at Start", "REPORTS/heatmap_start.png")
-generate_heatmap(heatmap_data_peak, "Traffic at Peak", "REPORTS/heatmap_peak.png")
-generate_heatmap(heatmap_data_offpeak, "Traffic at Off-Peak", "REPORTS/heatmap_offpeak.png")
-plot_trends(vehicle_count_history, speed_history, max_steps)
+def write_reports(runner):
+    """
+    Save the summary, vehicle details, heatmaps and trend plots to the REPORTS folder.
+    """
+    # Save reports and plots
+    with open("REPORTS/simulation_summary.txt", "w") as f:
+        f.write(f"Total Steps: {max_steps}\n")
+        f.write(f"Maximum Vehicles in Network: {trends.max_vehicles}\n")
+        f.write(f"Vehicles Inserted: {trends.vehicles_inserted}\n")
+        f.write(f"Vehicles Removed: {trends.vehicles_removed}\n")
+        f.write(f"Average Speed (Start): {telemetry.stage_mean_speed('start'):.2f} m/s\n")
+        f.write(f"Average Speed (Peak): {telemetry.stage_mean_speed('peak'):.2f} m/s\n")
+        f.write(f"Average Speed (Off-Peak): {telemetry.stage_mean_speed('offpeak'):.2f} m/s\n")
+
+    with open("REPORTS/vehicle_details.txt", "w") as f:
+        for veh_id, data in vehicle_details.items():
+            start = data["start"]
+            f.write(f"Vehicle {veh_id}: Start={start}, Distance={data['distance']:.2f} m, Avg Speed={sum(data['speed']) / len(data['speed']):.2f} m/s\n")
+
+    figure = HeatmapFigure(cmap='Reds', label='Vehicle samples')
+    generate_heatmap(heatmaps.grid("start"), "Traffic at Start", "REPORTS/heatmap_start.png", figure)
+    generate_heatmap(heatmaps.grid("peak"), "Traffic at Peak", "REPORTS/heatmap_peak.png", figure)
+    generate_heatmap(heatmaps.grid("offpeak"), "Traffic at Off-Peak", "REPORTS/heatmap_offpeak.png", figure)
+    graph = load_routing_graph(net_file)
+    generate_edge_maps(edge_maps.density("start"), graph, "Edge Traffic at Start", "REPORTS/edge_map_start.png")
+    generate_edge_maps(edge_maps.density("peak"), graph, "Edge Traffic at Peak", "REPORTS/edge_map_peak.png")
+    generate_edge_maps(edge_maps.density("offpeak"), graph, "Edge Traffic at Off-Peak",
+                       "REPORTS/edge_map_offpeak.png")
+    plot_trends(trends.vehicle_count_history, trends.speed_history, max_steps)
+
+# Main Simulation Loop (SUMO steps in this thread, the hooks run in an analytics thread)
+runner = SimulationRunner(sumo_cmd, max_steps, telemetry=telemetry, stages=thirds(max_steps), max_lag=max_lag,
+                          checkpoints=checkpoint_steps, resume=resume_from, hooks=[
+    trends,
+    heatmaps,
+    edge_maps,
+    RemovalPolicy(vehicle_limit, high_removal_rate, low_removal_rate, free_flow_range, every=removal_interval),
+    FunctionHook(collect_vehicle_details, thread_safe=True, state=vehicle_details),
+    ReportSink(write_reports),
+])
+runner.run()
+runner.report()
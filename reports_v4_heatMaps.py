@@ -1,116 +1,95 @@
+from sumo_backend import sumo_command  # First, so that SUMO_BACKEND=libsumo can stand in for traci
 import os
-import traci
-import random
 import matplotlib.pyplot as plt
 import pandas as pd
+from edge_density import EDGE_METRICS, draw_edge_map
+from fleet_telemetry import FleetTelemetry
+from heatmap_render import HeatmapFigure
+from report_export import write_excel, write_table
+from routing_graph import load_routing_graph
+from simulation_runner import (FunctionHook, Highlight, RemovalPolicy, ReportSink, SimulationRunner,
+                               StageEdgeDensity, StageHeatmaps, TrafficTrends, thirds)
+from vehicle_stats import VehicleStats, largest_rows, middle_rows, smallest_rows
 
 # Parameters
-sumo_cmd = ["sumo-gui", "-c", "osm_adjusted.sumocfg"]
+sumo_cmd = sumo_command("osm_adjusted.sumocfg")
 vehicle_limit = 3000  # Maximum allowed vehicles in the simulation
 max_steps = 600  # Total simulation steps
 high_removal_rate = 0.03  # Initial removal rate (3%)
 low_removal_rate = 0.005  # Reduced removal rate (0.5%)
 removal_interval = 5  # Perform removal every 5 steps
 free_flow_range = (1600, 1800)  # Range of vehicles for minimal traffic
+checkpoint_steps = []  # Steps after which to save SUMO and report state, e.g. [300] after the warm-up
+resume_from = None  # Checkpoint to fork from instead of step 0, e.g. "CHECKPOINTS/step_300"
+net_file = "osm.net.xml"  # Network of the heatmap extent and the edge maps
+heatmap_sampling = None  # All positions, or a heatmap_sampling policy, e.g. EveryKthStep(5) or ReservoirSampling(500)
+excel_report = False  # Also write the passenger car report as REPORTS/passenger_car_report.xlsx
+report_sheets = {"longest": "Longest Distance", "middle": "Middle Speed", "slowest": "Slowest Cars"}  # Excel sheets
 
 # Data storage
-vehicle_count_history = []
-speed_history = []
-vehicles_inserted = 0
-vehicles_removed = 0
-stage_speed_data = {"start": [], "peak": [], "offpeak": []}
-heatmap_data_start = []
-heatmap_data_peak = []
-heatmap_data_offpeak = []
-vehicle_details = {}
+telemetry = FleetTelemetry(capacity=vehicle_limit)  # Per-step fleet speeds/positions via subscriptions
+trends = TrafficTrends()  # Vehicle count and speed per step, inserted/removed totals, stage speeds
+heatmaps = StageHeatmaps(net_file=net_file, sampling=heatmap_sampling)  # Vehicle positions binned per stage
+edge_maps = StageEdgeDensity()  # Vehicle-seconds, mean speed and occupancy per edge and stage
+vehicle_details = VehicleStats()  # Running speed statistics, distance and start/end position per passenger car
 
 # Ensure REPORTS folder exists
 os.makedirs("REPORTS", exist_ok=True)
 
-def highlight_vehicle(vehicle_id, color=(255, 0, 0, 255)):
-    """
-    Highlights a specific vehicle by changing its color.
-    Args:
-        vehicle_id (str): ID of the vehicle to highlight.
-        color (tuple): RGBA color tuple (default is red).
-    """
-    try:
-        traci.vehicle.setColor(vehicle_id, color)
-        print(f"Vehicle '{vehicle_id}' highlighted with color {color}.")
-    except traci.TraCIException:
-        print(f"Vehicle '{vehicle_id}' not found.")
-
-def remove_random_vehicles(rate):
-    """
-    Randomly remove a percentage of vehicles from the simulation.
-    Args:
-        rate (float): Percentage of vehicles to remove.
-    """
-    vehicle_ids = traci.vehicle.getIDList()
-    num_to_remove = int(len(vehicle_ids) * rate)
-    vehicles_to_remove = random.sample(vehicle_ids, min(num_to_remove, len(vehicle_ids)))
-    for veh_id in vehicles_to_remove:
-        traci.vehicle.remove(veh_id)
-    print(f"Removed {len(vehicles_to_remove)} vehicles.")
-
-def collect_vehicle_positions(step, stage):
-    """
-    Collects vehicle positions for heatmap visualization.
-    Args:
-        step (int): Current simulation step.
-        stage (str): The stage of simulation ('start', 'peak', 'offpeak').
-    """
-    positions = [(traci.vehicle.getPosition(veh_id)) for veh_id in traci.vehicle.getIDList()]
-    if stage == "start":
-        heatmap_data_start.extend(positions)
-    elif stage == "peak":
-        heatmap_data_peak.extend(positions)
-    elif stage == "offpeak":
-        heatmap_data_offpeak.extend(positions)
-
-def collect_vehicle_details(step):
+def collect_vehicle_details(data, commands):
     """
     Collects details for passenger cars during the simulation.
     """
-    for veh_id in traci.vehicle.getIDList():
-        if "passenger" in traci.vehicle.getTypeID(veh_id):
-            if veh_id not in vehicle_details:
-                position = traci.vehicle.getPosition(veh_id)
-                vehicle_details[veh_id] = {
-                    "start": position,
-                    "distance": 0,
-                    "speed": [],
-                    "end": None,
-                }
-            vehicle_details[veh_id]["distance"] = traci.vehicle.getDistance(veh_id)
-            vehicle_details[veh_id]["speed"].append(traci.vehicle.getSpeed(veh_id))
-            vehicle_details[veh_id]["end"] = traci.vehicle.getPosition(veh_id)
-
-def generate_heatmap(data, title, filename, ratio=1000):
+    # Cars already tracked skip the type check, the others' types are cached by the runner
+    rows = [i for i, veh_id in enumerate(data.ids)
+            if veh_id in vehicle_details or "passenger" in data.vehicle_type(veh_id)]
+    vehicle_details.add([data.ids[i] for i in rows], data.speeds[rows], data.positions[rows], data.distances[rows],
+                        data.vehicle_type)
+
+def generate_heatmap(grid, title, filename, figure, ratio=1000):
     """
     Generates and saves a heatmap.
     Args:
-        data (list): List of vehicle positions as (x, y) coordinates.
+        grid (HeatmapGrid): Vehicle positions binned during the run.
         title (str): Title of the heatmap.
         filename (str): Output file path.
+        figure (HeatmapFigure): Figure reused for all heatmaps of the report.
         ratio (int): Ratio for scaling (1 dot = X cars).
     """
-    if not data:
+    if not grid:
         print(f"No data to generate {title} heatmap.")
         return
+    if grid.relative_error() > 0:
+        title = f"{title} (sampled, {grid.error_label()})"
+
+    figure.render(grid, title, filename, min_count=ratio)
+
+def generate_edge_maps(density, graph, title, filename):
+    """
+    Generates and saves network-shaped maps of vehicle-seconds, mean speed and occupancy per edge.
+    Args:
+        density (EdgeDensity): Edge values of one stage.
+        graph (RoutingGraph): Network whose lane shapes are coloured.
+        title (str): Title of the maps.
+        filename (str): Output file path.
+    """
+    if density is None:
+        print(f"No data to generate {title} edge maps.")
+        return
 
-    x, y = zip(*data)
-    plt.figure(figsize=(10, 8))
-    plt.hist2d(x, y, bins=(50, 50), cmin=ratio, cmap='YlOrRd')
-    plt.colorbar(label=f'Number of vehicles (scaled by {ratio})')
-    plt.title(title)
-    plt.xlabel("X-coordinate")
-    plt.ylabel("Y-coordinate")
-    plt.grid(True)
+    fig, axes = plt.subplots(1, 3, figsize=(21, 7))
+    for ax, (metric, label), cmap in zip(axes, EDGE_METRICS.items(), ("YlOrRd", "RdYlGn", "YlOrRd")):
+        lanes = draw_edge_map(ax, graph, density, metric, cmap=cmap)
+        fig.colorbar(lanes, ax=ax, label=label)
+        ax.set_title(label)
+        ax.set_xlabel("X-coordinate")
+        ax.set_ylabel("Y-coordinate")
+    fig.suptitle(title)
+    plt.tight_layout()
     plt.savefig(filename)
     plt.close()
 
-def plot_trends(vehicle_count_history, speed_history, stage_speed_data):
+def plot_trends(vehicle_count_history, speed_history, telemetry):
     """
     Plots traffic trends based on collected data and generates stage-specific graphs.
     """
@@ -142,9 +121,9 @@ def plot_trends(vehicle_count_history, speed_history, stage_speed_data):
     plt.figure(figsize=(10, 5))
     stages = ["Start", "Peak", "Off-Peak"]
     avg_speeds = [
-        sum(stage_speed_data["start"]) / len(stage_speed_data["start"]),
-        sum(stage_speed_data["peak"]) / len(stage_speed_data["peak"]),
-        sum(stage_speed_data["offpeak"]) / len(stage_speed_data["offpeak"]),
+        telemetry.stage_mean_speed("start"),
+        telemetry.stage_mean_speed("peak"),
+        telemetry.stage_mean_speed("offpeak"),
     ]
     plt.bar(stages, avg_speeds, color=["blue", "orange", "green"])
     plt.xlabel("Stages")
@@ -155,77 +134,54 @@ def plot_trends(vehicle_count_history, speed_history, stage_speed_data):
 
 def generate_passenger_car_report():
     """
-    Generates a detailed report for passenger cars with the specified criteria.
+    Generates a detailed report for passenger cars with the specified criteria: one table of the
+    selected cars with x/y coordinate columns (Parquet, NPZ without a Parquet engine) and, if
+    excel_report is set, the same rows as an Excel workbook with one sheet per selection.
     """
-    df = pd.DataFrame.from_dict(vehicle_details, orient='index')
-    df['average_speed'] = df['speed'].apply(lambda x: sum(x) / len(x) if len(x) > 0 else 0)
-    df = df.sort_values(by='distance', ascending=False)
-
-    top_5_longest = df.head(5)
-    middle_5 = df.iloc[len(df)//2 - 2:len(df)//2 + 3]
-    slowest_5 = df.nsmallest(5, 'average_speed')
-
-    with pd.ExcelWriter("REPORTS/passenger_car_report.xlsx") as writer:
-        top_5_longest.to_excel(writer, sheet_name="Longest Distance", index=True)
-        middle_5.to_excel(writer, sheet_name="Middle Speed", index=True)
-        slowest_5.to_excel(writer, sheet_name="Slowest Cars", index=True)
-
-    print("Passenger car report saved to REPORTS/passenger_car_report.xlsx")
+    distance = vehicle_details.distance[:len(vehicle_details)]
+    average_speed = vehicle_details.mean[:len(vehicle_details)]
+    selections = {
+        "longest": largest_rows(distance, 5),
+        "middle": middle_rows(distance, 5),
+        "slowest": smallest_rows(average_speed, 5),
+    }
+    report = pd.concat([vehicle_details.frame(rows).reset_index().assign(selection=selection)
+                        for selection, rows in selections.items()], ignore_index=True)
+
+    path = write_table(report, "REPORTS/passenger_car_report")
+    print(f"Passenger car report saved to {path}")
+    if excel_report:
+        write_excel(report, "REPORTS/passenger_car_report.xlsx", report_sheets)
+        print("Passenger car report saved to REPORTS/passenger_car_report.xlsx")
+
+def write_reports(runner):
+    """
+    Save the heatmaps, trend plots and passenger car report to the REPORTS folder.
+    """
+    # Save reports and plots
+    figure = HeatmapFigure(cmap='YlOrRd', label='Number of vehicles (scaled by 1000)')
+    generate_heatmap(heatmaps.grid("start"), "Traffic at Start", "REPORTS/heatmap_start2.png", figure)
+    generate_heatmap(heatmaps.grid("peak"), "Traffic at Peak", "REPORTS/heatmap_peak2.png", figure)
+    generate_heatmap(heatmaps.grid("offpeak"), "Traffic at Off-Peak", "REPORTS/heatmap_offpeak2.png", figure)
+    graph = load_routing_graph(net_file)
+    generate_edge_maps(edge_maps.density("start"), graph, "Edge Traffic at Start", "REPORTS/edge_map_start2.png")
+    generate_edge_maps(edge_maps.density("peak"), graph, "Edge Traffic at Peak", "REPORTS/edge_map_peak2.png")
+    generate_edge_maps(edge_maps.density("offpeak"), graph, "Edge Traffic at Off-Peak",
+                       "REPORTS/edge_map_offpeak2.png")
+    plot_trends(trends.vehicle_count_history, trends.speed_history, telemetry)
+    generate_passenger_car_report()
+
+    print("Simulation complete. Reports generated in the REPORTS folder.")
 
 # Main Simulation Loop
-traci.start(sumo_cmd)
-step = 0
-reduction_mechanism_activated = False
-
-while step < max_steps:
-    traci.simulationStep()
-    current_vehicles = traci.vehicle.getIDCount()
-    vehicle_count_history.append(current_vehicles)
-
-    avg_speed = (
-        sum(traci.vehicle.getSpeed(veh_id) for veh_id in traci.vehicle.getIDList())
-        / current_vehicles if current_vehicles > 0 else 0
-    )
-    speed_history.append(avg_speed)
-    vehicles_inserted += traci.simulation.getDepartedNumber()
-    vehicles_removed += traci.simulation.getArrivedNumber()
-
-    # Highlight veh99 in red
-    if "veh99" in traci.vehicle.getIDList():
-        highlight_vehicle("veh99")
-
-    # Stage-based speed tracking
-    if step < max_steps // 3:
-        stage_speed_data["start"].append(avg_speed)
-        collect_vehicle_positions(step, "start")
-    elif max_steps // 3 <= step < 2 * max_steps // 3:
-        stage_speed_data["peak"].append(avg_speed)
-        collect_vehicle_positions(step, "peak")
-    else:
-        stage_speed_data["offpeak"].append(avg_speed)
-        collect_vehicle_positions(step, "offpeak")
-
-    # Vehicle removal logic
-    if current_vehicles >= vehicle_limit and not reduction_mechanism_activated:
-        reduction_mechanism_activated = True
-
-    if reduction_mechanism_activated and step % removal_interval == 0:
-        if current_vehicles > free_flow_range[1]:
-            remove_random_vehicles(high_removal_rate)
-        elif free_flow_range[0] <= current_vehicles <= free_flow_range[1]:
-            remove_random_vehicles(low_removal_rate)
-
-    # Collect vehicle details
-    collect_vehicle_details(step)
-    step += 1
-
-traci.close()
-
-# Save reports and plots
-generate_heatmap(heatmap_data_start, "Traffic at Start", "REPORTS/heatmap_start2.png")
-generate_heatmap(heatmap_data_peak, "Traffic at Peak", "REPORTS/heatmap_peak2.png")
-generate_heatmap(heatmap_data_offpeak, "Traffic at Off-Peak", "REPORTS/heatmap_offpeak2.png")
-plot_trends(vehicle_count_history, speed_history, stage_speed_data)
-generate_passenger_car_report()
-
-print("Simulation complete. Reports generated in the REPORTS folder.")
+runner = SimulationRunner(sumo_cmd, max_steps, telemetry=telemetry, stages=thirds(max_steps),
+                          checkpoints=checkpoint_steps, resume=resume_from, hooks=[
+    trends,
+    Highlight({"veh99": (255, 0, 0, 255)}),  # Highlight veh99 in red
+    heatmaps,
+    edge_maps,
+    RemovalPolicy(vehicle_limit, high_removal_rate, low_removal_rate, free_flow_range, every=removal_interval),
+    FunctionHook(collect_vehicle_details, state=vehicle_details),
+    ReportSink(write_reports),
+])
+runner.run()
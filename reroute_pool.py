@@ -0,0 +1,241 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, wait
+from multiprocessing import shared_memory
+
+import numpy as np
+import traci
+
+from customizable_hierarchy import CCH_ARRAYS, QUERY_ARRAYS, CustomizableHierarchy
+from routing_graph import CACHE_ARRAYS, RoutingGraph
+
+# Arrays in the shared block start on cache-line boundaries
+SHARED_ALIGNMENT = 64
+
+# Per-process state of a pool worker, set by _init_worker()
+_worker = {}
+
+
+def share_arrays(arrays):
+    """
+    Copy named NumPy arrays into one shared memory block.
+    Args:
+        arrays (dict): {name: array}, object arrays are not supported.
+    Returns:
+        tuple: (SharedMemory, layout) where layout {name: (dtype, shape, offset)}
+            is all a process needs to attach_arrays() without copying.
+    """
+    layout = {}
+    size = 0
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        if array.dtype.hasobject:
+            raise ValueError(f"Cannot share object array {name}")
+        layout[name] = (array.dtype.str, array.shape, size)
+        size += -(-array.nbytes // SHARED_ALIGNMENT) * SHARED_ALIGNMENT
+    shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+    for name, view in attach_arrays(shm, layout).items():
+        view[...] = arrays[name]
+    return shm, layout
+
+
+def attach_arrays(shm, layout):
+    """
+    Views of the arrays stored in a shared memory block by share_arrays().
+    """
+    return {name: np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf, offset=offset)
+            for name, (dtype, shape, offset) in layout.items()}
+
+
+def _init_worker(shm_name, layout):
+    shm = shared_memory.SharedMemory(name=shm_name)
+    arrays = attach_arrays(shm, layout)
+    graph = RoutingGraph(**{name: arrays[name] for name in CACHE_ARRAYS})
+    # Queries index the shared views in place; only the customized weights are per process
+    hierarchy = CustomizableHierarchy(graph, **{name: arrays[f"cch.{name}"] for name in CCH_ARRAYS},
+                                      query_arrays={name: arrays[f"query.{name}"] for name in QUERY_ARRAYS})
+    _worker.update(shm=shm, costs=arrays["costs"], hierarchy=hierarchy, version=0)
+
+
+def _worker_ready():
+    return os.getpid()
+
+
+def _route_batch(version, requests):
+    hierarchy = _worker["hierarchy"]
+    if _worker["version"] != version:
+        hierarchy.customize(_worker["costs"][version % 2])
+        _worker["version"] = version
+    routes = hierarchy.find_routes([(source, target) for _, source, target in requests])
+    return [(veh_id, route) for (veh_id, _, _), route in zip(requests, routes)]
+
+
+class ReroutePool:
+    """
+    Reroutes vehicles in a pool of worker processes while the simulation keeps stepping.
+
+    The routing graph and the customizable hierarchy are copied once into a
+    shared memory block that every worker attaches to at start-up, so a task
+    only carries (vehicle, current edge, target edge) triples. Workers query
+    the shared topology in place (CustomizableHierarchy with query_arrays).
+    Per process they only hold their own customization (an up and a down
+    weight per arc, a cost per edge), the per-level triangle runs and the
+    graph's edge ID dict and per-edge/per-arc cost arrays; in-place queries
+    are slower per lookup than the list copies an in-process hierarchy uses. Live edge costs
+    sit in two shared slots: update_costs() fills the slot not used by the
+    newest batch and workers re-customize when a batch names the other slot.
+
+    Batches are submitted in one step and their routes applied with
+    traci.vehicle.setRoute in a later one, cut to start at the edge the
+    vehicle has reached by then.
+    """
+
+    def __init__(self, hierarchy, workers=None):
+        """
+        Args:
+            hierarchy (CustomizableHierarchy): Hierarchy whose graph and topology are shared.
+            workers (int): Worker processes, by default one per CPU but the one running SUMO/TraCI.
+        """
+        graph = hierarchy.graph
+        self.hierarchy = hierarchy
+        self.workers = workers or max(1, (os.cpu_count() or 2) - 1)
+        arrays = {name: getattr(graph, name) for name in CACHE_ARRAYS}
+        arrays.update({f"cch.{name}": getattr(hierarchy, name) for name in CCH_ARRAYS})
+        arrays.update({f"query.{name}": array for name, array in hierarchy.query_arrays().items()})
+        arrays["costs"] = np.tile(graph.edge_cost, (2, 1))
+        self._shm, layout = share_arrays(arrays)
+        self._costs = attach_arrays(self._shm, {"costs": layout["costs"]})["costs"]
+        self.version = 0
+        self._executor = ProcessPoolExecutor(self.workers, initializer=_init_worker,
+                                             initargs=(self._shm.name, layout))
+        # Start the workers now, before TraCI connects, instead of during the first reroute
+        wait([self._executor.submit(_worker_ready) for _ in range(self.workers)])
+        self._pending = []
+        self._batches = 0
+        self._latest_batch = {}
+        self._applied_routes = {}
+        self.submitted = 0
+        self.applied = 0
+        self.unchanged = 0
+        self.stale = 0
+        self.submit_time = 0.0
+        self.apply_time = 0.0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def pending(self):
+        """
+        Number of submitted batches whose routes have not been collected yet.
+        """
+        return len(self._pending)
+
+    def update_costs(self, costs):
+        """
+        Route the following batches with new per-edge costs (e.g. EdgeStateCollector.edge_costs()).
+        Only waits for batches still reading the slot that is overwritten, which
+        were submitted two updates ago.
+        """
+        wait([future for version, _, future in self._pending if version != self.version])
+        self.version += 1
+        self._costs[self.version % 2] = costs
+
+    def submit(self, requests):
+        """
+        Start routing a batch in the background.
+        Args:
+            requests (list): (vehicle ID, current edge ID, target edge ID) triples.
+        """
+        start = time.perf_counter()
+        # Vehicles sharing a destination go to the same worker, which searches it once
+        requests = sorted(requests, key=lambda request: request[2])
+        size = -(-len(requests) // self.workers)
+        for i in range(0, len(requests), size or 1):
+            future = self._executor.submit(_route_batch, self.version, requests[i:i + size])
+            self._pending.append((self.version, self._batches, future))
+        self._batches += 1
+        self.submitted += len(requests)
+        self.submit_time += time.perf_counter() - start
+
+    def collect(self, block=False):
+        """
+        Routes of the batches that have finished, without waiting unless block is set.
+        Returns:
+            dict: {vehicle ID: list of edge IDs}, empty when no path was found;
+                the newest route wins when a vehicle was submitted more than once.
+        """
+        if block:
+            wait([future for _, _, future in self._pending])
+        routes = {}
+        still_pending = []
+        for version, batch, future in self._pending:
+            if not future.done():
+                still_pending.append((version, batch, future))
+                continue
+            for veh_id, route in future.result():
+                # A batch that finishes late must not replace a newer route
+                if self._latest_batch.get(veh_id, -1) <= batch:
+                    self._latest_batch[veh_id] = batch
+                    routes[veh_id] = route
+        self._pending = still_pending
+        return routes
+
+    def apply(self, current_edges, routes=None):
+        """
+        Set the collected routes in SUMO. Call once per step after simulationStep().
+        Args:
+            current_edges (dict): {vehicle ID: edge ID} of this step, e.g. FleetTelemetry.current_edges().
+            routes (dict): Routes to apply, by default the ones collect() returns now.
+        Returns:
+            list: IDs of the vehicles whose route was changed.
+        """
+        start = time.perf_counter()
+        if routes is None:
+            routes = self.collect()
+        changed = []
+        for veh_id, route in routes.items():
+            current = current_edges.get(veh_id)
+            if current is None or not route:
+                continue
+            try:
+                route = route[route.index(current):]
+            except ValueError:
+                # The vehicle left the route's first edges (or is inside a junction), try again next batch
+                self.stale += 1
+                continue
+            previous = self._applied_routes.get(veh_id)
+            if previous is not None and current in previous and previous[previous.index(current):] == route:
+                self.unchanged += 1
+                continue
+            try:
+                traci.vehicle.setRoute(veh_id, route)
+            except traci.TraCIException as e:
+                print(f"Error rerouting vehicle {veh_id}: {e}")
+                continue
+            self._applied_routes[veh_id] = route
+            changed.append(veh_id)
+        self.applied += len(changed)
+        self.apply_time += time.perf_counter() - start
+        return changed
+
+    def forget(self, vehicle_ids):
+        """
+        Drop the routes remembered for vehicles that left the network.
+        """
+        for veh_id in vehicle_ids:
+            self._applied_routes.pop(veh_id, None)
+            self._latest_batch.pop(veh_id, None)
+
+    def close(self):
+        """
+        Stop the workers and release the shared memory block.
+        """
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        self._pending = []
+        self._costs = None
+        self._shm.close()
+        self._shm.unlink()
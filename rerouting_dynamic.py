@@ -1,10 +1,11 @@
+from sumo_backend import sumo_command  # First, so that SUMO_BACKEND=libsumo can stand in for traci
 import traci
 import random
 import networkx as nx
 import matplotlib.pyplot as plt
 
 # Parameters
-sumo_cmd = ["sumo-gui", "-c", "osm_adjusted.sumocfg"]
+sumo_cmd = sumo_command("osm_adjusted.sumocfg")
 max_steps = 1600
 vehicle_limit = 4000
 high_removal_rate = 0.03
@@ -0,0 +1,153 @@
+import heapq
+import math
+
+import numpy as np
+
+# Upper bound on how far above the speed limit SUMO lets vehicles drive
+# (default speedFactor distribution is truncated at 1.2)
+SPEED_FACTOR_BOUND = 1.2
+
+
+class RouteEngine:
+    """
+    Binary-heap Dijkstra and A* over the edge-based RoutingGraph.
+
+    Vertices are SUMO edges and arcs are the connections between them (taken
+    from the lane links of the network), so every route respects the allowed
+    turns and can be passed to traci.vehicle.setRoute as it is.
+    """
+
+    def __init__(self, graph):
+        """
+        Args:
+            graph (RoutingGraph): Graph from routing_graph.load_routing_graph().
+        """
+        self.graph = graph
+        self._offsets = graph.offsets.tolist()
+        self._targets = graph.targets.tolist()
+        self._edge_ids = graph.edge_ids.tolist()
+        self._compute_heuristic_bounds()
+        self.refresh_weights()
+
+    def _compute_heuristic_bounds(self):
+        """
+        Scale factor that keeps the Euclidean heuristic a lower bound on travel time.
+
+        Lane lengths can be shorter than the straight line between the two
+        junction centres, so the distance is scaled by the smallest
+        length/straight-line ratio of any edge before dividing by the top speed.
+        """
+        graph = self.graph
+        coords = graph.node_coords
+        straight = np.hypot(*(coords[graph.edge_to] - coords[graph.edge_from]).T)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ratio = np.where(straight > 0, graph.edge_length / straight, np.inf)
+        scale = min(1.0, float(ratio.min())) if len(ratio) else 1.0
+        top_speed = float(graph.edge_speed.max()) * SPEED_FACTOR_BOUND if graph.num_edges else 1.0
+        self._heuristic_scale = scale / top_speed
+        self._start_x = coords[graph.edge_from, 0].tolist()
+        self._start_y = coords[graph.edge_from, 1].tolist()
+
+    def refresh_weights(self, weights=None):
+        """
+        Take the arc weights to search with, by default the graph's current weights.
+        Call after RoutingGraph.update_edge_costs().
+        """
+        self._weights = np.asarray(self.graph.weights if weights is None else weights).tolist()
+
+    def edge_index(self, edge_id):
+        return self.graph.edge_index.get(edge_id)
+
+    def heuristic(self, a, b):
+        """
+        Lower bound on the travel time between the starts of edges a and b.
+        """
+        return math.hypot(self._start_x[a] - self._start_x[b], self._start_y[a] - self._start_y[b]) * \
+            self._heuristic_scale
+
+    def _search(self, source, target, weights, use_heuristic, edge_costs=None):
+        offsets, targets = self._offsets, self._targets
+        edge_costs = edge_costs or {}
+        if use_heuristic:
+            scale = self._heuristic_scale
+            start_x, start_y = self._start_x, self._start_y
+            tx, ty = start_x[target], start_y[target]
+            h = lambda v: math.hypot(start_x[v] - tx, start_y[v] - ty) * scale
+        else:
+            h = lambda v: 0.0
+
+        dist = {source: 0.0}
+        parent = {source: -1}
+        visited = set()
+        heap = [(h(source), 0.0, source)]
+        while heap:
+            _, d, u = heapq.heappop(heap)
+            if u in visited:
+                continue
+            if u == target:
+                break
+            visited.add(u)
+            override = edge_costs.get(u)
+            for k in range(offsets[u], offsets[u + 1]):
+                v = targets[k]
+                if v in visited:
+                    continue
+                nd = d + (weights[k] if override is None else override)
+                if nd < dist.get(v, math.inf):
+                    dist[v] = nd
+                    parent[v] = u
+                    heapq.heappush(heap, (nd + h(v), nd, v))
+        else:
+            return math.inf, [], len(visited)
+
+        path = [target]
+        while parent[path[-1]] != -1:
+            path.append(parent[path[-1]])
+        path.reverse()
+        return dist[target], path, len(visited)
+
+    def shortest_path(self, source, target, method="astar", weights=None, edge_costs=None):
+        """
+        Shortest path between two edge indices.
+        Args:
+            source (int): Index of the start edge (the vehicle's current edge).
+            target (int): Index of the destination edge.
+            method (str): 'astar' or 'dijkstra'.
+            weights (list): Optional per-arc weights overriding the engine's weights.
+            edge_costs (dict): Optional {edge index: cost} overrides, e.g. inf for blocked
+                edges, applied without modifying the shared weights.
+        Returns:
+            tuple: (cost, list of edge indices from source to target); (inf, []) when unreachable.
+        """
+        if method not in ("astar", "dijkstra"):
+            raise ValueError(f"Unknown routing method: {method}")
+        cost, path, _ = self._search(source, target, self._weights if weights is None else weights,
+                                     method == "astar", edge_costs)
+        return cost, path
+
+    def find_route(self, source_edge, target_edge, method="astar"):
+        """
+        Route between two SUMO edge IDs as a list of edge IDs for traci.vehicle.setRoute.
+        Returns an empty list when either edge is unknown or the target is unreachable.
+        """
+        source = self.edge_index(source_edge)
+        target = self.edge_index(target_edge)
+        if source is None or target is None:
+            return []
+        _, path = self.shortest_path(source, target, method)
+        return [self._edge_ids[i] for i in path]
+
+    def route_cost(self, path):
+        """
+        Cost of a path given as edge indices, with the engine's weights.
+        """
+        offsets, targets, weights = self._offsets, self._targets, self._weights
+        cost = 0.0
+        for u, v in zip(path[:-1], path[1:]):
+            for k in range(offsets[u], offsets[u + 1]):
+                if targets[k] == v:
+                    cost += weights[k]
+                    break
+            else:
+                return math.inf
+        return cost
@@ -0,0 +1,132 @@
+import ast
+from collections import namedtuple
+
+import numpy as np
+
+# Resolved origin/destination of one vehicle
+RouteRequest = namedtuple("RouteRequest", ["start_node", "end_node", "start_edge", "end_edge"])
+
+
+def parse_coordinate(value):
+    """
+    Convert a stored coordinate ("(x, y)" string, tuple or list) into an (x, y) float pair.
+    """
+    if isinstance(value, str):
+        value = ast.literal_eval(value)
+    return float(value[0]), float(value[1])
+
+
+class RouteRequestCache:
+    """
+    Origin and destination of planned vehicles, snapped to junctions and edges once.
+
+    Coordinates are resolved in one batched spatial-index query when they are
+    loaded, so looking up a vehicle during the simulation is a dict access.
+    An entry is only resolved again when its target changes, and is dropped
+    when the vehicle leaves the network.
+    """
+
+    def __init__(self, spatial_index):
+        """
+        Args:
+            spatial_index (SpatialIndex): Index over the routing graph used for snapping.
+        """
+        self.spatial_index = spatial_index
+        self.graph = spatial_index.graph
+        self.row = {}
+        self.coords = np.zeros((0, 4), dtype=np.float64)
+        self.nodes = np.zeros((0, 2), dtype=np.int32)
+        self.edges = np.zeros((0, 2), dtype=np.int32)
+        self.resolutions = 0
+
+    def __contains__(self, veh_id):
+        return veh_id in self.row
+
+    def __len__(self):
+        return len(self.row)
+
+    def load(self, file_path, id_column="Vehicle ID", start_column="start Cordinates",
+             end_column="end Cordinates", selection=None):
+        """
+        Load and resolve vehicle origins/destinations from a report.
+
+        Columnar reports (.parquet or .npz, see report_export) are read
+        directly from their vehicle_id, start_x, start_y, end_x and end_y
+        columns; Excel and CSV reports hold coordinates as "(x, y)" strings.
+        Args:
+            file_path (str): .parquet, .npz, .xlsx or .csv file with one row per vehicle.
+            id_column (str): Excel/CSV column holding the vehicle ID.
+            start_column (str): Excel/CSV column holding the start coordinate.
+            end_column (str): Excel/CSV column holding the end coordinate.
+            selection (str): Only the rows of this value of a columnar report's selection column, e.g. "longest".
+        """
+        from report_export import read_table
+
+        df = read_table(file_path)
+        if file_path.endswith((".parquet", ".npz")):
+            if selection is not None:
+                df = df[df["selection"] == selection]
+            df = df.drop_duplicates("vehicle_id")
+            self.add(df["vehicle_id"].astype(str).tolist(), df[["start_x", "start_y"]].to_numpy(np.float64),
+                     df[["end_x", "end_y"]].to_numpy(np.float64))
+            return
+        self.add(df[id_column].astype(str).tolist(),
+                 [parse_coordinate(value) for value in df[start_column]],
+                 [parse_coordinate(value) for value in df[end_column]])
+
+    def add(self, vehicle_ids, start_coords, end_coords):
+        """
+        Resolve and store a batch of vehicles.
+        Args:
+            vehicle_ids (list): Vehicle IDs.
+            start_coords (array-like): (n, 2) start coordinates.
+            end_coords (array-like): (n, 2) end coordinates.
+        """
+        coords = np.hstack([np.asarray(start_coords, dtype=np.float64).reshape(-1, 2),
+                            np.asarray(end_coords, dtype=np.float64).reshape(-1, 2)])
+        nodes, edges = self._resolve(coords.reshape(-1, 2))
+        first = len(self.coords)
+        self.coords = np.vstack([self.coords, coords])
+        self.nodes = np.vstack([self.nodes, nodes.reshape(-1, 2)])
+        self.edges = np.vstack([self.edges, edges.reshape(-1, 2)])
+        for i, veh_id in enumerate(vehicle_ids):
+            self.row[veh_id] = first + i
+
+    def _resolve(self, points):
+        self.resolutions += len(points)
+        nodes, _ = self.spatial_index.nearest_nodes(points)
+        edges, _ = self.spatial_index.nearest_edges(points)
+        return nodes.astype(np.int32), edges.astype(np.int32)
+
+    def get(self, veh_id):
+        """
+        Returns the RouteRequest of a vehicle, or None if it is not tracked.
+        """
+        i = self.row.get(veh_id)
+        if i is None:
+            return None
+        node_ids, edge_ids = self.graph.node_ids, self.graph.edge_ids
+        start_node, end_node = self.nodes[i]
+        start_edge, end_edge = self.edges[i]
+        return RouteRequest(str(node_ids[start_node]), str(node_ids[end_node]),
+                            str(edge_ids[start_edge]), str(edge_ids[end_edge]))
+
+    def set_target(self, veh_id, end_coord):
+        """
+        Change a vehicle's destination, resolving only the new end point.
+        """
+        i = self.row[veh_id]
+        end_coord = parse_coordinate(end_coord)
+        if tuple(self.coords[i, 2:]) == end_coord:
+            return
+        nodes, edges = self._resolve(np.array([end_coord]))
+        self.coords[i, 2:] = end_coord
+        self.nodes[i, 1] = nodes[0]
+        self.edges[i, 1] = edges[0]
+
+    def invalidate(self, vehicle_ids):
+        """
+        Forget vehicles that left the network (e.g. traci.simulation.getArrivedIDList()).
+        """
+        for veh_id in vehicle_ids:
+            self.row.pop(veh_id, None)
@@ -0,0 +1,283 @@
+import hashlib
+import os
+
+import numpy as np
+
+# Cache format version, bump when the arrays stored in the cache change
+CACHE_VERSION = 2
+
+# Arrays written to the cache, in constructor order
+CACHE_ARRAYS = ("edge_ids", "edge_from", "edge_to", "node_ids", "node_coords", "edge_length",
+                "edge_speed", "offsets", "targets", "lane_ids", "lane_edge", "lane_shape_offsets",
+                "lane_shape_points")
+
+
+def file_digest(file_path, chunk_size=1 << 20):
+    """
+    Compute the SHA-1 digest of a file, used as the routing graph cache key.
+    Args:
+        file_path (str): Path to the file.
+        chunk_size (int): Number of bytes read per chunk.
+    Returns:
+        str: Hexadecimal digest.
+    """
+    digest = hashlib.sha1()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def cache_path_for(net_file, digest):
+    """
+    Returns the binary cache file stored next to the network for a given digest.
+    """
+    return f"{net_file}.{digest[:16]}.csr.npz"
+
+
+class RoutingGraph:
+    """
+    Edge-based routing graph of a SUMO network stored in CSR form.
+
+    Every SUMO edge is a vertex and every connection between two edges is an arc.
+    The arcs leaving edge i are targets[offsets[i]:offsets[i + 1]] and their
+    weights are the current cost of traversing edge i (free-flow travel time
+    length/speed until update_edge_costs is called).
+
+    Lane geometry is kept in the same form: the shape of lane j is
+    lane_shape_points[lane_shape_offsets[j]:lane_shape_offsets[j + 1]].
+    """
+
+    def __init__(self, edge_ids, edge_from, edge_to, node_ids, node_coords,
+                 edge_length, edge_speed, offsets, targets,
+                 lane_ids, lane_edge, lane_shape_offsets, lane_shape_points):
+        self.edge_ids = edge_ids
+        self.edge_index = {edge_id: i for i, edge_id in enumerate(edge_ids.tolist())}
+        self.edge_from = edge_from
+        self.edge_to = edge_to
+        self.node_ids = node_ids
+        self.node_coords = node_coords
+        self.edge_length = edge_length
+        self.edge_speed = edge_speed
+        self.offsets = offsets
+        self.targets = targets
+        self.lane_ids = lane_ids
+        self.lane_edge = lane_edge
+        self.lane_shape_offsets = lane_shape_offsets
+        self.lane_shape_points = lane_shape_points
+        self.arc_source = np.repeat(np.arange(len(edge_ids), dtype=np.int32), np.diff(offsets))
+        self.free_flow_cost = np.where(edge_speed > 0, edge_length / np.maximum(edge_speed, 1e-9), np.inf)
+        self.edge_cost = self.free_flow_cost.copy()
+        self.weights = self.edge_cost[self.arc_source]
+        self._reverse = None
+
+    @property
+    def num_edges(self):
+        return len(self.edge_ids)
+
+    @property
+    def num_arcs(self):
+        return len(self.targets)
+
+    @classmethod
+    def from_net_file(cls, net_file):
+        """
+        Parse the static topology of a SUMO network with sumolib.
+        Args:
+            net_file (str): Path to the .net.xml file.
+        Returns:
+            RoutingGraph: Graph with free-flow weights.
+        """
+        import sumolib
+
+        net = sumolib.net.readNet(net_file)
+        edges = net.getEdges()
+        nodes = net.getNodes()
+        edge_index = {edge.getID(): i for i, edge in enumerate(edges)}
+        node_index = {node.getID(): i for i, node in enumerate(nodes)}
+
+        offsets = np.zeros(len(edges) + 1, dtype=np.int64)
+        targets = []
+        for i, edge in enumerate(edges):
+            successors = sorted(edge_index[to_edge.getID()] for to_edge in edge.getOutgoing()
+                                if to_edge.getID() in edge_index)
+            targets.extend(successors)
+            offsets[i + 1] = len(targets)
+
+        lanes = [(i, lane) for i, edge in enumerate(edges) for lane in edge.getLanes()]
+        lane_shape_offsets = np.zeros(len(lanes) + 1, dtype=np.int64)
+        lane_shape_points = []
+        for j, (_, lane) in enumerate(lanes):
+            lane_shape_points.extend(point[:2] for point in lane.getShape())
+            lane_shape_offsets[j + 1] = len(lane_shape_points)
+
+        return cls(
+            edge_ids=np.array([edge.getID() for edge in edges], dtype=str),
+            edge_from=np.array([node_index[edge.getFromNode().getID()] for edge in edges], dtype=np.int32),
+            edge_to=np.array([node_index[edge.getToNode().getID()] for edge in edges], dtype=np.int32),
+            node_ids=np.array([node.getID() for node in nodes], dtype=str),
+            node_coords=np.array([node.getCoord()[:2] for node in nodes], dtype=np.float64).reshape(-1, 2),
+            edge_length=np.array([edge.getLength() for edge in edges], dtype=np.float64),
+            edge_speed=np.array([edge.getSpeed() for edge in edges], dtype=np.float64),
+            offsets=offsets,
+            targets=np.array(targets, dtype=np.int32),
+            lane_ids=np.array([lane.getID() for _, lane in lanes], dtype=str),
+            lane_edge=np.array([i for i, _ in lanes], dtype=np.int32),
+            lane_shape_offsets=lane_shape_offsets,
+            lane_shape_points=np.array(lane_shape_points, dtype=np.float64).reshape(-1, 2),
+        )
+
+    def save(self, cache_file):
+        """
+        Write the static topology to a binary .npz cache.
+        """
+        arrays = {name: getattr(self, name) for name in CACHE_ARRAYS}
+        np.savez(cache_file, version=np.array(CACHE_VERSION), **arrays)
+
+    @classmethod
+    def load(cls, cache_file):
+        """
+        Read a graph written by save().
+        """
+        with np.load(cache_file, allow_pickle=False) as data:
+            if int(data["version"]) != CACHE_VERSION:
+                raise ValueError(f"Unsupported routing graph cache version in {cache_file}")
+            return cls(**{name: data[name] for name in CACHE_ARRAYS})
+
+    def lane_shape(self, lane):
+        """
+        Returns the (points, 2) shape of lane index `lane`.
+        """
+        return self.lane_shape_points[self.lane_shape_offsets[lane]:self.lane_shape_offsets[lane + 1]]
+
+    def successors(self, edge):
+        """
+        Returns the indices of the edges reachable from edge index `edge`.
+        """
+        return self.targets[self.offsets[edge]:self.offsets[edge + 1]]
+
+    def reverse_csr(self):
+        """
+        Returns (offsets, sources) of the reversed graph: the predecessors of
+        edge index v are sources[offsets[v]:offsets[v + 1]]. Built on first use.
+        """
+        if self._reverse is None:
+            order = np.argsort(self.targets, kind="stable")
+            offsets = np.zeros(self.num_edges + 1, dtype=np.int64)
+            np.cumsum(np.bincount(self.targets, minlength=self.num_edges), out=offsets[1:])
+            self._reverse = (offsets, self.arc_source[order])
+        return self._reverse
+
+    def update_edge_costs(self, costs, edges=None):
+        """
+        Refresh the dynamic edge costs without touching the topology.
+        Args:
+            costs (array-like): New costs (e.g. travel times in seconds).
+            edges (array-like): Edge indices the costs belong to, or None when
+                costs holds one value per edge in graph order.
+        """
+        if edges is None:
+            self.edge_cost[:] = costs
+        else:
+            self.edge_cost[edges] = costs
+        self.weights = self.edge_cost[self.arc_source]
+
+    def reset_edge_costs(self):
+        """
+        Restore the free-flow travel times.
+        """
+        self.update_edge_costs(self.free_flow_cost)
+
+    def to_adjacency(self):
+        """
+        Returns the graph as {edge_id: {next_edge_id: weight}}.
+        """
+        edge_ids = self.edge_ids.tolist()
+        targets = self.targets.tolist()
+        weights = self.weights.tolist()
+        offsets = self.offsets.tolist()
+        return {
+            edge_ids[i]: {edge_ids[targets[k]]: weights[k] for k in range(offsets[i], offsets[i + 1])}
+            for i in range(self.num_edges)
+        }
+
+    def to_networkx(self):
+        """
+        Returns an edge-based nx.DiGraph with 'weight' and 'length' arc attributes.
+        """
+        import networkx as nx
+
+        edge_ids = self.edge_ids.tolist()
+        lengths = self.edge_length.tolist()
+        G = nx.DiGraph()
+        G.add_nodes_from(edge_ids)
+        G.add_edges_from(
+            (edge_ids[u], edge_ids[v], {"weight": w, "length": lengths[u]})
+            for u, v, w in zip(self.arc_source.tolist(), self.targets.tolist(), self.weights.tolist())
+        )
+        return G
+
+    def to_node_networkx(self, weight="length"):
+        """
+        Returns a junction-based nx.DiGraph where each SUMO edge is an arc
+        between its from and to nodes, carrying the edge 'id' and 'weight'.
+        Args:
+            weight (str): 'length' for edge lengths or 'cost' for the current edge costs.
+        """
+        import networkx as nx
+
+        node_ids = self.node_ids.tolist()
+        values = (self.edge_length if weight == "length" else self.edge_cost).tolist()
+        G = nx.DiGraph()
+        G.add_edges_from(
+            (node_ids[u], node_ids[v], {"id": edge_id, "weight": w})
+            for u, v, edge_id, w in zip(self.edge_from.tolist(), self.edge_to.tolist(),
+                                        self.edge_ids.tolist(), values)
+        )
+        return G
+
+    def update_networkx_weights(self, G):
+        """
+        Copy the current edge costs into a graph built by to_networkx().
+        """
+        edge_ids = self.edge_ids.tolist()
+        for u, v, w in zip(self.arc_source.tolist(), self.targets.tolist(), self.weights.tolist()):
+            G[edge_ids[u]][edge_ids[v]]["weight"] = w
+
+
+def load_routing_graph(net_file="osm.net.xml", use_cache=True):
+    """
+    Load the routing graph for a network, parsing the XML only when no cache
+    matching the current file contents exists.
+    Args:
+        net_file (str): Path to the .net.xml file.
+        use_cache (bool): Read and write the binary cache next to the network.
+    Returns:
+        RoutingGraph: Graph with free-flow weights.
+    """
+    if not use_cache:
+        return RoutingGraph.from_net_file(net_file)
+
+    cache_file = cache_path_for(net_file, file_digest(net_file))
+    if os.path.exists(cache_file):
+        try:
+            return RoutingGraph.load(cache_file)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Ignoring unreadable routing graph cache {cache_file}: {e}")
+
+    graph = RoutingGraph.from_net_file(net_file)
+    try:
+        graph.save(cache_file)
+    except OSError as e:
+        print(f"Could not write routing graph cache {cache_file}: {e}")
+    return graph
+
+
+# Main Execution
+if __name__ == "__main__":
+    import sys
+
+    net_file = sys.argv[1] if len(sys.argv) > 1 else "osm.net.xml"
+    graph = load_routing_graph(net_file)
+    print(f"Routing graph for {net_file}: {graph.num_edges} edges, {graph.num_arcs} connections.")
+    print(f"Cache: {cache_path_for(net_file, file_digest(net_file))}")
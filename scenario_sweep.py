@@ -0,0 +1,296 @@
+import hashlib
+import itertools
+import json
+import os
+import random
+import sys
+import time
+import traceback
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import get_context
+
+import pandas as pd
+
+from sumo_backend import sumo_command, use_backend
+
+# Parameters of a single run and their defaults (the values of 5_cars_dynamic_v1.py)
+DEFAULT_PARAMETERS = {
+    "seed": 42,
+    "vehicle_limit": 4000,
+    "free_flow_range": (1400, 1600),
+    "high_removal_rate": 0.03,
+    "low_removal_rate": 0.005,
+    "removal_interval": 5,
+    "reroute_interval": 10,
+    "congestion_threshold": None,  # Only reroute tracked vehicles slower than this (m/s)
+    "max_steps": 1600,
+}
+
+# Vehicles rerouted and reported in every run
+TRACKED_VEHICLES = ["veh162", "veh179", "veh2276", "veh639", "veh594"]
+
+# Outputs of the .sumocfg that every run would otherwise write to the same file; "NUL" discards them
+DISCARDED_OUTPUTS = ["--fcd-output", "NUL", "--summary-output", "NUL"]
+
+
+def parameter_grid(**axes):
+    """
+    Every combination of the given parameter values, on top of DEFAULT_PARAMETERS.
+    Example: parameter_grid(seed=range(5), reroute_interval=[5, 10, 20]) gives 15 runs.
+    Returns:
+        list: One parameter dict per run.
+    """
+    names = list(axes)
+    return [{**DEFAULT_PARAMETERS, **dict(zip(names, values))}
+            for values in itertools.product(*(list(axes[name]) for name in names))]
+
+
+def run_id(parameters):
+    """
+    Stable name of a run, derived from its parameters, so a restarted sweep finds finished runs.
+    """
+    key = json.dumps(parameters, sort_keys=True, default=list)
+    return hashlib.sha1(key.encode()).hexdigest()[:12]
+
+
+def read_tripinfo(tripinfo_file):
+    """
+    Duration and time loss of every trip that finished.
+    Returns:
+        dict: {vehicle ID: (duration, time loss, route length)} in seconds and meters.
+    """
+    trips = {}
+    for _, element in ET.iterparse(tripinfo_file):
+        if element.tag == "tripinfo":
+            trips[element.get("id")] = (float(element.get("duration")), float(element.get("timeLoss")),
+                                        float(element.get("routeLength")))
+            element.clear()
+    return trips
+
+
+def run_scenario(parameters, run_dir, sumo_config="osm_adjusted.sumocfg", net_file="osm.net.xml",
+                 backend="sumo", resume=None, checkpoints=(), checkpoint_dir="CHECKPOINTS"):
+    """
+    Run one simulation with removal and rerouting set by the parameters. Runs in a worker process.
+    Args:
+        resume (str): Checkpoint saved by warm_up() to start from instead of step 0; the
+            trip metrics then cover the trips that end after it, and the seed only
+            varies the vehicle removal (SUMO's random state comes from the checkpoint).
+        checkpoints (iterable): Steps after which to save a checkpoint in checkpoint_dir.
+    Returns:
+        dict: Parameters and metrics of the run, one row of the result table.
+    """
+    use_backend(backend)  # Before traci is imported in this process
+    from customizable_hierarchy import load_customizable_hierarchy
+    from edge_state import EdgeStateCollector
+    from simulation_runner import (FunctionHook, RemovalPolicy, ReroutePolicy, SimulationRunner,
+                                   TrafficTrends, thirds)
+
+    os.makedirs(run_dir, exist_ok=True)
+    tripinfo_file = os.path.join(run_dir, "tripinfo.xml")
+    sumo_cmd = sumo_command(sumo_config, "--seed", str(parameters["seed"]), "--tripinfo-output", tripinfo_file,
+                            "--verbose", "false", *DISCARDED_OUTPUTS, backend=backend)
+
+    hierarchy = load_customizable_hierarchy(net_file)
+    edge_state = EdgeStateCollector(hierarchy.graph.edge_ids.tolist())
+
+    def update_route_weights():
+        edge_state.collect()
+        hierarchy.customize(edge_state.edge_costs(hierarchy.graph))
+
+    def start_hook(runner):
+        edge_state.subscribe()
+        # Vehicle removal; after a restored checkpoint, so that forks of one warm-up still differ by seed
+        random.seed(parameters["seed"])
+
+    max_steps = parameters["max_steps"]
+    trends = TrafficTrends()
+    removal = RemovalPolicy(parameters["vehicle_limit"], parameters["high_removal_rate"],
+                            parameters["low_removal_rate"], tuple(parameters["free_flow_range"]),
+                            every=parameters["removal_interval"], latch=False, verbose=False)
+    reroute = ReroutePolicy(hierarchy.find_route, TRACKED_VEHICLES, every=parameters["reroute_interval"],
+                            prepare=update_route_weights, max_speed=parameters["congestion_threshold"])
+    runner = SimulationRunner(sumo_cmd, max_steps, stages=thirds(max_steps), checkpoints=checkpoints,
+                              checkpoint_dir=checkpoint_dir, resume=resume, hooks=[
+        trends,
+        FunctionHook(start=start_hook),
+        removal,
+        reroute,
+    ])
+    wall_start = time.perf_counter()
+    runner.run()
+    wall_time = time.perf_counter() - wall_start
+
+    trips = read_tripinfo(tripinfo_file)
+    tracked = [trips[veh_id] for veh_id in TRACKED_VEHICLES if veh_id in trips]
+    row = dict(parameters)
+    row["free_flow_range"] = "-".join(str(v) for v in parameters["free_flow_range"])
+    row.update({
+        "wall_time": wall_time,
+        "max_vehicles": trends.max_vehicles,
+        "mean_speed": trends.mean_speed,
+        "vehicles_inserted": trends.vehicles_inserted,
+        "vehicles_arrived": trends.vehicles_removed,
+        "vehicles_removed": removal.removed,
+        "rerouted": reroute.rerouted,
+        "trips": len(trips),
+        "mean_duration": sum(t[0] for t in trips.values()) / len(trips) if trips else float("nan"),
+        "mean_time_loss": sum(t[1] for t in trips.values()) / len(trips) if trips else float("nan"),
+        "tracked_trips": len(tracked),
+        "tracked_mean_duration": sum(t[0] for t in tracked) / len(tracked) if tracked else float("nan"),
+    })
+    for stage in ("start", "peak", "offpeak"):
+        row[f"{stage}_mean_speed"] = trends.stage_mean_speed(stage)
+    return row
+
+
+def warm_up(parameters, step, checkpoint_dir="CHECKPOINTS", **options):
+    """
+    Run the common warm-up once and save it as a checkpoint the sweep can fork from.
+    Args:
+        parameters (dict): Parameters of the warm-up, e.g. DEFAULT_PARAMETERS.
+        step (int): Last step of the warm-up.
+        options: sumo_config, net_file and backend as for run_scenario().
+    Returns:
+        str: The checkpoint, to pass as ScenarioSweep(warm_start=...).
+    """
+    parameters = {**parameters, "max_steps": step + 1}
+    run_scenario(parameters, os.path.join(checkpoint_dir, "warm_up"), checkpoints=[step],
+                 checkpoint_dir=checkpoint_dir, **options)
+    from simulation_runner import checkpoint_path  # After run_scenario() selected the backend
+    return checkpoint_path(checkpoint_dir, step)
+
+
+def _run_and_store(parameters, run_dir, options):
+    row = run_scenario(parameters, run_dir, **options)
+    # Written last and atomically: a metrics file means the run is finished
+    path = os.path.join(run_dir, "metrics.json")
+    with open(path + ".tmp", "w") as f:
+        json.dump(row, f)
+    os.replace(path + ".tmp", path)
+    return row
+
+
+class ScenarioSweep:
+    """
+    Runs a parameter grid of independent simulations in parallel and collects one result table.
+
+    Every run is a separate worker process with its own SUMO instance; TraCI
+    picks a free port per traci.start() (libsumo needs none), so runs never
+    share a connection. Each finished run leaves sweep_dir/<run ID>/metrics.json:
+    restarting the sweep skips those runs, and runs that raise are retried.
+    """
+
+    def __init__(self, grid, sweep_dir="SWEEP", workers=None, retries=2, backend="sumo",
+                 sumo_config="osm_adjusted.sumocfg", net_file="osm.net.xml", warm_start=None):
+        """
+        Args:
+            grid (list): Parameter dicts, e.g. from parameter_grid().
+            sweep_dir (str): Directory of the run outputs and the result table.
+            workers (int): Simultaneous runs, by default one per CPU.
+            retries (int): Extra attempts of a run that failed.
+            backend (str): sumo, libsumo or sumo-gui (see sumo_backend).
+            warm_start (str): Checkpoint from warm_up() every run forks from, None to
+                run every warm-up again.
+        """
+        # Runs forked from a warm start are different runs than the same parameters from step 0
+        self.runs = {run_id(parameters if warm_start is None else {**parameters, "warm_start": warm_start}):
+                     parameters for parameters in grid}
+        self.sweep_dir = sweep_dir
+        self.workers = workers or os.cpu_count() or 1
+        self.retries = retries
+        self.options = {"sumo_config": sumo_config, "net_file": net_file, "backend": backend,
+                        "resume": warm_start}
+        self.failures = {}
+
+    def _run_dir(self, key):
+        return os.path.join(self.sweep_dir, key)
+
+    def finished(self):
+        """
+        IDs of the runs whose metrics are already on disk.
+        """
+        return {key for key in self.runs if os.path.exists(os.path.join(self._run_dir(key), "metrics.json"))}
+
+    def run(self):
+        """
+        Run every unfinished run, retrying failures, then write the result table.
+        Returns:
+            pd.DataFrame: One row per run of the grid.
+        """
+        todo = [key for key in self.runs if key not in self.finished()]
+        print(f"{len(self.runs)} runs, {len(self.runs) - len(todo)} already finished, "
+              f"{len(todo)} to run on {self.workers} workers")
+        attempts = dict.fromkeys(todo, 0)
+        while todo:
+            retry = []
+            # Spawned workers import traci fresh, so each can pick its backend. A new pool per
+            # round, because a run that kills its worker (e.g. SUMO crashing) breaks the pool.
+            with ProcessPoolExecutor(self.workers, mp_context=get_context("spawn")) as executor:
+                futures = {executor.submit(_run_and_store, self.runs[key], self._run_dir(key), self.options): key
+                           for key in todo}
+                for future in as_completed(futures):
+                    key = futures[future]
+                    attempts[key] += 1
+                    try:
+                        future.result()
+                        print(f"Run {key} finished")
+                    except Exception as e:
+                        error = "".join(traceback.format_exception_only(type(e), e)).strip()
+                        if attempts[key] <= self.retries:
+                            print(f"Run {key} failed (attempt {attempts[key]}): {error}; retrying")
+                            retry.append(key)
+                        else:
+                            print(f"Run {key} failed after {attempts[key]} attempts: {error}")
+                            self.failures[key] = error
+            todo = retry
+        return self.write_table()
+
+    def collect(self):
+        """
+        Result table of the runs finished so far, failed runs with their error.
+        """
+        rows = []
+        for key, parameters in self.runs.items():
+            path = os.path.join(self._run_dir(key), "metrics.json")
+            if os.path.exists(path):
+                with open(path) as f:
+                    row = {"run_id": key, "status": "finished", **json.load(f)}
+            else:
+                row = {"run_id": key, "status": "failed" if key in self.failures else "missing",
+                       "error": self.failures.get(key), **parameters}
+                row["free_flow_range"] = "-".join(str(v) for v in parameters["free_flow_range"])
+            rows.append(row)
+        return pd.DataFrame(rows)
+
+    def write_table(self):
+        """
+        Write the result table as Parquet (CSV when no Parquet engine is installed).
+        """
+        table = self.collect()
+        os.makedirs(self.sweep_dir, exist_ok=True)
+        try:
+            path = os.path.join(self.sweep_dir, "results.parquet")
+            table.to_parquet(path, index=False)
+        except ImportError:
+            path = os.path.join(self.sweep_dir, "results.csv")
+            table.to_csv(path, index=False)
+        print(f"Results of {len(table)} runs saved to {path}")
+        return table
+
+
+# Main Execution
+if __name__ == "__main__":
+    seeds = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else None
+    grid = parameter_grid(seed=range(seeds), reroute_interval=[5, 10, 20], congestion_threshold=[None, 5.0])
+    warm_up_steps = int(sys.argv[3]) if len(sys.argv) > 3 else 0
+    # Share one warm-up between all runs (its seed and parameters are the defaults)
+    warm_start = warm_up(DEFAULT_PARAMETERS, warm_up_steps - 1) if warm_up_steps > 0 else None
+    sweep = ScenarioSweep(grid, workers=workers, warm_start=warm_start)
+    results = sweep.run()
+    finished = results[results["status"] == "finished"]
+    if not finished.empty:
+        print(finished.groupby(["reroute_interval", "congestion_threshold"], dropna=False)
+              [["mean_duration", "mean_time_loss", "tracked_mean_duration"]].mean())
@@ -0,0 +1,267 @@
+import queue
+import threading
+import time
+from collections import namedtuple
+
+import traci
+
+from fleet_telemetry import FleetTelemetry
+
+
+class StepSnapshot(namedtuple("StepSnapshot", ["step", "ids", "speeds", "positions", "edges",
+                                               "distances", "departed", "arrived", "edge_state"],
+                              defaults=(None,))):
+    """
+    Copy of one step's fleet state, safe to read in another thread while SUMO moves on.
+    """
+    __slots__ = ()
+
+    @classmethod
+    def from_telemetry(cls, step, telemetry, edge_state=None):
+        """
+        Copy the current buffers of a FleetTelemetry after update().
+        Args:
+            edge_state (EdgeStateCollector): Also collect and copy the edge subscription results.
+        """
+        return cls(step, list(telemetry.ids), telemetry.speeds.copy(), telemetry.positions.copy(),
+                   [telemetry.edge_ids[i] for i in telemetry.edge_indices.tolist()],
+                   telemetry.distances.copy(), telemetry.departed, telemetry.arrived,
+                   edge_state.collect().copy() if edge_state is not None else None)
+
+    @property
+    def count(self):
+        return len(self.ids)
+
+    def mean_speed(self):
+        """
+        Average speed of all vehicles in the network (0 when it is empty).
+        """
+        return float(self.speeds.mean()) if self.count > 0 else 0
+
+
+class CommandBatch:
+    """
+    Vehicle commands queued by analytics threads and sent to SUMO together.
+
+    TraCI is not thread-safe, so only the thread that steps the simulation
+    talks to SUMO. Other threads record what they want changed and flush()
+    sends it between two steps: removals first, then routes and colours of
+    the vehicles that are still there. The newest route per vehicle wins.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._removals = set()
+        self._routes = {}
+        self._colors = {}
+        self.sent = 0
+        self.failed = 0
+
+    def remove(self, veh_id):
+        with self._lock:
+            self._removals.add(veh_id)
+
+    def set_route(self, veh_id, edges):
+        with self._lock:
+            self._routes[veh_id] = list(edges)
+
+    def set_color(self, veh_id, color):
+        with self._lock:
+            self._colors[veh_id] = color
+
+    def __len__(self):
+        with self._lock:
+            return len(self._removals) + len(self._routes) + len(self._colors)
+
+    def flush(self):
+        """
+        Send the queued commands to SUMO. Call from the stepping thread only.
+        Returns:
+            int: Number of commands sent.
+        """
+        with self._lock:
+            removals, routes, colors = self._removals, self._routes, self._colors
+            self._removals, self._routes, self._colors = set(), {}, {}
+
+        commands = [(traci.vehicle.remove, veh_id, ()) for veh_id in removals]
+        commands += [(traci.vehicle.setRoute, veh_id, (edges,))
+                     for veh_id, edges in routes.items() if veh_id not in removals]
+        commands += [(traci.vehicle.setColor, veh_id, (color,))
+                     for veh_id, color in colors.items() if veh_id not in removals]
+        sent = 0
+        for command, veh_id, args in commands:
+            try:
+                command(veh_id, *args)
+                sent += 1
+            except traci.TraCIException:
+                # The vehicle arrived in the meantime or the route no longer starts at its edge
+                self.failed += 1
+        self.sent += sent
+        return sent
+
+
+class PipelinedRunner:
+    """
+    Simulation loop that overlaps SUMO's steps with the Python analytics.
+
+    The main thread only steps SUMO, copies the subscription results into a
+    StepSnapshot and flushes the CommandBatch. Every consumer runs in its own
+    thread and reads snapshots from its own queue. While a consumer analyses
+    step t, SUMO already computes step t + 1. The main thread blocks on the
+    socket during a step and releases the GIL, so the two really overlap.
+
+    max_lag bounds how far consumers may fall behind. Before SUMO advances
+    from step t, every consumer has finished step t - max_lag, so commands
+    issued for step t reach SUMO before step t + max_lag + 1. A consumer only
+    starts step t once the commands of step t - 1 have been sent, so the
+    commands of step t are sent at exactly that point whatever the thread
+    timing, and runs are reproducible. With max_lag=0 the loop runs in lockstep
+    like the original scripts.
+    """
+
+    def __init__(self, sumo_cmd, max_steps, telemetry=None, max_lag=1, edge_state=None):
+        """
+        Args:
+            sumo_cmd (list): Command passed to traci.start().
+            max_steps (int): Number of simulation steps to run.
+            telemetry (FleetTelemetry): Subscriptions to read, a new one by default.
+            max_lag (int): Steps the consumers may lag behind SUMO.
+            edge_state (EdgeStateCollector): Edge subscriptions copied into every snapshot.
+        """
+        self.sumo_cmd = sumo_cmd
+        self.max_steps = max_steps
+        self.telemetry = telemetry if telemetry is not None else FleetTelemetry()
+        self.max_lag = max_lag
+        self.edge_state = edge_state
+        self.commands = CommandBatch()
+        self._consumers = []
+        self._progress = threading.Condition()
+        self._error = None
+        self._aborted = False  # Set when the main loop ends, so no consumer waits for a gate that stays shut
+        self._gate = 0  # Latest step the consumers may start
+        self.sumo_time = 0.0
+        self.main_time = 0.0
+        self.lag_wait_time = 0.0
+        self.steps = 0
+
+    def add_consumer(self, consumer, name=None):
+        """
+        Register a function consumer(snapshot, commands) called once per step in its own thread.
+        """
+        self._consumers.append({"function": consumer, "name": name or consumer.__name__,
+                                "queue": queue.Queue(), "done": -1, "busy": 0.0})
+
+    def _consume(self, consumer):
+        function, snapshots = consumer["function"], consumer["queue"]
+        while True:
+            snapshot = snapshots.get()
+            if snapshot is None:
+                return
+            with self._progress:
+                while not self._aborted and self._error is None and self._gate < snapshot.step:
+                    self._progress.wait()
+                if self._aborted:
+                    return
+            start = time.perf_counter()
+            try:
+                function(snapshot, self.commands)
+            except Exception as e:
+                with self._progress:
+                    self._error = e
+                    self._progress.notify_all()
+                return
+            consumer["busy"] += time.perf_counter() - start
+            with self._progress:
+                consumer["done"] = snapshot.step
+                self._progress.notify_all()
+
+    def _open_gate(self, step):
+        with self._progress:
+            self._gate = max(self._gate, step)
+            self._progress.notify_all()
+
+    def _wait_for(self, step):
+        with self._progress:
+            while self._error is None and any(c["done"] < step for c in self._consumers):
+                self._progress.wait()
+            if self._error is not None:
+                raise self._error
+
+    def run(self, setup=None, first_step=0, sync_steps=(), on_sync=None):
+        """
+        Start SUMO, run max_steps steps and close the connection.
+        Args:
+            setup (callable): Called once after traci.start(), e.g. for extra subscriptions.
+            first_step (int): Number of the first step, e.g. after a loaded state.
+            sync_steps (iterable): Steps after which SUMO waits until every consumer
+                has caught up and all commands are sent, then calls on_sync(step).
+            on_sync (callable): Called in the main thread at the sync steps, e.g. to save a checkpoint.
+        """
+        for consumer in self._consumers:
+            consumer["done"] = first_step - 1
+        self._aborted = False
+        self._gate = first_step - self.max_lag
+        threads = [threading.Thread(target=self._consume, args=(consumer,), daemon=True)
+                   for consumer in self._consumers]
+        for thread in threads:
+            thread.start()
+
+        traci.start(self.sumo_cmd)
+        try:
+            self.telemetry.subscribe()
+            if setup is not None:
+                setup()
+            for step in range(first_step, self.max_steps):
+                start = time.perf_counter()
+                traci.simulationStep()
+                stepped = time.perf_counter()
+                self.sumo_time += stepped - start
+
+                self.telemetry.update()
+                snapshot = StepSnapshot.from_telemetry(step, self.telemetry, self.edge_state)
+                for consumer in self._consumers:
+                    consumer["queue"].put(snapshot)
+
+                waited = time.perf_counter()
+                self._wait_for(step - self.max_lag)
+                flushed = time.perf_counter()
+                self.lag_wait_time += flushed - waited
+                self.commands.flush()
+                self._open_gate(step - self.max_lag + 1)
+                if step in sync_steps:
+                    self._open_gate(step)
+                    self._wait_for(step)
+                    self.commands.flush()
+                    on_sync(step)
+                self.main_time += (waited - stepped) + (time.perf_counter() - flushed)
+                self.steps += 1
+
+            # Let the consumers finish and send their last commands
+            self._open_gate(self.max_steps - 1)
+            self._wait_for(self.max_steps - 1)
+            self.commands.flush()
+        finally:
+            # Also wakes consumers waiting at the gate when SUMO or the loop failed in between
+            with self._progress:
+                self._aborted = True
+                self._progress.notify_all()
+            try:
+                for consumer in self._consumers:
+                    consumer["queue"].put(None)
+                for thread in threads:
+                    thread.join()
+            finally:
+                traci.close()
+
+    def report(self):
+        """
+        Print where the time per step went.
+        """
+        steps = max(self.steps, 1)
+        print(f"Pipelined loop: {self.steps} steps, {self.commands.sent} commands sent "
+              f"({self.commands.failed} failed)")
+        print(f"  waiting on SUMO:        {self.sumo_time / steps * 1000:8.2f} ms/step")
+        print(f"  Python in main thread:  {self.main_time / steps * 1000:8.2f} ms/step")
+        print(f"  waiting on consumers:   {self.lag_wait_time / steps * 1000:8.2f} ms/step")
+        for consumer in self._consumers:
+            print(f"  {consumer['name'] + ':':<24}{consumer['busy'] / steps * 1000:8.2f} ms/step (in its thread)")
@@ -0,0 +1,690 @@
+import os
+import pickle
+import random
+import time
+
+import traci
+
+from edge_density import EdgeDensity
+from edge_state import EdgeStateCollector
+from fleet_telemetry import FleetTelemetry
+from heatmap_grid import DEFAULT_BINS, HeatmapGrid, network_boundary
+from simulation_pipeline import CommandBatch, PipelinedRunner, StepSnapshot
+
+
+def thirds(max_steps):
+    """
+    Stage function splitting a run into equal 'start', 'peak' and 'offpeak' thirds.
+    """
+    def stage_of(data):
+        if data.step < max_steps // 3:
+            return "start"
+        if data.step < 2 * max_steps // 3:
+            return "peak"
+        return "offpeak"
+    return stage_of
+
+
+class StepData:
+    """
+    Everything the hooks read about one step, fetched from SUMO at most once.
+
+    Fleet state (IDs, speeds, positions, edges, distances, departures and
+    arrivals) comes from the subscription snapshot. Values that are not
+    subscribed are queried the first time a hook asks for them: routes once
+    per step, vehicle types and destinations once per vehicle.
+    """
+
+    def __init__(self, snapshot, runner):
+        self.snapshot = snapshot
+        self.step = snapshot.step
+        self.stage = None
+        self._runner = runner
+        self._mean_speed = None
+        self._index = None
+        self._routes = {}
+
+    @property
+    def ids(self):
+        return self.snapshot.ids
+
+    @property
+    def count(self):
+        return self.snapshot.count
+
+    @property
+    def speeds(self):
+        return self.snapshot.speeds
+
+    @property
+    def positions(self):
+        return self.snapshot.positions
+
+    @property
+    def distances(self):
+        return self.snapshot.distances
+
+    @property
+    def departed(self):
+        return self.snapshot.departed
+
+    @property
+    def edge_state(self):
+        """
+        Edge subscription results of the step (EdgeStateCollector.state), when the runner collects them.
+        """
+        return self.snapshot.edge_state
+
+    @property
+    def arrived(self):
+        return self.snapshot.arrived
+
+    def mean_speed(self):
+        if self._mean_speed is None:
+            self._mean_speed = self.snapshot.mean_speed()
+        return self._mean_speed
+
+    def __contains__(self, veh_id):
+        return self.index(veh_id) is not None
+
+    def index(self, veh_id):
+        """
+        Row of a vehicle in the snapshot arrays, None when it is not in the network.
+        """
+        if self._index is None:
+            self._index = {veh_id: i for i, veh_id in enumerate(self.snapshot.ids)}
+        return self._index.get(veh_id)
+
+    def edge(self, veh_id):
+        i = self.index(veh_id)
+        return None if i is None else self.snapshot.edges[i]
+
+    def _require_live(self, what):
+        if self._runner.pipelined:
+            raise RuntimeError(f"{what} queries SUMO and is only available when hooks run in lockstep")
+
+    def route(self, veh_id):
+        """
+        Current route (edge IDs) of a vehicle, queried once per step.
+        """
+        route = self._routes.get(veh_id)
+        if route is None:
+            self._require_live("StepData.route()")
+            route = self._routes[veh_id] = traci.vehicle.getRoute(veh_id)
+        return route
+
+    def vehicle_type(self, veh_id):
+        """
+        Type ID of a vehicle, queried once for its whole trip.
+        """
+        types = self._runner.vehicle_types
+        vehicle_type = types.get(veh_id)
+        if vehicle_type is None:
+            self._require_live("StepData.vehicle_type()")
+            vehicle_type = types[veh_id] = traci.vehicle.getTypeID(veh_id)
+        return vehicle_type
+
+    def destination(self, veh_id):
+        """
+        Last edge of a vehicle's route when it was first asked for.
+        """
+        destinations = self._runner.destinations
+        destination = destinations.get(veh_id)
+        if destination is None:
+            destination = destinations[veh_id] = self.route(veh_id)[-1]
+        return destination
+
+
+class Hook:
+    """
+    Base class of the per-step hooks registered with a SimulationRunner.
+
+    step() is called every `every` steps with the StepData and the
+    CommandBatch whose commands are sent to SUMO before the next step.
+    Hooks with thread_safe set only read the snapshot and queue commands,
+    so they can also run in the analytics thread of a pipelined run.
+    The attributes named in state_attributes are saved with a checkpoint
+    and restored when a run forks from it. Hooks with uses_edge_state set
+    read StepData.edge_state, which the runner then collects every step.
+    """
+    every = 1
+    thread_safe = True
+    state_attributes = ()
+    uses_edge_state = False
+
+    def start(self, runner):
+        """
+        Called once after traci.start(), before the first step.
+        """
+
+    def step(self, data, commands):
+        """
+        Called every `every` steps.
+        """
+
+    def finish(self, runner):
+        """
+        Called once after traci.close().
+        """
+
+    def get_state(self):
+        return {name: getattr(self, name) for name in self.state_attributes}
+
+    def set_state(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+
+
+class TrafficTrends(Hook):
+    """
+    Vehicle count and mean speed per step, inserted/arrived totals and
+    stage mean speeds (kept in the runner's FleetTelemetry).
+    """
+    state_attributes = ("vehicle_count_history", "speed_history", "vehicles_inserted", "vehicles_removed")
+
+    def __init__(self, log_every=None):
+        """
+        Args:
+            log_every (int): Print the count and mean speed every n steps, never by default.
+        """
+        self.log_every = log_every
+        self.vehicle_count_history = []
+        self.speed_history = []
+        self.vehicles_inserted = 0
+        self.vehicles_removed = 0
+        self._telemetry = None
+
+    def start(self, runner):
+        self._telemetry = runner.telemetry
+
+    def step(self, data, commands):
+        avg_speed = data.mean_speed()
+        self.vehicle_count_history.append(data.count)
+        self.speed_history.append(avg_speed)
+        self.vehicles_inserted += data.departed
+        self.vehicles_removed += data.arrived
+        if data.stage is not None:
+            self._telemetry.record_stage(data.stage, avg_speed)
+        if self.log_every and data.step % self.log_every == 0:
+            print(f"Step {data.step}: {data.count} vehicles, Avg Speed: {avg_speed:.2f} m/s")
+
+    @property
+    def max_vehicles(self):
+        return max(self.vehicle_count_history, default=0)
+
+    @property
+    def mean_speed(self):
+        return sum(self.speed_history) / len(self.speed_history) if self.speed_history else 0
+
+    def stage_mean_speed(self, stage):
+        return self._telemetry.stage_mean_speed(stage) if stage in self._telemetry.stage_steps else 0
+
+
+class StageHeatmaps(Hook):
+    """
+    Vehicle positions binned per stage into HeatmapGrids for the heatmaps.
+    Memory stays constant however long the run is.
+
+    With a SamplingPolicy only the steps and vehicles it selects are binned;
+    the grids then estimate the full-collection histogram and carry its
+    error bounds (heatmap_sampling.SampledHeatmapGrid).
+    """
+    state_attributes = ("grids", "sampling")
+
+    def __init__(self, capture=None, net_file="osm.net.xml", bins=DEFAULT_BINS, extent=None, sampling=None):
+        """
+        Args:
+            capture (callable): Function (StepData) -> stage name, or None to skip
+                the step; by default every step is collected under its runner stage.
+            net_file (str): Network whose boundary is the extent of the grids.
+            bins (tuple): Number of bins along x and y.
+            extent (tuple): (x_min, x_max, y_min, y_max) instead of the network boundary.
+            sampling (SamplingPolicy): e.g. EveryKthStep(5), ReservoirSampling(500) or
+                AdaptiveSampling(); every position is binned by default.
+        """
+        self.capture = capture
+        self.net_file = net_file
+        self.bins = bins
+        self.extent = extent
+        self.sampling = sampling
+        self.grids = {}
+
+    def start(self, runner):
+        if self.extent is None:
+            self.extent = network_boundary(self.net_file)
+
+    def step(self, data, commands):
+        stage = data.stage if self.capture is None else self.capture(data)
+        if stage is not None and data.count:
+            grid = self.grids.get(stage)
+            if grid is None:
+                grid = self.grids[stage] = (HeatmapGrid(self.extent, self.bins) if self.sampling is None
+                                            else self.sampling.new_grid(self.extent, self.bins))
+            if self.sampling is None:
+                grid.add(data.positions)
+            else:
+                self.sampling.sample(data, stage, grid)
+
+    def finish(self, runner):
+        if self.sampling is None:
+            return
+        print(f"Heatmap sampling ({self.sampling.describe()}):")
+        for stage, grid in self.grids.items():
+            print(f"  {stage}: {grid.samples} of {grid.vehicle_steps} positions binned "
+                  f"({grid.sampled_steps} of {grid.steps} steps, {grid.positions_skipped} not binned), "
+                  f"{grid.error_label(1)} of the heatmap")
+
+    def grid(self, stage):
+        """
+        HeatmapGrid of a stage, None when no vehicle was seen in it.
+        """
+        return self.grids.get(stage)
+
+
+class StageEdgeDensity(Hook):
+    """
+    Vehicle-seconds, mean speed and occupancy per edge and stage from the
+    edge subscriptions (EdgeDensity), for network-shaped maps drawn with
+    edge_density.draw_edge_map(). Only O(edges) sums are kept per stage.
+    """
+    state_attributes = ("densities",)
+    uses_edge_state = True
+
+    def __init__(self, capture=None, step_length=1.0):
+        """
+        Args:
+            capture (callable): Function (StepData) -> stage name, or None to skip
+                the step; by default every step is collected under its runner stage.
+            step_length (float): Seconds per simulation step.
+        """
+        self.capture = capture
+        self.step_length = step_length
+        self.edge_ids = None
+        self.densities = {}
+
+    def start(self, runner):
+        self.edge_ids = runner.edge_state.edge_ids
+
+    def step(self, data, commands):
+        stage = data.stage if self.capture is None else self.capture(data)
+        if stage is not None:
+            density = self.densities.get(stage)
+            if density is None:
+                density = self.densities[stage] = EdgeDensity(self.edge_ids)
+            density.add(data.edge_state, self.step_length)
+
+    def density(self, stage):
+        """
+        EdgeDensity of a stage, None when no step was collected for it.
+        """
+        return self.densities.get(stage)
+
+
+class RemovalPolicy(Hook):
+    """
+    Random vehicle removal once the network holds too many vehicles.
+
+    With a free-flow range, the high rate applies above it and the low rate
+    inside it; without one, the high rate applies at every removal step.
+    When latched, removal keeps going after the count first reached the
+    limit, otherwise only while the count is at or above it. The limit is
+    checked on every step; only the removal itself waits for the interval.
+    """
+    state_attributes = ("activated", "removed")
+
+    def __init__(self, vehicle_limit, high_rate, low_rate=None, free_flow_range=None, every=1,
+                 latch=True, verbose=True):
+        self.vehicle_limit = vehicle_limit
+        self.high_rate = high_rate
+        self.low_rate = low_rate
+        self.free_flow_range = free_flow_range
+        self.interval = every  # Steps between removals; the hook itself runs every step
+        self.latch = latch
+        self.verbose = verbose
+        self.activated = False
+        self.removed = 0
+
+    def step(self, data, commands):
+        at_limit = data.count >= self.vehicle_limit
+        if at_limit and not self.activated:
+            self.activated = True
+            if self.verbose:
+                print(f"Vehicle limit reached: {self.vehicle_limit}. Initiating reduction mechanisms.")
+        if not (self.activated if self.latch else at_limit) or data.step % self.interval != 0:
+            return
+
+        if self.free_flow_range is None:
+            rate = self.high_rate
+        elif data.count > self.free_flow_range[1]:
+            rate = self.high_rate
+        elif self.free_flow_range[0] <= data.count:
+            rate = self.low_rate
+        else:
+            return
+        vehicles_to_remove = random.sample(data.ids, min(int(data.count * rate), data.count))
+        for veh_id in vehicles_to_remove:
+            commands.remove(veh_id)
+        self.removed += len(vehicles_to_remove)
+        if self.verbose:
+            print(f"Removed {len(vehicles_to_remove)} vehicles.")
+
+
+class ReroutePolicy(Hook):
+    """
+    Periodic rerouting of selected vehicles from their current edge to their destination.
+    """
+    thread_safe = False
+    state_attributes = ("rerouted",)
+
+    def __init__(self, find_route, vehicle_ids, every=10, prepare=None, max_speed=None):
+        """
+        Args:
+            find_route (callable): Function (current edge ID, target edge ID) -> list of
+                edge IDs, e.g. CustomizableHierarchy.find_route.
+            vehicle_ids (iterable): Vehicles to reroute.
+            every (int): Steps between reroutes.
+            prepare (callable): Called before a reroute round in which at least
+                one vehicle is in the network, e.g. to refresh edge weights.
+            max_speed (float): Only reroute vehicles slower than this (m/s), i.e. stuck
+                in congestion; None reroutes them whatever their speed.
+        """
+        self.find_route = find_route
+        self.vehicle_ids = list(vehicle_ids)
+        self.every = every
+        self.prepare = prepare
+        self.max_speed = max_speed
+        self.rerouted = 0
+
+    def step(self, data, commands):
+        present = [veh_id for veh_id in self.vehicle_ids if veh_id in data]
+        if self.max_speed is not None:
+            present = [veh_id for veh_id in present if data.speeds[data.index(veh_id)] < self.max_speed]
+        if not present:
+            return
+        if self.prepare is not None:
+            self.prepare()
+        for veh_id in present:
+            current_edge = data.edge(veh_id)
+            if current_edge.startswith(":"):  # Inside a junction
+                continue
+            target_edge = data.destination(veh_id)
+            new_route = self.find_route(current_edge, target_edge)
+            if not new_route:
+                print(f"No path found for vehicle {veh_id} from {current_edge} to {target_edge}.")
+                continue
+            commands.set_route(veh_id, new_route)
+            self.rerouted += 1
+            print(f"Vehicle '{veh_id}' rerouted dynamically.")
+
+
+class Highlight(Hook):
+    """
+    Colours vehicles once when they enter the network.
+    """
+    state_attributes = ("_done",)
+
+    def __init__(self, colors):
+        """
+        Args:
+            colors (dict): {vehicle ID: RGBA tuple}.
+        """
+        self.colors = dict(colors)
+        self._done = set()
+
+    def step(self, data, commands):
+        for veh_id, color in self.colors.items():
+            if veh_id not in self._done and veh_id in data:
+                commands.set_color(veh_id, color)
+                self._done.add(veh_id)
+
+
+class FunctionHook(Hook):
+    """
+    Wraps plain functions: step(data, commands), start(runner) and finish(runner).
+
+    The script's own tracking state (e.g. a vehicle_details dict or VehicleStats) can be
+    passed as state: it is saved with checkpoints and restored in place.
+    """
+
+    def __init__(self, step=None, start=None, finish=None, every=1, thread_safe=False, state=None):
+        self._step, self._start, self._finish = step, start, finish
+        self.every = every
+        self.thread_safe = thread_safe
+        self.state = state
+
+    def start(self, runner):
+        if self._start is not None:
+            self._start(runner)
+
+    def step(self, data, commands):
+        if self._step is not None:
+            self._step(data, commands)
+
+    def finish(self, runner):
+        if self._finish is not None:
+            self._finish(runner)
+
+    def get_state(self):
+        return self.state
+
+    def set_state(self, state):
+        if self.state is None:
+            self.state = state
+        elif isinstance(self.state, dict):
+            self.state.clear()
+            self.state.update(state)
+        else:
+            vars(self.state).update(vars(state))  # e.g. a VehicleStats, restored in place
+
+
+class ReportSink(FunctionHook):
+    """
+    Writes the reports with function(runner) once the simulation has ended.
+    """
+
+    def __init__(self, function):
+        super().__init__(finish=function, thread_safe=True)
+
+
+def checkpoint_path(checkpoint_dir, step):
+    """
+    Base path of the checkpoint taken after a step; SUMO's state is saved to
+    <base>.state.xml.gz and the Python-side state to <base>.pkl.
+    """
+    return os.path.join(checkpoint_dir, f"step_{step}")
+
+
+class SimulationRunner:
+    """
+    The simulation loop shared by the report and rerouting scripts.
+
+    It owns traci.start / simulationStep / close and builds one StepData per
+    step from the FleetTelemetry subscriptions, which every hook reads
+    instead of querying SUMO itself. Hooks run in registration order and
+    their commands are sent together before the next step, so a vehicle
+    removed by one hook is not rerouted by another.
+
+    With max_lag set, the hooks run in an analytics thread of a
+    PipelinedRunner while SUMO computes the next step; all of them must then
+    be thread_safe.
+
+    At the checkpoint steps the runner saves SUMO's state with
+    traci.simulation.saveState together with the hooks' state, the stage
+    aggregates and Python's random state. A runner with the same hooks
+    created with resume=<checkpoint> loads both and continues from the next
+    step, so several variants can share one warm-up.
+    """
+
+    def __init__(self, sumo_cmd, max_steps, hooks=(), stages=None, telemetry=None, max_lag=None,
+                 checkpoints=(), checkpoint_dir="CHECKPOINTS", resume=None, edge_state=None):
+        """
+        Args:
+            sumo_cmd (list): Command passed to traci.start().
+            max_steps (int): Number of simulation steps to run.
+            hooks (iterable): Hooks to register, see add().
+            stages (callable): Function (StepData) -> stage name stored in StepData.stage,
+                e.g. thirds(max_steps).
+            telemetry (FleetTelemetry): Subscriptions to read, a new one by default.
+            max_lag (int): Run the hooks pipelined, at most this many steps behind SUMO.
+            checkpoints (iterable): Steps after which to save a checkpoint.
+            checkpoint_dir (str): Directory of the saved checkpoints.
+            resume (str): Checkpoint to fork from (see checkpoint_path()), None to start at step 0.
+            edge_state (EdgeStateCollector): Edge subscriptions collected into StepData.edge_state
+                every step; created automatically when a hook uses_edge_state.
+        """
+        self.sumo_cmd = list(sumo_cmd)
+        self.max_steps = max_steps
+        self.stages = stages
+        self.telemetry = telemetry if telemetry is not None else FleetTelemetry()
+        self.max_lag = max_lag
+        self.checkpoints = set(checkpoints)
+        self.checkpoint_dir = checkpoint_dir
+        self.resume = resume
+        self.edge_state = edge_state
+        self.hooks = []
+        self.commands = CommandBatch()
+        self.vehicle_types = {}
+        self.destinations = {}
+        self.step = -1
+        self.first_step = 0
+        self.sumo_time = 0.0
+        self.hook_time = {}
+        self._pipeline = None
+        self._resume_state = None
+        if self.checkpoints:
+            # Also save SUMO's random number generators, so forks continue the same random stream
+            self.sumo_cmd += ["--save-state.rng", "true"]
+        for hook in hooks:
+            self.add(hook)
+
+    @property
+    def pipelined(self):
+        return self.max_lag is not None
+
+    def add(self, hook):
+        """
+        Register a hook; returns it so it can be kept for the report.
+        """
+        self.hooks.append(hook)
+        self.hook_time[hook] = 0.0
+        return hook
+
+    def _start_hooks(self):
+        if self._resume_state is not None:
+            self._restore(self._resume_state)
+        if self.edge_state is not None:
+            self.edge_state.subscribe()
+        for hook in self.hooks:
+            hook.start(self)
+
+    def _run_hooks(self, snapshot, commands):
+        self.step = snapshot.step
+        data = StepData(snapshot, self)
+        if self.stages is not None:
+            data.stage = self.stages(data)
+        for hook in self.hooks:
+            if snapshot.step % hook.every == 0:
+                start = time.perf_counter()
+                hook.step(data, commands)
+                self.hook_time[hook] += time.perf_counter() - start
+
+    def save_checkpoint(self, step):
+        """
+        Save SUMO's and the Python-side state after a step whose commands have been sent.
+        Returns:
+            str: Base path of the checkpoint.
+        """
+        os.makedirs(self.checkpoint_dir, exist_ok=True)
+        base = checkpoint_path(self.checkpoint_dir, step)
+        traci.simulation.saveState(base + ".state.xml.gz")
+        state = {
+            "step": step,
+            "hooks": [(type(hook).__name__, hook.get_state()) for hook in self.hooks],
+            "vehicle_types": self.vehicle_types,
+            "destinations": self.destinations,
+            "stage_speed_sum": self.telemetry.stage_speed_sum,
+            "stage_steps": self.telemetry.stage_steps,
+            "random": random.getstate(),
+        }
+        with open(base + ".pkl", "wb") as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        print(f"Checkpoint saved at step {step}: {base}")
+        return base
+
+    def _load_checkpoint(self, base):
+        with open(base + ".pkl", "rb") as f:
+            state = pickle.load(f)
+        saved = [name for name, _ in state["hooks"]]
+        if saved != [type(hook).__name__ for hook in self.hooks]:
+            raise ValueError(f"Checkpoint {base} was saved with hooks {saved}, "
+                             f"not {[type(hook).__name__ for hook in self.hooks]}")
+        state["base"] = base
+        return state
+
+    def _restore(self, state):
+        traci.simulation.loadState(state["base"] + ".state.xml.gz")
+        # Subscribe the vehicles loaded with the state
+        self.telemetry.subscribe()
+        for hook, (_, hook_state) in zip(self.hooks, state["hooks"]):
+            hook.set_state(hook_state)
+        self.vehicle_types.update(state["vehicle_types"])
+        self.destinations.update(state["destinations"])
+        self.telemetry.stage_speed_sum.update(state["stage_speed_sum"])
+        self.telemetry.stage_steps.update(state["stage_steps"])
+        random.setstate(state["random"])
+        self.step = state["step"]
+        print(f"Resumed from checkpoint {state['base']} after step {state['step']}")
+
+    def run(self):
+        """
+        Run the simulation with all registered hooks, then call their finish().
+        """
+        if self.resume is not None:
+            self._resume_state = self._load_checkpoint(self.resume)
+            self.first_step = self._resume_state["step"] + 1
+        if self.edge_state is None and any(hook.uses_edge_state for hook in self.hooks):
+            self.edge_state = EdgeStateCollector()
+        if self.pipelined:
+            unsafe = [type(hook).__name__ for hook in self.hooks if not hook.thread_safe]
+            if unsafe:
+                raise ValueError(f"Hooks that query SUMO cannot run pipelined: {', '.join(unsafe)}")
+            self._pipeline = PipelinedRunner(self.sumo_cmd, self.max_steps, self.telemetry, self.max_lag,
+                                             self.edge_state)
+            self._pipeline.commands = self.commands
+            self._pipeline.add_consumer(self._run_hooks, name="hooks")
+            self._pipeline.run(setup=self._start_hooks, first_step=self.first_step,
+                               sync_steps=self.checkpoints, on_sync=self.save_checkpoint)
+        else:
+            traci.start(self.sumo_cmd)
+            try:
+                self.telemetry.subscribe()
+                self._start_hooks()
+                for step in range(self.first_step, self.max_steps):
+                    start = time.perf_counter()
+                    traci.simulationStep()
+                    self.sumo_time += time.perf_counter() - start
+                    self.telemetry.update()
+                    self._run_hooks(StepSnapshot.from_telemetry(step, self.telemetry, self.edge_state),
+                                    self.commands)
+                    self.commands.flush()
+                    if step in self.checkpoints:
+                        self.save_checkpoint(step)
+            finally:
+                traci.close()
+
+        for hook in self.hooks:
+            hook.finish(self)
+
+    def report(self):
+        """
+        Print where the time per step went.
+        """
+        if self._pipeline is not None:
+            self._pipeline.report()
+            return
+        steps = max(self.step + 1 - self.first_step, 1)
+        print(f"Simulation loop: {steps} steps, {self.commands.sent} commands sent "
+              f"({self.commands.failed} failed)")
+        print(f"  waiting on SUMO:        {self.sumo_time / steps * 1000:8.2f} ms/step")
+        for hook, elapsed in self.hook_time.items():
+            print(f"  {type(hook).__name__ + ':':<24}{elapsed / steps * 1000:8.2f} ms/step")
@@ -0,0 +1,165 @@
+import math
+
+import numpy as np
+
+
+class UniformGrid:
+    """
+    Uniform grid over axis-aligned bounding boxes, answering nearest-item queries.
+
+    Every item is registered in each cell its bounding box touches. A query
+    walks square rings of cells around the query point and stops as soon as
+    the best distance found is no larger than the distance to the next ring.
+    """
+
+    def __init__(self, bbox_min, bbox_max, cell_size, distance):
+        """
+        Args:
+            bbox_min (np.ndarray): (items, 2) lower-left corners of the item bounding boxes.
+            bbox_max (np.ndarray): (items, 2) upper-right corners.
+            cell_size (float): Cell width in network units (metres).
+            distance (callable): distance(items, x, y) -> distances for an array of item indices.
+        """
+        self.cell_size = float(cell_size)
+        self.distance = distance
+        self.origin = bbox_min.min(axis=0) if len(bbox_min) else np.zeros(2)
+        top = bbox_max.max(axis=0) if len(bbox_max) else np.zeros(2)
+        self.shape = np.floor((top - self.origin) / self.cell_size).astype(np.int64) + 1
+
+        low = self._cell_of(bbox_min)
+        high = self._cell_of(bbox_max)
+        width = high[:, 0] - low[:, 0] + 1
+        counts = width * (high[:, 1] - low[:, 1] + 1)
+        items = np.repeat(np.arange(len(bbox_min)), counts)
+        local = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        cx = np.repeat(low[:, 0], counts) + local % np.repeat(width, counts)
+        cy = np.repeat(low[:, 1], counts) + local // np.repeat(width, counts)
+        keys = cx * self.shape[1] + cy
+
+        order = np.argsort(keys, kind="stable")
+        keys, self.items = keys[order], items[order]
+        unique, starts = np.unique(keys, return_index=True)
+        ends = np.append(starts[1:], len(keys))
+        self.cells = {int(key): (int(start), int(end)) for key, start, end in zip(unique, starts, ends)}
+
+    def _cell_of(self, points):
+        return np.floor((np.asarray(points) - self.origin) / self.cell_size).astype(np.int64)
+
+    def _ring_items(self, cx, cy, r):
+        nx_cells, ny_cells = self.shape
+        if r == 0:
+            cells = [(cx, cy)]
+        else:
+            cells = [(x, y) for x in (cx - r, cx + r) for y in range(cy - r, cy + r + 1)]
+            cells += [(x, y) for x in range(cx - r + 1, cx + r) for y in (cy - r, cy + r)]
+        chunks = []
+        for x, y in cells:
+            if 0 <= x < nx_cells and 0 <= y < ny_cells:
+                span = self.cells.get(int(x * ny_cells + y))
+                if span:
+                    chunks.append(self.items[span[0]:span[1]])
+        return np.concatenate(chunks) if chunks else None
+
+    def nearest(self, points):
+        """
+        Nearest item for each query point.
+        Args:
+            points (array-like): (n, 2) coordinates, or a single (x, y) pair.
+        Returns:
+            tuple: (item indices, distances), -1 and inf when the grid is empty.
+        """
+        points = np.atleast_2d(np.asarray(points, dtype=np.float64))
+        result = np.full(len(points), -1, dtype=np.int64)
+        result_distance = np.full(len(points), np.inf)
+        cells = self._cell_of(points)
+        for n, ((x, y), (cx, cy)) in enumerate(zip(points.tolist(), cells.tolist())):
+            max_ring = max(abs(cx), abs(cy), abs(self.shape[0] - cx), abs(self.shape[1] - cy)) + 1
+            best, best_item = math.inf, -1
+            for r in range(max_ring + 1):
+                candidates = self._ring_items(cx, cy, r)
+                if candidates is not None:
+                    distances = self.distance(candidates, x, y)
+                    i = int(np.argmin(distances))
+                    if distances[i] < best:
+                        best, best_item = float(distances[i]), int(candidates[i])
+                if best <= r * self.cell_size:
+                    break
+            result[n] = best_item
+            result_distance[n] = best
+        return result, result_distance
+
+
+class SpatialIndex:
+    """
+    Nearest-junction and nearest-edge lookups over a RoutingGraph, built once.
+    """
+
+    def __init__(self, graph, cell_size=100.0):
+        """
+        Args:
+            graph (RoutingGraph): Graph from routing_graph.load_routing_graph().
+            cell_size (float): Grid cell width in metres.
+        """
+        self.graph = graph
+        coords = graph.node_coords
+        self.node_grid = UniformGrid(coords, coords, cell_size, self._node_distance)
+
+        # One segment per consecutive pair of lane shape points
+        points = graph.lane_shape_points
+        starts = np.arange(len(points) - 1)
+        lane_of_point = np.repeat(np.arange(len(graph.lane_ids)), np.diff(graph.lane_shape_offsets))
+        starts = starts[lane_of_point[starts] == lane_of_point[starts + 1]]
+        self.segment_start = points[starts]
+        self.segment_end = points[starts + 1]
+        self.segment_edge = graph.lane_edge[lane_of_point[starts]]
+        self.edge_grid = UniformGrid(np.minimum(self.segment_start, self.segment_end),
+                                     np.maximum(self.segment_start, self.segment_end),
+                                     cell_size, self._segment_distance)
+
+    def _node_distance(self, items, x, y):
+        coords = self.graph.node_coords[items]
+        return np.hypot(coords[:, 0] - x, coords[:, 1] - y)
+
+    def _segment_distance(self, items, x, y):
+        a = self.segment_start[items]
+        d = self.segment_end[items] - a
+        length2 = (d * d).sum(axis=1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            t = np.where(length2 > 0, ((x - a[:, 0]) * d[:, 0] + (y - a[:, 1]) * d[:, 1]) / length2, 0.0)
+        t = np.clip(t, 0.0, 1.0)
+        return np.hypot(a[:, 0] + t * d[:, 0] - x, a[:, 1] + t * d[:, 1] - y)
+
+    def nearest_nodes(self, points):
+        """
+        Nearest junction for each point.
+        Returns:
+            tuple: (node indices, distances).
+        """
+        return self.node_grid.nearest(points)
+
+    def nearest_edges(self, points):
+        """
+        Nearest edge (by lane geometry) for each point.
+        Returns:
+            tuple: (edge indices, distances).
+        """
+        segments, distances = self.edge_grid.nearest(points)
+        edges = np.where(segments >= 0, self.segment_edge[np.maximum(segments, 0)], -1)
+        return edges, distances
+
+    def nearest_node_id(self, coord):
+        """
+        Returns the ID of the junction closest to an (x, y) coordinate.
+        """
+        nodes, _ = self.nearest_nodes(coord)
+        return str(self.graph.node_ids[nodes[0]]) if nodes[0] >= 0 else None
+
+    def nearest_edge_id(self, coord, max_distance=math.inf):
+        """
+        Returns the ID of the edge closest to an (x, y) coordinate, or None if
+        no edge lies within max_distance.
+        """
+        edges, distances = self.nearest_edges(coord)
+        if edges[0] < 0 or distances[0] > max_distance:
+            return None
+        return str(self.graph.edge_ids[edges[0]])
@@ -0,0 +1,77 @@
+import importlib.util
+import os
+import sys
+
+import sumolib
+
+# Ways to run SUMO, from fastest to slowest
+BACKENDS = ("libsumo", "sumo", "sumo-gui")
+
+# Environment variable selecting the backend of a run, e.g. SUMO_BACKEND=libsumo python reports_v3_heatMaps.py
+BACKEND_VARIABLE = "SUMO_BACKEND"
+
+# Backend of scripts run without SUMO_BACKEND, the GUI they were written for
+DEFAULT_BACKEND = "sumo-gui"
+
+# Options that let sumo-gui run unattended (start right away and close at the end)
+GUI_BATCH_OPTIONS = ["--start", "--quit-on-end"]
+
+
+def selected_backend():
+    """
+    Backend named by SUMO_BACKEND, sumo-gui when it is not set.
+    """
+    backend = os.environ.get(BACKEND_VARIABLE, DEFAULT_BACKEND)
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown {BACKEND_VARIABLE} '{backend}', expected one of {', '.join(BACKENDS)}")
+    return backend
+
+
+def use_backend(backend):
+    """
+    Select the backend of this process; must run before the first `import traci`.
+
+    The driver code always talks to the `traci` module. For libsumo, traci
+    replaces itself with the in-process libsumo bindings (same API, no socket)
+    when LIBSUMO_AS_TRACI is set at import time.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend '{backend}', expected one of {', '.join(BACKENDS)}")
+    os.environ[BACKEND_VARIABLE] = backend
+    if backend == "libsumo":
+        if importlib.util.find_spec("libsumo") is None:
+            raise ImportError("The libsumo backend needs the libsumo package (pip install libsumo)")
+        os.environ["LIBSUMO_AS_TRACI"] = "quiet"
+    else:
+        os.environ.pop("LIBSUMO_AS_TRACI", None)
+    _check_traci(backend)
+
+
+def _check_traci(backend):
+    traci = sys.modules.get("traci")
+    if traci is None:
+        return
+    if (backend == "libsumo") != traci.isLibsumo():
+        raise RuntimeError(f"traci was imported before the {backend} backend was selected; "
+                           f"import sumo_backend first or set {BACKEND_VARIABLE} in the environment")
+
+
+def sumo_command(config, *options, backend=None):
+    """
+    Command for traci.start() running a SUMO configuration with the selected backend.
+    Args:
+        config (str): Path of the .sumocfg file.
+        options (str): Extra SUMO options, e.g. "--tripinfo-output", "tripinfo.xml".
+        backend (str): One of BACKENDS, by default the one selected by SUMO_BACKEND.
+    Returns:
+        list: Binary, -c config and the options. libsumo ignores the binary.
+    """
+    backend = backend or selected_backend()
+    _check_traci(backend)
+    binary = sumolib.checkBinary("sumo" if backend == "libsumo" else backend)
+    return [binary, "-c", config, *options]
+
+
+# Follow SUMO_BACKEND when this module is imported before traci
+if os.environ.get(BACKEND_VARIABLE):
+    use_backend(selected_backend())
@@ -0,0 +1,110 @@
+import threading
+import unittest
+from unittest import mock
+
+import traci
+import traci.constants as tc
+
+import simulation_pipeline
+
+# Seconds a run may take before the test counts it as hung
+RUN_TIMEOUT = 5
+
+
+class FailingSumo:
+    """
+    Stands in for traci: two vehicles, and simulationStep() raises at fail_step.
+    """
+
+    def __init__(self, fail_step, error=traci.FatalTraCIError):
+        self.fail_step = fail_step
+        self.error = error
+        self.steps = 0
+        self.closed = False
+
+    def simulationStep(self):
+        if self.steps == self.fail_step:
+            raise self.error("connection closed by SUMO")
+        self.steps += 1
+
+    def close(self):
+        self.closed = True
+
+    def patches(self):
+        results = {veh_id: {tc.VAR_SPEED: 1.0, tc.VAR_POSITION: (0.0, 0.0), tc.VAR_ROAD_ID: "e",
+                            tc.VAR_DISTANCE: 0.0} for veh_id in ("v0", "v1")}
+        return [
+            mock.patch.object(traci, "start", lambda cmd: None),
+            mock.patch.object(traci, "close", self.close),
+            mock.patch.object(traci, "simulationStep", self.simulationStep),
+            mock.patch.object(traci.simulation, "subscribe", lambda variables: None),
+            mock.patch.object(traci.simulation, "getSubscriptionResults",
+                              lambda: {tc.VAR_DEPARTED_VEHICLES_IDS: (), tc.VAR_ARRIVED_VEHICLES_NUMBER: 0}),
+            mock.patch.object(traci.vehicle, "getIDList", lambda: list(results)),
+            mock.patch.object(traci.vehicle, "subscribe", lambda veh_id, variables: None),
+            mock.patch.object(traci.vehicle, "getAllSubscriptionResults", lambda: results),
+        ]
+
+
+class PipelinedRunnerFailureTest(unittest.TestCase):
+
+    def run_until_failure(self, sumo, max_lag):
+        runner = simulation_pipeline.PipelinedRunner([], 20, max_lag=max_lag)
+        seen = []
+        runner.add_consumer(lambda snapshot, commands: seen.append(snapshot.step), name="record")
+        return self.run_in_thread(sumo, runner), seen
+
+    def run_in_thread(self, sumo, runner):
+        outcome = {}
+
+        def target():
+            try:
+                runner.run()
+            except BaseException as e:
+                outcome["error"] = e
+
+        for patch in sumo.patches():
+            patch.start()
+            self.addCleanup(patch.stop)
+        # In a thread, so a hang fails the test instead of blocking it
+        thread = threading.Thread(target=target, daemon=True)
+        thread.start()
+        thread.join(RUN_TIMEOUT)
+        self.assertFalse(thread.is_alive(), f"run() hung after SUMO failed (max_lag={runner.max_lag})")
+        return outcome.get("error")
+
+    def test_sumo_failure_with_lag_does_not_hang(self):
+        # Snapshots are queued beyond the gate when the step raises
+        for max_lag in (2, 3):
+            with self.subTest(max_lag=max_lag):
+                sumo = FailingSumo(fail_step=5)
+                error, seen = self.run_until_failure(sumo, max_lag)
+                self.assertIsInstance(error, traci.FatalTraCIError)
+                self.assertTrue(sumo.closed)
+                self.assertEqual(seen, list(range(len(seen))))
+
+    def test_interrupt_closes_sumo(self):
+        sumo = FailingSumo(fail_step=5, error=KeyboardInterrupt)
+        error, _ = self.run_until_failure(sumo, max_lag=2)
+        self.assertIsInstance(error, KeyboardInterrupt)
+        self.assertTrue(sumo.closed)
+
+    def test_fatal_error_in_flush_does_not_hang(self):
+        # FatalTraCIError is not a TraCIException, so CommandBatch.flush() lets it through
+        sumo = FailingSumo(fail_step=None)
+        runner = simulation_pipeline.PipelinedRunner([], 20, max_lag=1)
+        runner.add_consumer(lambda snapshot, commands: commands.remove("v0"), name="remove")
+
+        def remove(veh_id):
+            raise traci.FatalTraCIError("connection closed by SUMO")
+
+        patch = mock.patch.object(traci.vehicle, "remove", remove)
+        patch.start()
+        self.addCleanup(patch.stop)
+        error = self.run_in_thread(sumo, runner)
+        self.assertIsInstance(error, traci.FatalTraCIError)
+        self.assertTrue(sumo.closed)
+
+
+if __name__ == "__main__":
+    unittest.main()
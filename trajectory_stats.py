@@ -0,0 +1,123 @@
+import numpy as np
+import pandas as pd
+
+# Speed (m/s) below which a vehicle counts as stopped
+STOP_SPEED = 0.1
+
+# Speed percentiles reported per vehicle
+SPEED_PERCENTILES = (50, 85)
+
+
+def _segment_sums(values, starts):
+    return np.add.reduceat(values, starts) if len(values) else np.zeros(len(starts))
+
+
+def aggregate_sorted(time, x, y, speed, offsets, distance="speed", step_length=None,
+                     stop_speed=STOP_SPEED, percentiles=SPEED_PERCENTILES):
+    """
+    Per-vehicle trip statistics of records grouped by vehicle and in time order within each vehicle.
+
+    Every statistic is a whole-array operation over segment boundaries
+    (np.add.reduceat, np.maximum.reduceat), so the cost does not depend on
+    the number of vehicles the way a per-record Python loop does.
+    Args:
+        time, x, y, speed (np.ndarray): Record columns, vehicle-major.
+        offsets (np.ndarray): Rows of vehicle v are offsets[v]:offsets[v + 1]; every vehicle has a record.
+        distance (str): "speed" integrates speed over the time since the vehicle's previous
+            record (or over step_length), "coords" sums the straight lines between its positions.
+        step_length (float): Seconds per record for distance="speed", by default the actual
+            time between records.
+        stop_speed (float): Records slower than this count towards stop_time.
+        percentiles (tuple): Speed percentiles to compute, e.g. (50, 85).
+    Returns:
+        dict: {statistic: array with one value per vehicle}.
+    """
+    time = np.asarray(time, dtype=np.float64)
+    speed = np.asarray(speed, dtype=np.float64)
+    starts, ends = offsets[:-1], offsets[1:]
+    counts = ends - starts
+    last = ends - 1
+
+    # Time since the same vehicle's previous record, 0 for its first record
+    dt = np.diff(time, prepend=time[:1])
+    dt[starts] = 0.0
+    if distance == "speed":
+        steps = dt if step_length is None else np.where(dt > 0, step_length, 0.0)
+        distances = _segment_sums(speed * steps, starts)
+    elif distance == "coords":
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        hops = np.hypot(np.diff(x, prepend=x[:1]), np.diff(y, prepend=y[:1]))
+        hops[starts] = 0.0
+        distances = _segment_sums(hops, starts)
+    else:
+        raise ValueError(f"Unknown distance method '{distance}', expected 'speed' or 'coords'")
+
+    travel_time = time[last] - time[starts]
+    stats = {
+        "start_time": time[starts],
+        "end_time": time[last],
+        "travel_time": travel_time,
+        "distance_traveled": distances,
+        "average_speed": np.divide(distances, travel_time, out=np.zeros_like(distances), where=travel_time > 0),
+        "mean_speed": _segment_sums(speed, starts) / counts,
+        "max_speed": np.maximum.reduceat(speed, starts),
+        "stop_time": _segment_sums(np.where(speed < stop_speed, dt, 0.0), starts),
+        "start_x": np.asarray(x[starts], dtype=np.float64),
+        "start_y": np.asarray(y[starts], dtype=np.float64),
+        "end_x": np.asarray(x[last], dtype=np.float64),
+        "end_y": np.asarray(y[last], dtype=np.float64),
+        "samples": counts,
+    }
+
+    # Percentiles: sort speeds within each vehicle once, then interpolate at the same ranks as np.percentile
+    vehicle = np.repeat(np.arange(len(counts)), counts)
+    sorted_speed = speed[np.lexsort((speed, vehicle))]
+    for q in percentiles:
+        rank = starts + (counts - 1) * (q / 100.0)
+        low = np.floor(rank).astype(np.int64)
+        high = np.minimum(low + 1, last)
+        fraction = rank - low
+        stats[f"p{q}_speed"] = sorted_speed[low] * (1 - fraction) + sorted_speed[high] * fraction
+    return stats
+
+
+def aggregate_vehicles(time, vehicle, x, y, speed, vehicle_ids=None, **options):
+    """
+    Per-vehicle statistics of records in any order (e.g. FCD records in time order).
+    Args:
+        vehicle (np.ndarray): Vehicle index of every record.
+        vehicle_ids (list): ID per vehicle index for the frame's index, by default the indices.
+        options: As for aggregate_sorted().
+    Returns:
+        pd.DataFrame: One row per vehicle that has records.
+    """
+    vehicle = np.asarray(vehicle)
+    order = np.lexsort((time, vehicle))
+    counts = np.bincount(vehicle)
+    present = np.flatnonzero(counts)
+    offsets = np.concatenate(([0], np.cumsum(counts[present])))
+    stats = aggregate_sorted(np.asarray(time)[order], np.asarray(x)[order], np.asarray(y)[order],
+                             np.asarray(speed)[order], offsets, **options)
+    index = present if vehicle_ids is None else [vehicle_ids[v] for v in present]
+    return pd.DataFrame(stats, index=pd.Index(index, name="id"))
+
+
+def aggregate_store(store, vehicle_prefix=None, **options):
+    """
+    Per-vehicle statistics of a TrajectoryStore, using its vehicle index instead of sorting.
+    Args:
+        store (TrajectoryStore): Memory-mapped trajectories.
+        vehicle_prefix (str): Only keep vehicles whose ID starts with it.
+        options: As for aggregate_sorted().
+    Returns:
+        pd.DataFrame: One row per vehicle, indexed by vehicle ID.
+    """
+    order = np.asarray(store.vehicle_order)
+    stats = aggregate_sorted(store.time[order], store.x[order], store.y[order], store.speed[order],
+                             np.asarray(store.vehicle_offsets), **options)
+    frame = pd.DataFrame(stats, index=pd.Index(store.vehicle_ids, name="id"))
+    frame["type"] = store.vehicle_types()
+    if vehicle_prefix is not None:
+        frame = frame[frame.index.str.startswith(vehicle_prefix)]
+    return frame
@@ -0,0 +1,262 @@
+import json
+import os
+
+import numpy as np
+
+from fcd_reader import iter_timesteps
+
+# Bump when the layout of the store changes
+STORE_VERSION = 1
+
+# Per-record columns and their types; x/y in float32 keep millimetre precision on a city-sized network
+RECORD_COLUMNS = {
+    "time": np.float64,
+    "vehicle": np.int32,  # Index into vehicle_ids
+    "x": np.float32,
+    "y": np.float32,
+    "speed": np.float32,
+    "edge": np.int32,  # Index into edge_ids, -1 when the record has no lane
+}
+
+# Index arrays built once after conversion
+INDEX_COLUMNS = {
+    "times": np.float64,  # Distinct timestep times
+    "time_offsets": np.int64,  # Records of times[k] are rows time_offsets[k]:time_offsets[k + 1]
+    "vehicle_order": np.int64,  # Rows sorted by vehicle, each vehicle's rows in time order
+    "vehicle_offsets": np.int64,  # Rows of vehicle v are vehicle_order[vehicle_offsets[v]:vehicle_offsets[v + 1]]
+    "vehicle_type": np.int32,  # Index into type_ids per vehicle
+}
+
+# Records buffered in memory before they are appended to the column files
+CHUNK_RECORDS = 1_000_000
+
+
+def store_path_for(fcd_file):
+    """
+    Directory of the columnar store kept next to an FCD file.
+    """
+    return f"{fcd_file}.traj"
+
+
+def _source_stamp(fcd_file):
+    # Size and modification time instead of a digest: hashing a multi-gigabyte FCD file on every load
+    # would cost a good part of what the store saves
+    stat = os.stat(fcd_file)
+    return {"source": os.path.abspath(fcd_file), "size": stat.st_size, "mtime": stat.st_mtime}
+
+
+class TrajectoryStore:
+    """
+    FCD trajectories as memory-mapped columns with dictionary-encoded IDs.
+
+    Records keep the FCD's time order, so a time window is one contiguous
+    slice of every column. vehicle_order/vehicle_offsets give each vehicle's
+    rows in time order without sorting the columns themselves. Vehicle, edge
+    and type IDs are stored once in meta.json and referenced by index.
+    """
+
+    def __init__(self, store_dir, meta, columns):
+        self.store_dir = store_dir
+        self.meta = meta
+        self.columns = columns
+        self.vehicle_ids = meta["vehicle_ids"]
+        self.edge_ids = meta["edge_ids"]
+        self.type_ids = meta["type_ids"]
+        self.vehicle_index = {veh_id: i for i, veh_id in enumerate(self.vehicle_ids)}
+
+    def __len__(self):
+        return self.meta["records"]
+
+    def __getattr__(self, name):
+        columns = self.__dict__.get("columns", {})
+        if name in columns:
+            return columns[name]
+        raise AttributeError(name)
+
+    @property
+    def num_vehicles(self):
+        return len(self.vehicle_ids)
+
+    @classmethod
+    def convert(cls, fcd_file, store_dir=None, chunk_records=CHUNK_RECORDS):
+        """
+        Convert an FCD file (plain or gzip) into a store in one streaming pass.
+        Records are appended to the column files in chunks, so memory is bounded
+        by the chunk size and the index arrays.
+        Returns:
+            TrajectoryStore: The new store, memory-mapped.
+        """
+        store_dir = store_dir or store_path_for(fcd_file)
+        os.makedirs(store_dir, exist_ok=True)
+        vehicle_index, edge_index, type_index = {}, {}, {}
+        vehicle_type = []
+        times, time_offsets = [], [0]
+        buffers = {name: [] for name in RECORD_COLUMNS}
+        files = {name: open(os.path.join(store_dir, f"{name}.bin"), "wb") for name in RECORD_COLUMNS}
+        records = 0
+        try:
+            for timestep_time, vehicles in iter_timesteps(fcd_file):
+                for record in vehicles:
+                    veh_id = record["id"]
+                    vehicle = vehicle_index.get(veh_id)
+                    if vehicle is None:
+                        vehicle = vehicle_index[veh_id] = len(vehicle_index)
+                        type_id = record.get("type", "")
+                        vehicle_type.append(type_index.setdefault(type_id, len(type_index)))
+                    lane = record.get("lane")
+                    if lane is None:
+                        edge = -1
+                    else:
+                        edge_id = lane.rsplit("_", 1)[0]
+                        edge = edge_index.get(edge_id)
+                        if edge is None:
+                            edge = edge_index[edge_id] = len(edge_index)
+                    buffers["time"].append(timestep_time)
+                    buffers["vehicle"].append(vehicle)
+                    buffers["x"].append(float(record["x"]))
+                    buffers["y"].append(float(record["y"]))
+                    buffers["speed"].append(float(record["speed"]))
+                    buffers["edge"].append(edge)
+                records += len(vehicles)
+                times.append(timestep_time)
+                time_offsets.append(records)
+                if len(buffers["time"]) >= chunk_records:
+                    cls._flush(buffers, files)
+            cls._flush(buffers, files)
+        finally:
+            for f in files.values():
+                f.close()
+
+        vehicles = np.fromfile(os.path.join(store_dir, "vehicle.bin"), dtype=RECORD_COLUMNS["vehicle"])
+        vehicle_order = np.argsort(vehicles, kind="stable")
+        vehicle_offsets = np.zeros(len(vehicle_index) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(vehicles, minlength=len(vehicle_index)), out=vehicle_offsets[1:])
+        del vehicles
+        index = {"times": times, "time_offsets": time_offsets, "vehicle_order": vehicle_order,
+                 "vehicle_offsets": vehicle_offsets, "vehicle_type": vehicle_type}
+        for name, values in index.items():
+            np.asarray(values, dtype=INDEX_COLUMNS[name]).tofile(os.path.join(store_dir, f"{name}.bin"))
+
+        meta = {
+            "version": STORE_VERSION,
+            **_source_stamp(fcd_file),
+            "records": records,
+            "vehicle_ids": sorted(vehicle_index, key=vehicle_index.get),
+            "edge_ids": sorted(edge_index, key=edge_index.get),
+            "type_ids": sorted(type_index, key=type_index.get),
+        }
+        # Written last: a store without meta.json is incomplete
+        with open(os.path.join(store_dir, "meta.json"), "w") as f:
+            json.dump(meta, f)
+        return cls.open(store_dir)
+
+    @staticmethod
+    def _flush(buffers, files):
+        for name, values in buffers.items():
+            np.asarray(values, dtype=RECORD_COLUMNS[name]).tofile(files[name])
+            values.clear()
+
+    @classmethod
+    def open(cls, store_dir):
+        """
+        Memory-map an existing store; columns are read from disk only when touched.
+        """
+        with open(os.path.join(store_dir, "meta.json")) as f:
+            meta = json.load(f)
+        if meta.get("version") != STORE_VERSION:
+            raise ValueError(f"Unsupported trajectory store version in {store_dir}")
+        columns = {}
+        for name, dtype in {**RECORD_COLUMNS, **INDEX_COLUMNS}.items():
+            path = os.path.join(store_dir, f"{name}.bin")
+            # np.memmap cannot map empty files
+            columns[name] = (np.memmap(path, dtype=dtype, mode="r") if os.path.getsize(path) > 0
+                             else np.zeros(0, dtype=dtype))
+        if len(columns["time"]) != meta["records"]:
+            raise ValueError(f"Truncated trajectory store {store_dir}")
+        return cls(store_dir, meta, columns)
+
+    def vehicle_rows(self, veh_id):
+        """
+        Rows of one vehicle in time order.
+        """
+        v = self.vehicle_index[veh_id]
+        return self.columns["vehicle_order"][self.columns["vehicle_offsets"][v]:self.columns["vehicle_offsets"][v + 1]]
+
+    def trajectory(self, veh_id):
+        """
+        Records of one vehicle in time order.
+        Returns:
+            dict: {column: array} for the RECORD_COLUMNS.
+        """
+        rows = self.vehicle_rows(veh_id)
+        return {name: self.columns[name][rows] for name in RECORD_COLUMNS}
+
+    def time_rows(self, start_time, end_time):
+        """
+        Row slice of the records with start_time <= time < end_time.
+        """
+        times, offsets = self.columns["times"], self.columns["time_offsets"]
+        first, last = np.searchsorted(times, [start_time, end_time])
+        return slice(int(offsets[first]), int(offsets[last]))
+
+    def window(self, start_time, end_time):
+        """
+        Records of a time window as views into the mapped columns (no copy).
+        Returns:
+            dict: {column: array} for the RECORD_COLUMNS.
+        """
+        rows = self.time_rows(start_time, end_time)
+        return {name: self.columns[name][rows] for name in RECORD_COLUMNS}
+
+    def positions(self, start_time, end_time):
+        """
+        (x, y) of every record in a time window, e.g. for a heatmap.
+        """
+        rows = self.time_rows(start_time, end_time)
+        return np.column_stack((self.columns["x"][rows], self.columns["y"][rows]))
+
+    def vehicle_types(self):
+        """
+        Type ID of every vehicle, in vehicle index order.
+        """
+        return [self.type_ids[t] for t in self.columns["vehicle_type"]]
+
+
+def load_trajectory_store(fcd_file, store_dir=None):
+    """
+    Open the store of an FCD file, converting the XML only when no store for
+    the current file exists.
+    Args:
+        fcd_file (str): FCD XML file, optionally gzip-compressed.
+        store_dir (str): Store directory, next to the FCD file by default.
+    Returns:
+        TrajectoryStore: Memory-mapped store.
+    """
+    store_dir = store_dir or store_path_for(fcd_file)
+    if os.path.exists(os.path.join(store_dir, "meta.json")):
+        try:
+            store = TrajectoryStore.open(store_dir)
+            stamp = _source_stamp(fcd_file)
+            if all(store.meta.get(key) == value for key, value in stamp.items() if key != "source"):
+                return store
+            print(f"Trajectory store {store_dir} is older than {fcd_file}, converting again")
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Ignoring unreadable trajectory store {store_dir}: {e}")
+    try:
+        os.remove(os.path.join(store_dir, "meta.json"))
+    except OSError:
+        pass
+    return TrajectoryStore.convert(fcd_file, store_dir)
+
+
+# Main Execution
+if __name__ == "__main__":
+    import sys
+    import time
+
+    fcd_file = sys.argv[1] if len(sys.argv) > 1 else "baseline_trajectory.xml"
+    start = time.perf_counter()
+    store = load_trajectory_store(fcd_file)
+    print(f"Trajectory store for {fcd_file}: {len(store)} records, {store.num_vehicles} vehicles, "
+          f"{len(store.times)} timesteps, {len(store.edge_ids)} edges ({time.perf_counter() - start:.2f} s)")
+    print(f"Store: {store.store_dir}")
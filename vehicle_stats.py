@@ -0,0 +1,184 @@
+import heapq
+
+import numpy as np
+
+# Speed histogram bins of the approximate percentiles: SPEED_BIN wide up to MAX_SPEED (m/s),
+# faster samples fall into the last bin
+SPEED_BIN = 0.5
+MAX_SPEED = 50.0
+
+
+class VehicleStats:
+    """
+    Running per-vehicle statistics over a run, one array row per vehicle.
+
+    Each step adds one speed sample per vehicle, vectorized over the rows:
+    count, mean and variance (Welford), min and max are updated in place
+    and the sample is counted into a fixed speed histogram, from which
+    percentiles are read to within SPEED_BIN. Memory grows with the number
+    of vehicles, not with their time in the network. The vehicle type is
+    stored when a vehicle is first added, the odometer distance and the
+    position are the latest ones.
+    """
+
+    def __init__(self, capacity=1024):
+        """
+        Args:
+            capacity (int): Initial number of rows, doubled when exceeded.
+        """
+        self.ids = []
+        self.row = {}
+        self.vehicle_types = []
+        self._speed_bins = int(np.ceil(MAX_SPEED / SPEED_BIN))
+        self._allocate(capacity)
+
+    def _allocate(self, capacity):
+        old = getattr(self, "count", None)
+        columns = {
+            "count": np.zeros(capacity, dtype=np.int64),
+            "mean": np.zeros(capacity),
+            "_m2": np.zeros(capacity),
+            "min": np.full(capacity, np.inf),
+            "max": np.full(capacity, -np.inf),
+            "distance": np.zeros(capacity),
+            "start": np.zeros((capacity, 2)),
+            "end": np.zeros((capacity, 2)),
+            "histogram": np.zeros((capacity, self._speed_bins), dtype=np.int32),
+        }
+        for name, column in columns.items():
+            if old is not None:
+                column[:len(self.ids)] = getattr(self, name)[:len(self.ids)]
+            setattr(self, name, column)
+        self.capacity = capacity
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, veh_id):
+        return veh_id in self.row
+
+    def rows(self, vehicle_ids, positions, vehicle_type=None):
+        """
+        Rows of the vehicles, adding the ones seen for the first time with their start position and type.
+        """
+        rows = np.empty(len(vehicle_ids), dtype=np.int64)
+        for i, veh_id in enumerate(vehicle_ids):
+            row = self.row.get(veh_id)
+            if row is None:
+                row = len(self.ids)
+                if row == self.capacity:
+                    self._allocate(self.capacity * 2)
+                self.row[veh_id] = row
+                self.ids.append(veh_id)
+                self.vehicle_types.append(None if vehicle_type is None else vehicle_type(veh_id))
+                self.start[row] = positions[i]
+            rows[i] = row
+        return rows
+
+    def add(self, vehicle_ids, speeds, positions, distances, vehicle_type=None):
+        """
+        Add one step: a speed sample, the position and the odometer distance of every vehicle.
+        Args:
+            vehicle_ids (list): IDs, each at most once.
+            speeds (np.ndarray): Speed of every vehicle (m/s).
+            positions (np.ndarray): Shape (n, 2) of (x, y).
+            distances (np.ndarray): Distance driven so far (m).
+            vehicle_type (callable): Function (vehicle ID) -> type ID, only called for new vehicles.
+        """
+        if not len(vehicle_ids):
+            return
+        rows = self.rows(vehicle_ids, positions, vehicle_type)
+        speeds = np.asarray(speeds, dtype=np.float64)
+        self.count[rows] += 1
+        delta = speeds - self.mean[rows]
+        self.mean[rows] += delta / self.count[rows]
+        self._m2[rows] += delta * (speeds - self.mean[rows])
+        self.min[rows] = np.minimum(self.min[rows], speeds)
+        self.max[rows] = np.maximum(self.max[rows], speeds)
+        bins = np.clip((speeds / SPEED_BIN).astype(np.int64), 0, self._speed_bins - 1)
+        self.histogram[rows, bins] += 1
+        self.distance[rows] = distances
+        self.end[rows] = positions
+
+    def variance(self):
+        """
+        Sample variance of every vehicle's speed, 0 for vehicles with a single sample.
+        """
+        n = self.count[:len(self)]
+        return np.where(n > 1, self._m2[:len(self)] / np.maximum(n - 1, 1), 0.0)
+
+    def percentile(self, q):
+        """
+        Approximate q-th speed percentile of every vehicle, interpolated within the histogram bin.
+        Args:
+            q (float): Percentile, 0 to 100.
+        """
+        n = len(self)
+        if n == 0:
+            return np.zeros(0)
+        cumulative = np.cumsum(self.histogram[:n], axis=1)
+        target = q / 100 * self.count[:n]
+        bins = np.minimum((cumulative < target[:, None]).sum(axis=1), self._speed_bins - 1)
+        below = np.where(bins > 0, cumulative[np.arange(n), bins - 1], 0)
+        in_bin = self.histogram[np.arange(n), bins]
+        fraction = np.where(in_bin > 0, (target - below) / np.maximum(in_bin, 1), 0.0)
+        speeds = (bins + fraction) * SPEED_BIN
+        return np.clip(speeds, self.min[:n], self.max[:n])
+
+    def frame(self, rows=None):
+        """
+        Statistics of some or all vehicles as a DataFrame indexed by vehicle ID.
+        Args:
+            rows (list): Rows to include, all by default.
+        """
+        import pandas as pd
+
+        if rows is None:
+            rows = list(range(len(self)))
+        rows = np.asarray(rows, dtype=np.int64)
+        std = np.sqrt(self.variance())
+        return pd.DataFrame({
+            "vehicle_type": [self.vehicle_types[row] for row in rows],
+            "start_x": self.start[rows, 0],
+            "start_y": self.start[rows, 1],
+            "end_x": self.end[rows, 0],
+            "end_y": self.end[rows, 1],
+            "distance": self.distance[rows],
+            "samples": self.count[rows],
+            "average_speed": self.mean[rows],
+            "min_speed": self.min[rows],
+            "max_speed": self.max[rows],
+            "speed_std": std[rows],
+            "median_speed": self.percentile(50)[rows],
+            "p90_speed": self.percentile(90)[rows],
+        }, index=pd.Index([self.ids[row] for row in rows], name="vehicle_id"))
+
+
+def largest_rows(values, k):
+    """
+    Indices of the k largest values, largest first, from a heap instead of a full sort.
+    """
+    return heapq.nlargest(k, range(len(values)), key=values.__getitem__)
+
+
+def smallest_rows(values, k):
+    """
+    Indices of the k smallest values, smallest first, from a heap instead of a full sort.
+    """
+    return heapq.nsmallest(k, range(len(values)), key=values.__getitem__)
+
+
+def middle_rows(values, k):
+    """
+    Indices of the k values around the median in descending order, like
+    iloc[n//2 - k//2 : n//2 - k//2 + k] of the frame sorted descending,
+    partitioned instead of sorted.
+    """
+    n = len(values)
+    first = max(n // 2 - k // 2, 0)
+    last = min(first + k, n)
+    if last <= first:
+        return []
+    ranks = np.arange(first, last)
+    rows = np.argpartition(-values, ranks)[first:last]
+    return rows[np.argsort(-values[rows], kind="stable")].tolist()